@@ -0,0 +1,123 @@
+#include <math.h>
+#include <stdio.h>
+
+#include "array.h"
+#include "debug.h"
+#include "memory.h"
+
+typedef struct {
+    bool isFloat;
+    int count; // -1 for a number, which repeats for every element
+    int step; // 0 for a number so every index reads the same element
+    t_int* ints;
+    t_float* floats;
+    t_int integer;
+    t_float decimal;
+} Operand;
+
+static bool loadOperand(Value value, Operand* operand) {
+    if (IS_ARRAY(value)) {
+        ObjArray* array = AS_ARRAY(value);
+        operand->isFloat = array->isFloat;
+        operand->count = array->count;
+        operand->step = 1;
+        operand->ints = array->isFloat ? NULL : array->as.ints;
+        operand->floats = array->isFloat ? array->as.floats : NULL;
+        return true;
+    }
+    if (!isNumeric(value) && !IS_NULL(value)) return false;
+
+    operand->isFloat = IS_FLOAT(value);
+    operand->count = -1;
+    operand->step = 0;
+    operand->integer = toInt(value);
+    operand->decimal = toFloat(value);
+    operand->ints = &operand->integer;
+    operand->floats = &operand->decimal;
+    return true;
+}
+
+static t_float element(Operand* operand, int i) {
+    return operand->floats != NULL ? operand->floats[i * operand->step] : (t_float)operand->ints[i * operand->step];
+}
+
+static t_float* floatElements(Operand* operand) { // Integer arrays are converted in one pass, the caller frees the copy with freeFloatElements
+    if (operand->floats != NULL) return operand->floats;
+
+    t_float* floats = ALLOCATE(t_float, operand->count);
+    for (int i = 0; i < operand->count; i++)
+        floats[i] = (t_float)operand->ints[i];
+    return floats;
+}
+
+static void freeFloatElements(Operand* operand, t_float* floats) {
+    if (floats != operand->floats) FREE_ARRAY(t_float, floats, operand->count);
+}
+
+static t_int intPow(t_int base, t_int exponent) { // Exponent is never negative, those results are floats
+    t_int result = 1;
+    while (exponent > 0) {
+        if (exponent & 1) result *= base;
+        base *= base;
+        exponent >>= 1;
+    }
+    return result;
+}
+
+// Each loop is one tight pass over packed elements, which the C compiler can vectorize
+static void floatLoop(OpCode op, t_float* out, const t_float* a, int aStep, const t_float* b, int bStep, int count) {
+    switch (op) {
+        case OP_ADD: for (int i = 0; i < count; i++) out[i] = a[i * aStep] + b[i * bStep]; break;
+        case OP_SUB: for (int i = 0; i < count; i++) out[i] = a[i * aStep] - b[i * bStep]; break;
+        case OP_MUL: for (int i = 0; i < count; i++) out[i] = a[i * aStep] * b[i * bStep]; break;
+        case OP_DIV: for (int i = 0; i < count; i++) out[i] = a[i * aStep] / b[i * bStep]; break;
+        case OP_POW: for (int i = 0; i < count; i++) out[i] = pow(a[i * aStep], b[i * bStep]); break;
+        default: break;
+    }
+}
+
+static void intLoop(OpCode op, t_int* out, const t_int* a, int aStep, const t_int* b, int bStep, int count) {
+    switch (op) {
+        case OP_ADD: for (int i = 0; i < count; i++) out[i] = a[i * aStep] + b[i * bStep]; break;
+        case OP_SUB: for (int i = 0; i < count; i++) out[i] = a[i * aStep] - b[i * bStep]; break;
+        case OP_MUL: for (int i = 0; i < count; i++) out[i] = a[i * aStep] * b[i * bStep]; break;
+        case OP_POW: for (int i = 0; i < count; i++) out[i] = intPow(a[i * aStep], b[i * bStep]); break;
+        default: break;
+    }
+}
+
+ArrayResult arrayArithmetic(OpCode op, Value a, Value b, Value* result) {
+    Operand left, right;
+    if (!loadOperand(a, &left) || !loadOperand(b, &right)) return ARRAY_NOT_NUMERIC;
+    if (left.count >= 0 && right.count >= 0 && left.count != right.count) return ARRAY_LENGTH_MISMATCH;
+
+    int count = left.count >= 0 ? left.count : right.count;
+    bool isFloat = left.isFloat || right.isFloat || op == OP_DIV; // Like the interpreter, '/' always makes floats
+
+    for (int i = 0; i < count && (op == OP_DIV || op == OP_POW); i++) { // Checked before anything is made
+        t_float divisor = element(&right, i);
+        if (op == OP_DIV && divisor == 0) return ARRAY_DIVISION_BY_ZERO;
+        if (op == OP_POW && divisor < 0) {
+            if (element(&left, i) == 0) return ARRAY_DIVISION_BY_ZERO;
+            isFloat = true; // A negative exponent makes a fraction
+        }
+    }
+
+    ObjArray* array = makeArray(isFloat, count);
+    if (isFloat) {
+        t_float* leftFloats = floatElements(&left);
+        t_float* rightFloats = floatElements(&right);
+        floatLoop(op, array->as.floats, leftFloats, left.step, rightFloats, right.step, count);
+        freeFloatElements(&left, leftFloats);
+        freeFloatElements(&right, rightFloats);
+    } else {
+        intLoop(op, array->as.ints, left.ints, left.step, right.ints, right.step, count);
+    }
+
+    #ifdef T_ARRAY_DBG
+    printf("array.c :: arrayArithmetic : opcode %d over %d elements into array %p\n", op, count, array);
+    #endif
+
+    *result = TIMID_OBJ(&array->obj);
+    return ARRAY_OK;
+}
@@ -0,0 +1,18 @@
+#ifndef T_ARRAY_H
+#define T_ARRAY_H
+
+#include "block.h"
+#include "common.h"
+#include "object.h"
+
+typedef enum {
+    ARRAY_OK,
+    ARRAY_NOT_NUMERIC, // An operand is neither an array nor a number
+    ARRAY_LENGTH_MISMATCH,
+    ARRAY_DIVISION_BY_ZERO
+} ArrayResult;
+
+// Element-wise OP_ADD, OP_SUB, OP_MUL, OP_DIV or OP_POW where at least one operand is an array, a number operand is used for every element
+ArrayResult arrayArithmetic(OpCode op, Value a, Value b, Value* result);
+
+#endif
@@ -64,4 +64,9 @@ void writeConstant(Block* block, Value constant) {
         blockWrite(block, (uint8_t) ((constantIndex >> 8) & 0xff));
         blockWrite(block, (uint8_t) ((constantIndex >> 16) & 0xff));
     }
-}
\ No newline at end of file
+}
+
+int switchTableSize(uint8_t* table) { // From the kind byte on
+    if (table[0] == SWITCH_INTS) return SWITCH_INTS_HEADER + 2 * (table[5] | (table[6] << 8));
+    return SWITCH_STRINGS_HEADER + SWITCH_SLOT * (table[1] | (table[2] << 8));
+}
@@ -22,9 +22,45 @@ typedef enum {
     OP_DEFINE_GLOBAL, OP_GET_GLOBAL, OP_SET_GLOBAL, OP_GET_LOCAL, OP_SET_LOCAL,
     OP_GET_INPUT,
     OP_SUBSCRIPT,
+    OP_BUILD_DICT,
+    OP_BUILD_ARRAY,
+    OP_FOR_PREP, OP_FOR_RANGE,
+
+    OP_ADD_II, OP_SUB_II, OP_MUL_II, OP_MOD_II, OP_EQ_II, OP_LT_II, OP_GT_II, // Operands known to be ints, see Analysis.infer_types
+    OP_ADD_FF, OP_SUB_FF, OP_MUL_FF, OP_LT_FF, OP_GT_FF, // And floats
+    OP_DEFINE_GLOBAL_SLOT, OP_GET_GLOBAL_SLOT, OP_SET_GLOBAL_SLOT, // Globals by their index in vm.globalSlots instead of by name
+    OP_SWITCH, // Followed by a switch table
     OP_RETURN
 } OpCode;
 
+typedef enum { // Register code, see Registers.py for the operands
+    R_MOVE, R_TRUE, R_FALSE, R_NULL,
+    R_PRINT,
+    R_NEGATE, R_NOT, R_FACT, R_GET_INPUT,
+    R_ADD, R_SUB, R_MUL, R_DIV, R_MOD, R_POW,
+    R_EQ, R_LT, R_GT,
+    R_AND, R_OR,
+    R_SUBSCRIPT,
+    R_ADD_II, R_SUB_II, R_MUL_II, R_MOD_II, R_EQ_II, R_LT_II, R_GT_II,
+    R_ADD_FF, R_SUB_FF, R_MUL_FF, R_LT_FF, R_GT_FF,
+    R_JUMP_IF_FLS, R_JUMP, R_LOOP,
+    R_DEFINE_GLOBAL, R_GET_GLOBAL, R_SET_GLOBAL,
+    R_BUILD_DICT, R_BUILD_ARRAY,
+    R_FOR_PREP, R_FOR_RANGE,
+    R_SWITCH,
+    R_RETURN
+} RegisterOpCode;
+
+typedef enum { // The first byte of the table after OP_SWITCH and R_SWITCH, see Switch.py. Jump distances are two bytes, from the end of the table
+    SWITCH_INTS, // The lowest key in four bytes, the key count in two, the default distance, then a distance per key from the lowest up
+    SWITCH_STRINGS // A power of two capacity in two bytes, the default distance, then per slot a three byte string constant and a distance
+} SwitchKind;
+
+#define SWITCH_INTS_HEADER 9 // Bytes before the distances of the keys
+#define SWITCH_STRINGS_HEADER 5 // And before the slots
+#define SWITCH_SLOT 5
+#define SWITCH_EMPTY 0xffffff // The constant of a slot with no key, lookups stop there
+
 typedef struct {
     int count;
     int capacity;
@@ -37,5 +73,6 @@ void blockWrite(Block* block, uint8_t byte);
 void blockFree(Block* block);
 int addConstant(Block* block, Value constant);
 void writeConstant(Block* block, Value constant);
+int switchTableSize(uint8_t* table);
 
 #endif
\ No newline at end of file
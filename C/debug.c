@@ -53,6 +53,22 @@ static int byteInstruction(const char* name, Block* block, int offset) {
     return offset + 2; 
 }
 
+static int shortInstruction(const char* name, Block* block, int offset) {
+    uint16_t operand = (uint16_t)(block->bytes[offset + 1]);
+    operand |= (block->bytes[offset + 2] << 8);
+    printf("%-16s %4d\n", name, operand);
+    return offset + 3;
+}
+
+static int rangeInstruction(const char* name, int sign, Block* block, int offset) {
+    uint16_t slot = (uint16_t)(block->bytes[offset + 1]);
+    slot |= (block->bytes[offset + 2] << 8);
+    uint16_t jump = (uint16_t)(block->bytes[offset + 3]);
+    jump |= (block->bytes[offset + 4] << 8);
+    printf("%-16s %4d slot %d -> %d\n", name, offset, slot, offset + 5 + sign * jump);
+    return offset + 5;
+}
+
 static int jumpInstruction(const char* name, int sign, Block* block, int offset) {
     uint16_t jump = (uint16_t)(block->bytes[offset + 1]);
     jump |= (block->bytes[offset + 2] << 8);
@@ -61,6 +77,34 @@ static int jumpInstruction(const char* name, int sign, Block* block, int offset)
     return offset + 3;
 }
 
+static int switchTable(Block* block, int table) { // Prints a line per key of the table that starts at table, returns where it ends
+    uint8_t* bytes = &block->bytes[table];
+    int end = table + switchTableSize(bytes);
+    #define TABLE_SHORT(at) (bytes[at] | (bytes[(at) + 1] << 8))
+    if (bytes[0] == SWITCH_INTS) {
+        int32_t low = (int32_t)(bytes[1] | (bytes[2] << 8) | (bytes[3] << 16) | ((uint32_t)bytes[4] << 24));
+        printf("     default -> %d\n", end + TABLE_SHORT(7));
+        for (int i = 0; i < TABLE_SHORT(5); i++) printf("     %lld -> %d\n", (long long)low + i, end + TABLE_SHORT(SWITCH_INTS_HEADER + 2 * i));
+    } else {
+        printf("     default -> %d\n", end + TABLE_SHORT(3));
+        for (int i = 0; i < TABLE_SHORT(1); i++) {
+            int slot = SWITCH_STRINGS_HEADER + SWITCH_SLOT * i;
+            int constant = bytes[slot] | (bytes[slot + 1] << 8) | (bytes[slot + 2] << 16);
+            if (constant == SWITCH_EMPTY) continue;
+            printf("     '");
+            printValue(block->constants.values[constant]);
+            printf("' -> %d\n", end + TABLE_SHORT(slot + 3));
+        }
+    }
+    #undef TABLE_SHORT
+    return end;
+}
+
+static int switchInstruction(Block* block, int offset) {
+    printf("OP_SWITCH\n");
+    return switchTable(block, offset + 1);
+}
+
 int disassembleInstruction(Block* block, int offset) {
     printf("%04d ", offset);
 
@@ -102,9 +146,103 @@ int disassembleInstruction(Block* block, int offset) {
         case OP_SET_LOCAL:      return byteInstruction("OP_SET_LOCAL", block, offset + 1);
         case OP_GET_INPUT:      return simpleInstruction("OP_GET_INPUT", offset);
         case OP_SUBSCRIPT:      return simpleInstruction("OP_SUBSCRIPT", offset);
+        case OP_BUILD_DICT:     return shortInstruction("OP_BUILD_DICT", block, offset);
+        case OP_BUILD_ARRAY:    return shortInstruction("OP_BUILD_ARRAY", block, offset);
+        case OP_FOR_PREP:       return rangeInstruction("OP_FOR_PREP", 1, block, offset);
+        case OP_FOR_RANGE:      return rangeInstruction("OP_FOR_RANGE", -1, block, offset);
+        case OP_ADD_II:         return simpleInstruction("OP_ADD_II", offset);
+        case OP_SUB_II:         return simpleInstruction("OP_SUB_II", offset);
+        case OP_MUL_II:         return simpleInstruction("OP_MUL_II", offset);
+        case OP_MOD_II:         return simpleInstruction("OP_MOD_II", offset);
+        case OP_EQ_II:          return simpleInstruction("OP_EQ_II", offset);
+        case OP_LT_II:          return simpleInstruction("OP_LT_II", offset);
+        case OP_GT_II:          return simpleInstruction("OP_GT_II", offset);
+        case OP_ADD_FF:         return simpleInstruction("OP_ADD_FF", offset);
+        case OP_SUB_FF:         return simpleInstruction("OP_SUB_FF", offset);
+        case OP_MUL_FF:         return simpleInstruction("OP_MUL_FF", offset);
+        case OP_LT_FF:          return simpleInstruction("OP_LT_FF", offset);
+        case OP_GT_FF:          return simpleInstruction("OP_GT_FF", offset);
+        case OP_DEFINE_GLOBAL_SLOT: return byteInstruction("OP_DEFINE_GLOBAL_SLOT", block, offset + 1);
+        case OP_GET_GLOBAL_SLOT: return byteInstruction("OP_GET_GLOBAL_SLOT", block, offset + 1);
+        case OP_SET_GLOBAL_SLOT: return byteInstruction("OP_SET_GLOBAL_SLOT", block, offset + 1);
+        case OP_SWITCH:         return switchInstruction(block, offset);
         case OP_RETURN:         return simpleInstruction("OP_RETURN", offset);
         default:
             printf("Unknown opcode '%d'\n", currentInstruction);
             return offset + 1;
     }
+}
+
+static int registerInstruction(const char* name, const char* operands, Block* block, int offset) {
+    // operands has a letter per operand: A for a register, K for a register or constant, N for a number, + and - for jumps
+    printf("%-16s", name);
+    int at = offset + 1;
+    for (const char* kind = operands; *kind != '\0'; kind++, at += 2) {
+        uint16_t operand = block->bytes[at] | (block->bytes[at + 1] << 8);
+        switch (*kind) {
+            case 'A': printf(" r%d", operand); break;
+            case 'K': printf(operand & 0x8000 ? " k%d" : " r%d", operand & 0x7fff); break;
+            case 'N': printf(" %d", operand); break;
+            case '+': printf(" -> %d", at + 2 + operand); break;
+            case '-': printf(" -> %d", at + 2 - operand); break;
+        }
+    }
+    printf("\n");
+    return at;
+}
+
+int disassembleRegisterInstruction(Block* block, int offset) {
+    printf("%04d ", offset);
+
+    uint8_t currentInstruction = block->bytes[offset];
+    switch (currentInstruction) {
+        case R_MOVE:            return registerInstruction("R_MOVE", "AK", block, offset);
+        case R_TRUE:            return registerInstruction("R_TRUE", "A", block, offset);
+        case R_FALSE:           return registerInstruction("R_FALSE", "A", block, offset);
+        case R_NULL:            return registerInstruction("R_NULL", "A", block, offset);
+        case R_PRINT:           return registerInstruction("R_PRINT", "K", block, offset);
+        case R_NEGATE:          return registerInstruction("R_NEGATE", "AK", block, offset);
+        case R_NOT:             return registerInstruction("R_NOT", "AK", block, offset);
+        case R_FACT:            return registerInstruction("R_FACT", "AK", block, offset);
+        case R_GET_INPUT:       return registerInstruction("R_GET_INPUT", "AK", block, offset);
+        case R_ADD:             return registerInstruction("R_ADD", "AKK", block, offset);
+        case R_SUB:             return registerInstruction("R_SUB", "AKK", block, offset);
+        case R_MUL:             return registerInstruction("R_MUL", "AKK", block, offset);
+        case R_DIV:             return registerInstruction("R_DIV", "AKK", block, offset);
+        case R_MOD:             return registerInstruction("R_MOD", "AKK", block, offset);
+        case R_POW:             return registerInstruction("R_POW", "AKK", block, offset);
+        case R_EQ:              return registerInstruction("R_EQ", "AKK", block, offset);
+        case R_LT:              return registerInstruction("R_LT", "AKK", block, offset);
+        case R_GT:              return registerInstruction("R_GT", "AKK", block, offset);
+        case R_AND:             return registerInstruction("R_AND", "AKK", block, offset);
+        case R_OR:              return registerInstruction("R_OR", "AKK", block, offset);
+        case R_SUBSCRIPT:       return registerInstruction("R_SUBSCRIPT", "AKK", block, offset);
+        case R_ADD_II:          return registerInstruction("R_ADD_II", "AKK", block, offset);
+        case R_SUB_II:          return registerInstruction("R_SUB_II", "AKK", block, offset);
+        case R_MUL_II:          return registerInstruction("R_MUL_II", "AKK", block, offset);
+        case R_MOD_II:          return registerInstruction("R_MOD_II", "AKK", block, offset);
+        case R_EQ_II:           return registerInstruction("R_EQ_II", "AKK", block, offset);
+        case R_LT_II:           return registerInstruction("R_LT_II", "AKK", block, offset);
+        case R_GT_II:           return registerInstruction("R_GT_II", "AKK", block, offset);
+        case R_ADD_FF:          return registerInstruction("R_ADD_FF", "AKK", block, offset);
+        case R_SUB_FF:          return registerInstruction("R_SUB_FF", "AKK", block, offset);
+        case R_MUL_FF:          return registerInstruction("R_MUL_FF", "AKK", block, offset);
+        case R_LT_FF:           return registerInstruction("R_LT_FF", "AKK", block, offset);
+        case R_GT_FF:           return registerInstruction("R_GT_FF", "AKK", block, offset);
+        case R_JUMP_IF_FLS:     return registerInstruction("R_JUMP_IF_FLS", "K+", block, offset);
+        case R_JUMP:            return registerInstruction("R_JUMP", "+", block, offset);
+        case R_LOOP:            return registerInstruction("R_LOOP", "-", block, offset);
+        case R_DEFINE_GLOBAL:   return registerInstruction("R_DEFINE_GLOBAL", "NK", block, offset);
+        case R_GET_GLOBAL:      return registerInstruction("R_GET_GLOBAL", "AN", block, offset);
+        case R_SET_GLOBAL:      return registerInstruction("R_SET_GLOBAL", "NK", block, offset);
+        case R_BUILD_DICT:      return registerInstruction("R_BUILD_DICT", "AN", block, offset);
+        case R_BUILD_ARRAY:     return registerInstruction("R_BUILD_ARRAY", "AN", block, offset);
+        case R_FOR_PREP:        return registerInstruction("R_FOR_PREP", "A+", block, offset);
+        case R_FOR_RANGE:       return registerInstruction("R_FOR_RANGE", "A-", block, offset);
+        case R_SWITCH:          return switchTable(block, registerInstruction("R_SWITCH", "K", block, offset));
+        case R_RETURN:          return registerInstruction("R_RETURN", "", block, offset);
+        default:
+            printf("Unknown opcode '%d'\n", currentInstruction);
+            return offset + 1;
+    }
 }
\ No newline at end of file
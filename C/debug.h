@@ -20,5 +20,6 @@
 void dumpBlock(Block* block, const char* blockName);
 void disassembleBlock(Block* block, const char* blockName);
 int disassembleInstruction(Block* block, int offset);
+int disassembleRegisterInstruction(Block* block, int offset);
 
 #endif
\ No newline at end of file
@@ -0,0 +1,82 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "input.h"
+
+#define INPUT_CHUNK (1 << 16)
+
+typedef struct Chunk {
+    struct Chunk* next;
+    char chars[];
+} Chunk;
+
+static FILE* source = NULL;
+static Chunk* chunks = NULL; // Every chunk read so far, strings made from their lines point into them so they live until inputFree
+static char* cursor = NULL; // Next unread character
+static char* limit = NULL; // One past the last character read
+
+bool inputOpen(const char* path) {
+    source = strcmp(path, "-") == 0 ? stdin : fopen(path, "rb");
+    return source != NULL;
+}
+
+bool inputIsBatch() { return source != NULL; }
+
+static bool readChunk() { // Starts a new chunk with the unfinished line of the last one, false at the end of the input
+    size_t pending = limit - cursor;
+    size_t size = pending < INPUT_CHUNK / 2 ? INPUT_CHUNK : pending * 2; // Lines longer than a chunk double it until they fit
+
+    Chunk* chunk = (Chunk*) malloc(sizeof(Chunk) + size);
+    if (chunk == NULL) return false;
+    if (pending > 0) memcpy(chunk->chars, cursor, pending);
+
+    size_t bytesRead = fread(chunk->chars + pending, sizeof(char), size - pending, source);
+    if (bytesRead == 0) {
+        free(chunk);
+        return false;
+    }
+
+    chunk->next = chunks;
+    chunks = chunk;
+    cursor = chunk->chars;
+    limit = chunk->chars + pending + bytesRead;
+
+    #ifdef T_INPUT_DBG
+    printf("input.c :: readChunk : read %zu bytes after %zu pending\n", bytesRead, pending);
+    #endif
+    return true;
+}
+
+bool inputLine(char** chars, int* length) {
+    size_t scanned = 0; // Characters of the unfinished line already known to have no '\n'
+    for (;;) {
+        char* newline = cursor == NULL ? NULL : memchr(cursor + scanned, '\n', limit - cursor - scanned);
+        if (newline != NULL) {
+            *chars = cursor;
+            *length = newline - cursor;
+            cursor = newline + 1;
+            return true;
+        }
+        scanned = limit - cursor;
+        if (!readChunk()) break;
+    }
+
+    if (cursor == limit) return false;
+
+    *chars = cursor; // The last line has no '\n'
+    *length = limit - cursor;
+    cursor = limit;
+    return true;
+}
+
+void inputFree() {
+    while (chunks != NULL) {
+        Chunk* next = chunks->next;
+        free(chunks);
+        chunks = next;
+    }
+    if (source != NULL && source != stdin) fclose(source);
+    source = NULL;
+    cursor = limit = NULL;
+}
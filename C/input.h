@@ -0,0 +1,12 @@
+#ifndef T_INPUT_H
+#define T_INPUT_H
+
+#include "common.h"
+
+// Batch input, turned on with --input=<path> ("-" for stdin): in reads no prompt and gets its lines from large reads instead of one read per line
+bool inputOpen(const char* path);
+bool inputIsBatch();
+bool inputLine(char** chars, int* length); // The next line without its '\n', false once the input has run out
+void inputFree();
+
+#endif
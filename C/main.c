@@ -1,12 +1,29 @@
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 
 #include "common.h"
+#include "input.h"
 
 #include "vm.h"
 
 bool hasError = false;
 
+static char* outputBuffer = NULL; // Lives until exit, stdio still writes through it while flushing at exit
+
+static bool setOutputBuffer(const char* policy) { // --output-buffer=SIZE|line|none, without it stdio picks, which is per line only on a terminal
+    if (strcmp(policy, "none") == 0) return setvbuf(stdout, NULL, _IONBF, 0) == 0;
+    if (strcmp(policy, "line") == 0) return setvbuf(stdout, NULL, _IOLBF, BUFSIZ) == 0;
+
+    char* end;
+    long size = strtol(policy, &end, 10);
+    if (*policy == '\0' || *end != '\0' || size <= 0) return false;
+
+    outputBuffer = (char*) malloc(size); // glibc ignores the size unless it is given the buffer too
+    if (outputBuffer == NULL) return false;
+    return setvbuf(stdout, outputBuffer, _IOFBF, size) == 0;
+}
+
 FILE* openFile(const char* path) {
     FILE* file = fopen(path, "rb");
 
@@ -57,6 +74,7 @@ static uint8_t* runFile(const char* path) {
     InterpretResult result = interpret(bytecode, fileSize);
     if (result == INTERPRET_RUNTIME_ERROR)
         hasError = true;
+    fflush(stdout); // Whatever is still buffered, also after an error
 
     return bytecode;
 }
@@ -64,13 +82,31 @@ static uint8_t* runFile(const char* path) {
 int main(int argc, const char* argv[]) {
     vmInit();
 
-    if (argc < 2)
+    const char* path = NULL;
+    for (int i = 1; i < argc; i++) {
+        if (strncmp(argv[i], "--output-buffer=", 16) == 0) {
+            if (!setOutputBuffer(argv[i] + 16)) {
+                fprintf(stderr, "Usage: TimidRuntime <.timb file> [--output-buffer=<size> | line | none] [--input=<path> | -]\n");
+                goto FREE;
+            }
+        } else if (strncmp(argv[i], "--input=", 8) == 0) {
+            if (!inputOpen(argv[i] + 8)) {
+                fprintf(stderr, "File Not Found Error : Input file '%s' could not be found\n", argv[i] + 8);
+                goto FREE;
+            }
+        } else if (path == NULL) {
+            path = argv[i];
+        }
+    }
+
+    if (path == NULL)
         //exit(64);
         goto FREE;
         
-    runFile(argv[1]);
+    runFile(path);
 
     FREE:
     vmFree();
+    inputFree();
     return 0;
 }
\ No newline at end of file
@@ -40,6 +40,22 @@ static void freeObject(Obj* object) {
             FREE(ObjString, object);
             break;
         }
+        case OBJ_DICT: {
+            ObjDict* dict = (ObjDict*)object;
+            tableFree(&dict->table);
+            vaFree(&dict->keys);
+            FREE(ObjDict, object);
+            break;
+        }
+        case OBJ_ARRAY: {
+            ObjArray* array = (ObjArray*)object;
+            if (array->isFloat)
+                FREE_ARRAY(t_float, array->as.floats, array->count);
+            else
+                FREE_ARRAY(t_int, array->as.ints, array->count);
+            FREE(ObjArray, object);
+            break;
+        }
     }
 } 
 
@@ -89,11 +89,104 @@ ObjString* takeString(char* chars, int length) { // DONOTUSE
     return allocateString(chars, length, hash);
 }
 
+ObjDict* makeDict() {
+    ObjDict* dict = ALLOCATE_OBJ(ObjDict, OBJ_DICT);
+    tableInit(&dict->table);
+    vaInit(&dict->keys);
+    #ifdef T_OBJ_DBG
+    printf("object.c :: makeDict : make dictionary %p\n", dict);
+    #endif
+    return dict;
+}
+
+bool dictKey(Value value, Value* key) {
+    switch (value.type) {
+        case V_INT:
+            *key = value;
+            return true;
+        case V_BOOL:
+        case V_NULL:
+            *key = NUM_2_INT(value);
+            return true;
+        case V_FLOAT: {
+            t_float number = AS_FLOAT(value);
+            bool inRange = number > -9.2e18 && number < 9.2e18; // Converting anything else to an integer is undefined
+            if (inRange && number == (t_float)(t_int)number) // Whole floats share a key with the integer they equal
+                *key = TIMID_INT((t_int)number);
+            else
+                *key = value;
+            return true;
+        }
+        case V_OBJ:
+            *key = value;
+            return IS_STRING(value);
+        default:
+            return false;
+    }
+}
+
+bool dictSet(ObjDict* dict, Value key, Value value) {
+    bool isNewKey = tableSetValue(&dict->table, key, value);
+    if (isNewKey) vaWrite(&dict->keys, key);
+    return isNewKey;
+}
+
+bool dictGet(ObjDict* dict, Value key, Value* value) { return tableGetValue(&dict->table, key, value); }
+
+ObjArray* makeArray(bool isFloat, int count) {
+    ObjArray* array = ALLOCATE_OBJ(ObjArray, OBJ_ARRAY);
+    array->isFloat = isFloat;
+    array->count = count;
+    if (isFloat)
+        array->as.floats = ALLOCATE(t_float, count);
+    else
+        array->as.ints = ALLOCATE(t_int, count);
+    #ifdef T_OBJ_DBG
+    printf("object.c :: makeArray : make %s array %p of %d elements\n", isFloat ? "float" : "integer", array, count);
+    #endif
+    return array;
+}
+
+bool arrayGet(ObjArray* array, t_int index, Value* value) {
+    if (index < 0) index += array->count;
+    if (index < 0 || index >= array->count) return false;
+
+    *value = array->isFloat ? TIMID_FLOAT(array->as.floats[index]) : TIMID_INT(array->as.ints[index]);
+    return true;
+}
+
 void printObject(Value value) {
     switch (OBJ_TYPE(value)) {
         case OBJ_STRING:
             printf("%.*s", AS_STRING(value)->length, AS_CSTRING(value));
             break;
+        case OBJ_DICT: {
+            ObjDict* dict = AS_DICT(value);
+            printf("(");
+            for (int i = 0; i < dict->keys.count; i++) {
+                Value item;
+                dictGet(dict, dict->keys.values[i], &item);
+                if (i > 0) printf(", ");
+                printValue(dict->keys.values[i]);
+                printf(": ");
+                printValue(item);
+            }
+            printf(")");
+            break;
+        }
+        case OBJ_ARRAY: {
+            ObjArray* array = AS_ARRAY(value);
+            printf("[");
+            for (int i = 0; i < array->count; i++) {
+                if (i > 0) printf(", ");
+                if (array->isFloat)
+                    printf("%g", array->as.floats[i]);
+                else
+                    printf("%lld", array->as.ints[i]);
+            }
+            printf("]");
+            break;
+        }
         default:
             printf("NaN");
             break;
@@ -106,20 +199,25 @@ bool objTruth(Value value) {
             ObjString* string = AS_STRING(value);
             return string->length > 0; // See if the string contains more than the NULL terminator character
         }
+        case OBJ_DICT:
+            return AS_DICT(value)->table.count > 0;
+        case OBJ_ARRAY:
+            return AS_ARRAY(value)->count > 0;
         default:
             return false;
     }
 }
 
 bool objEquals(Value a, Value b) {
+    if (OBJ_TYPE(a) != OBJ_TYPE(b)) return false;
     switch (AS_OBJ(a)->type) {
         case OBJ_STRING: {
             ObjString* aStr = AS_STRING(a);
             ObjString* bStr = AS_STRING(b);
             bool stringsEqualLength = aStr->length == bStr->length;
             bool hashesEqual = aStr->hash == bStr->hash;
-            bool bytesEqual = memcmp(aStr->chars, bStr->chars, aStr->length) == 0;
-            if (stringsEqualLength && hashesEqual && bytesEqual) {
+            // Only compared once the lengths match, the empty string has no characters to read
+            if (stringsEqualLength && hashesEqual && memcmp(aStr->chars, bStr->chars, aStr->length) == 0) {
                 // Strings are equal
                 return true;
             }
@@ -2,11 +2,14 @@
 #define T_OBJ_H
 
 #include "common.h"
+#include "table.h"
 #include "value.h"
 
 #define OBJ_TYPE(object) (AS_OBJ(object)->type)
 
 #define IS_STRING(value) isObjType(value, OBJ_STRING)
+#define IS_DICT(value) isObjType(value, OBJ_DICT)
+#define IS_ARRAY(value) isObjType(value, OBJ_ARRAY)
 
 #define TIMID_STR_2_VAL(string) (TIMID_OBJ(&string->obj))
 
@@ -15,12 +18,16 @@
 
 #define AS_STRING(value) ((ObjString*)AS_OBJ(value))
 #define AS_CSTRING(value) (((ObjString*)AS_OBJ(value))->chars)
+#define AS_DICT(value) ((ObjDict*)AS_OBJ(value))
+#define AS_ARRAY(value) ((ObjArray*)AS_OBJ(value))
 
 
 #define TIMID_EMPTY_STR (TIMID_STRING("", 0))
 
 typedef enum {
-    OBJ_STRING
+    OBJ_STRING,
+    OBJ_DICT,
+    OBJ_ARRAY
 } ObjType;
 
 struct Obj {
@@ -36,9 +43,31 @@ struct ObjString {
     const char* chars;
 };
 
+typedef struct {
+    Obj obj;
+    Table table;
+    ValueArray keys; // Keys in insertion order, for printing
+} ObjDict;
+
+typedef struct {
+    Obj obj;
+    bool isFloat; // Elements are packed t_floats instead of t_ints
+    int count;
+    union {
+        t_int* ints;
+        t_float* floats;
+    } as;
+} ObjArray;
+
 ObjString* makeString(bool ownsChars, char* chars, int length); // Like copyString and takeString but with extra guarding on freeing and ownership
 ObjString* copyString(const char* chars, int length); // DONOTUSE Return a new string, so ownership of the original string is not transferred
 ObjString* takeString(char* chars, int length); //DONUTUSE Transfer ownership of original string
+ObjDict* makeDict();
+bool dictKey(Value value, Value* key); // Normalizes a value into a key so values IsEqual calls equal share one, false if it cannot be a key
+bool dictSet(ObjDict* dict, Value key, Value value); // Keys must already be normalized
+bool dictGet(ObjDict* dict, Value key, Value* value);
+ObjArray* makeArray(bool isFloat, int count); // The elements are left for the caller to fill in
+bool arrayGet(ObjArray* array, t_int index, Value* value); // Negative indices count from the end, false if out of bounds
 static inline bool isObjType(Value value, ObjType type) { return IS_OBJ(value) && AS_OBJ(value)->type == type; }
 void printObject(Value value);
 
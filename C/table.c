@@ -8,7 +8,34 @@
 
 #define TABLE_MAX_LOAD 0.75
 
-// TODO: add support for any value to be used as hashmap key
+static uint32_t hashValue(Value key) {
+    switch (key.type) {
+        case V_OBJ: return AS_STRING(key)->hash; // Strings are the only object keys, and they cache their hash
+        case V_INT: {
+            uint64_t bits = (uint64_t)AS_INT(key);
+            return (uint32_t)(bits ^ (bits >> 32)) * 2654435761u;
+        }
+        case V_FLOAT: {
+            union {
+                t_float f;
+                uint64_t bits;
+            } u;
+            u.f = AS_FLOAT(key);
+            return (uint32_t)(u.bits ^ (u.bits >> 32)) * 2654435761u;
+        }
+        default: return 0;
+    }
+}
+
+static bool keysEqual(Value a, Value b) {
+    if (a.type != b.type) return false;
+    switch (a.type) {
+        case V_OBJ: return AS_OBJ(a) == AS_OBJ(b); // Strings are interned, so the same string is the same object
+        case V_INT: return AS_INT(a) == AS_INT(b);
+        case V_FLOAT: return AS_FLOAT(a) == AS_FLOAT(b);
+        default: return false;
+    }
+}
 
 static void tableDbg(const char* funcName, const char* format, ...) {
     #ifdef T_TABLE_DBG
@@ -21,19 +48,19 @@ static void tableDbg(const char* funcName, const char* format, ...) {
     #endif
 }
 
-static Entry* findEntry(Entry* entries, int capacity, ObjString* key) {
-    uint32_t index = key->hash % capacity; // Start at the bucket where the entry should go, namely hash modded by capacity
+static Entry* findEntry(Entry* entries, int capacity, Value key) {
+    uint32_t index = hashValue(key) % capacity; // Start at the bucket where the entry should go, namely hash modded by capacity
 
     Entry* tombstone = NULL;
     
     for (;;) {
         Entry* entry = &entries[index]; // Get the first ideal bucket entry
-        if (entry->key == NULL) {
+        if (IS_NULL(entry->key)) {
             if (IS_NULL(entry->value)) // If the bucket is empty
                 return tombstone != NULL ? tombstone : entry; // Return whichever bucket can be used
             else if (tombstone == NULL)
                 tombstone = entry;
-        } else if (entry->key == key) // If we found the entry, return the entry
+        } else if (keysEqual(entry->key, key)) // If we found the entry, return the entry
             return entry;
 
         index = (index + 1) % capacity; // Go to the next entry by linear probing
@@ -43,14 +70,14 @@ static Entry* findEntry(Entry* entries, int capacity, ObjString* key) {
 static void adjustCapacity(Table* table, int capacity) {
     Entry* entries = ALLOCATE(Entry, capacity);
     for (int i = 0; i < capacity; i++) {
-        entries[i].key = NULL;
+        entries[i].key = TIMID_NULL;
         entries[i].value = TIMID_NULL;
     }
 
     table->count = 0; // Reset the count and do not include tombstones in the count
     for (int i = 0; i < table->capacity; i++) {
         Entry* entry = &table->entries[i];
-        if (entry->key == NULL) continue;
+        if (IS_NULL(entry->key)) continue;
 
         Entry* destination = findEntry(entries, capacity, entry->key);
         destination->key = entry->key;
@@ -70,13 +97,17 @@ void tableInit(Table* table) {
     tableDbg("tableInit", "initialize table %p\n", table);
 }
 
-bool tableGet(Table* table, ObjString* key, Value* value) { // Accepts the pointer to the value to retrieve to
+bool tableGet(Table* table, ObjString* key, Value* value) { return tableGetValue(table, TIMID_STR_2_VAL(key), value); }
+bool tableSet(Table* table, ObjString* key, Value value) { return tableSetValue(table, TIMID_STR_2_VAL(key), value); }
+bool tableDelete(Table* table, ObjString* key) { return tableDeleteValue(table, TIMID_STR_2_VAL(key)); }
+
+bool tableGetValue(Table* table, Value key, Value* value) { // Accepts the pointer to the value to retrieve to
     // If table is empty we cannot return anything
     if (table->count == 0) return false;
 
     Entry* entry = findEntry(table->entries, table->capacity, key);
     // If the bucket is empty we cannot return anything
-    if (entry->key == NULL) return false;
+    if (IS_NULL(entry->key)) return false;
 
     // Otherwise get what is in the bucket
     *value = entry->value;
@@ -84,7 +115,7 @@ bool tableGet(Table* table, ObjString* key, Value* value) { // Accepts the point
 
 }
 
-bool tableSet(Table* table, ObjString* key, Value value) {
+bool tableSetValue(Table* table, Value key, Value value) {
     if (table->count + 1 > table->capacity * TABLE_MAX_LOAD) {
         int capacity = GROW_CAPACITY(table->capacity);
         adjustCapacity(table, capacity);
@@ -94,7 +125,7 @@ bool tableSet(Table* table, ObjString* key, Value value) {
     }
     
     Entry* entry = findEntry(table->entries, table->capacity, key);
-    bool isNewKey = entry->key == NULL;
+    bool isNewKey = IS_NULL(entry->key);
     if (isNewKey && IS_NULL(entry->value)) table->count++; // If the entry is not going into a tombstone
 
     entry->key = key;
@@ -102,7 +133,7 @@ bool tableSet(Table* table, ObjString* key, Value value) {
 
     #ifdef T_TABLE_DBG
     printf("table.c :: tableSet : set key '");
-    printObject(TIMID_OBJ(&key->obj));
+    printValue(key);
     printf("' to value ");
     printValue(value);
     printf(", on table %p. Table buckets in use is now %d\n", table, table->count);
@@ -111,18 +142,18 @@ bool tableSet(Table* table, ObjString* key, Value value) {
     return isNewKey;
 }
 
-bool tableDelete(Table* table, ObjString* key) {
+bool tableDeleteValue(Table* table, Value key) {
     if (table->count == 0) return false;
 
     Entry* entry = findEntry(table->entries, table->capacity, key);
-    if (entry->key == NULL) return false;
+    if (IS_NULL(entry->key)) return false;
 
     // Convert the entry into a tombstone
-    entry->key = NULL;
+    entry->key = TIMID_NULL;
     entry->value = TIMID_BOOL(true);
     #ifdef T_TABLE_DBG
     printf("table.c :: tableDelete : delete key '");
-    printValue(TIMID_OBJ(&key->obj));
+    printValue(key);
     printf("' from table %p\n", table);
     #endif
     return true;
@@ -131,8 +162,8 @@ bool tableDelete(Table* table, ObjString* key) {
 void tableCopy(Table* source, Table* destination) {
     for (int i = 0; i < source->capacity; i++) {
         Entry* entry = &source->entries[i];
-        if (entry->key != NULL) {
-            tableSet(destination, entry->key, entry->value);
+        if (!IS_NULL(entry->key)) {
+            tableSetValue(destination, entry->key, entry->value);
         }
     }
 }
@@ -151,16 +182,17 @@ ObjString* tableFindString(Table* table, const char* chars, int length, uint32_t
     uint32_t index = hash % table->capacity;
     for (;;) {
         Entry* entry = &table->entries[index];
-        if (entry->key == NULL) {
+        if (IS_NULL(entry->key)) {
             // Stop if a tombstone is found
             if (IS_NULL(entry->value)) return NULL;
-        } else { 
-            bool stringsEqualLength = entry->key->length == length;
-            bool hashesEqual = entry->key->hash == hash;
-            //bool bytesEqual = memcmp(entry->key->chars, chars, length) == 0;
-            if (stringsEqualLength && hashesEqual && memcmp(entry->key->chars, chars, length) == 0) {
+        } else if (IS_STRING(entry->key)) {
+            ObjString* key = AS_STRING(entry->key);
+            bool stringsEqualLength = key->length == length;
+            bool hashesEqual = key->hash == hash;
+            //bool bytesEqual = memcmp(key->chars, chars, length) == 0;
+            if (stringsEqualLength && hashesEqual && memcmp(key->chars, chars, length) == 0) {
                 // String is found
-                return entry->key;
+                return key;
             }
         }
 
@@ -5,7 +5,7 @@
 #include "value.h"
 
 typedef struct {
-    ObjString* key;
+    Value key; // Null in empty buckets and tombstones, a tombstone's value is true
     Value value;
 } Entry;
 
@@ -23,4 +23,9 @@ void tableCopy(Table* source, Table* destination);
 void tableFree(Table* table);
 ObjString* tableFindString(Table* table, const char* chars, int length, uint32_t hash);
 
+// Any string, integer or float can be a key, callers normalize keys that should compare equal (see dictKey)
+bool tableGetValue(Table* table, Value key, Value* value);
+bool tableSetValue(Table* table, Value key, Value value);
+bool tableDeleteValue(Table* table, Value key);
+
 #endif
\ No newline at end of file
@@ -62,6 +62,8 @@ t_int toInt(Value value) {
             return (t_int)AS_FLOAT(value);
         case V_BOOL:
             return (t_int)AS_BOOL(value);
+        default: // Null is zero, like in the interpreter
+            return 0;
     }
 }
 
@@ -73,6 +75,8 @@ t_float toFloat(Value value) {
             return AS_FLOAT(value);
         case V_BOOL:
             return (t_float)AS_BOOL(value);
+        default:
+            return 0.0;
     }
 }
 
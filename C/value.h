@@ -17,6 +17,7 @@ typedef double t_float;
 #define IS_BOOL(value) ((value).type == V_BOOL)
 #define IS_NULL(value) ((value).type == V_NULL)
 #define IS_OBJ(value) ((value).type == V_OBJ)
+#define IS_UNDEFINED(value) ((value).type == V_UNDEFINED)
 
 #define IS_NUMERIC(value) (isNumeric(value))
 
@@ -25,6 +26,7 @@ typedef double t_float;
 #define TIMID_BOOL(value) ((Value){V_BOOL, {.boolean = value}})
 #define TIMID_NULL ((Value){V_NULL, {.boolean = false}})
 #define TIMID_OBJ(object) ((Value){V_OBJ, {.obj = object}}) // Accepts a pointer to an object
+#define TIMID_UNDEFINED ((Value){V_UNDEFINED, {.boolean = false}})
 
 #define AS_INT(value) ((value).as.integer)
 #define AS_FLOAT(value) ((value).as.decimal)
@@ -40,7 +42,8 @@ typedef enum {
     V_FLOAT,
     V_BOOL,
     V_NULL,
-    V_OBJ
+    V_OBJ,
+    V_UNDEFINED // Only in global slots that were not defined yet, never on the stack
 } ValueType;
 
 typedef struct {
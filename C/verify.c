@@ -0,0 +1,341 @@
+#include <stdio.h>
+#include <string.h>
+
+#include "memory.h"
+#include "object.h"
+#include "verify.h"
+
+// Instructions are claimed as control flow reaches them, the first path to reach one sets the stack depth before it and every
+// other path has to agree. Each instruction is looked at once, code that nothing reaches is never looked at and never runs either
+
+#define UNSEEN 0 // Nothing reached this byte yet
+#define INSIDE 1 // An operand
+#define DEPTH(depth) ((depth) + 2) // The first byte of an instruction, with the stack depth before it
+#define MAX_STACK_SIZE (UINT16_MAX - 2) // So every DEPTH fits
+
+typedef struct {
+    Block* block;
+    int globalCount;
+    int stackSize;
+    bool registerCode;
+    uint16_t* depths; // For every byte of code: UNSEEN, INSIDE or a DEPTH
+    int* pending; // Instructions that were claimed and are not checked yet
+    int pendingCount;
+} Verifier;
+
+static bool invalid(int offset, const char* message) {
+    fprintf(stderr, "Invalid bytecode at %04d: %s\n", offset, message);
+    return false;
+}
+
+static uint16_t readShort(Block* block, int at) { return block->bytes[at] | (block->bytes[at + 1] << 8); }
+
+static int namedIndex(uint8_t* bytes) { // The constant or slot after an OP_CONSTANT or OP_CONSTANT_LONG tag
+    return bytes[1] == OP_CONSTANT ? bytes[2] : bytes[2] | (bytes[3] << 8) | (bytes[4] << 16);
+}
+
+static int switchSize(Block* block, int table) { // The size of the switch table that starts at table, 0 for an unknown kind
+    if (table >= block->count) return 1; // Too short either way
+    int header = block->bytes[table] == SWITCH_INTS ? SWITCH_INTS_HEADER : block->bytes[table] == SWITCH_STRINGS ? SWITCH_STRINGS_HEADER : 0;
+    if (header == 0 || table + header > block->count) return header;
+    return switchTableSize(&block->bytes[table]);
+}
+
+static int stackInstructionSize(Block* block, int offset) { // 0 for an unknown instruction
+    uint8_t* bytes = &block->bytes[offset];
+    switch (bytes[0]) {
+        case OP_CONSTANT:       return 2;
+        case OP_CONSTANT_LONG:  return 4;
+        case OP_JUMP_IF_FLS:
+        case OP_JUMP:
+        case OP_LOOP:
+        case OP_BUILD_DICT:
+        case OP_BUILD_ARRAY:    return 3;
+        case OP_FOR_PREP:
+        case OP_FOR_RANGE:      return 5;
+        case OP_DEFINE_GLOBAL:
+        case OP_GET_GLOBAL:
+        case OP_SET_GLOBAL:
+        case OP_GET_LOCAL:
+        case OP_SET_LOCAL:
+        case OP_DEFINE_GLOBAL_SLOT:
+        case OP_GET_GLOBAL_SLOT:
+        case OP_SET_GLOBAL_SLOT:
+            if (offset + 1 >= block->count) return 2; // Too short either way
+            if (bytes[1] == OP_CONSTANT) return 3;
+            return bytes[1] == OP_CONSTANT_LONG ? 5 : 0;
+        case OP_SWITCH: {
+            int table = switchSize(block, offset + 1);
+            return table == 0 ? 0 : 1 + table;
+        }
+        default:
+            return bytes[0] <= OP_RETURN ? 1 : 0;
+    }
+}
+
+static const char* registerOperands(uint8_t op) { // A letter per two byte operand like in debug.c, G for a global slot. NULL for an unknown instruction
+    switch (op) {
+        case R_TRUE:
+        case R_FALSE:
+        case R_NULL:            return "A";
+        case R_PRINT:           return "K";
+        case R_MOVE:
+        case R_NEGATE:
+        case R_NOT:
+        case R_FACT:
+        case R_GET_INPUT:       return "AK";
+        case R_JUMP_IF_FLS:     return "K+";
+        case R_JUMP:            return "+";
+        case R_LOOP:            return "-";
+        case R_DEFINE_GLOBAL:
+        case R_SET_GLOBAL:      return "GK";
+        case R_GET_GLOBAL:      return "AG";
+        case R_BUILD_DICT:
+        case R_BUILD_ARRAY:     return "AN";
+        case R_FOR_PREP:        return "A+";
+        case R_FOR_RANGE:       return "A-";
+        case R_SWITCH:          return "K"; // And a switch table
+        case R_RETURN:          return "";
+        default:
+            return op >= R_ADD && op <= R_GT_FF ? "AKK" : NULL; // The binary instructions, generic and typed
+    }
+}
+
+static int registerInstructionSize(Block* block, int offset) {
+    const char* operands = registerOperands(block->bytes[offset]);
+    int size = 1;
+    if (operands == NULL) return 0;
+    for (; *operands != '\0'; operands++) size += 2;
+    if (block->bytes[offset] == R_SWITCH) {
+        int table = switchSize(block, offset + size);
+        return table == 0 ? 0 : size + table;
+    }
+    return size;
+}
+
+static bool claim(Verifier* verifier, int from, int offset, int depth) { // from is the instruction that leads here
+    Block* block = verifier->block;
+    if (offset < 0 || offset >= block->count) return invalid(from, "goes past the code");
+
+    uint16_t* depths = verifier->depths;
+    if (depths[offset] == INSIDE) return invalid(from, "jumps into the middle of an instruction");
+    if (depths[offset] != UNSEEN) {
+        if (depths[offset] != DEPTH(depth)) return invalid(offset, "paths meet with different stack depths");
+        return true;
+    }
+
+    int size = verifier->registerCode ? registerInstructionSize(block, offset) : stackInstructionSize(block, offset);
+    if (size == 0) return invalid(offset, "unknown instruction");
+    if (offset + size > block->count) return invalid(offset, "the instruction is cut short");
+    for (int i = 1; i < size; i++) {
+        if (depths[offset + i] != UNSEEN) return invalid(offset, "overlaps another instruction");
+        depths[offset + i] = INSIDE;
+    }
+
+    depths[offset] = DEPTH(depth);
+    verifier->pending[verifier->pendingCount++] = offset;
+    return true;
+}
+
+static bool checkSwitch(Verifier* verifier, int offset, int table, int depth) { // Every place the switch table at table can send the value to
+    Block* block = verifier->block;
+    uint8_t* bytes = &block->bytes[table];
+    int end = table + switchTableSize(bytes);
+    if (bytes[0] == SWITCH_INTS) {
+        for (int at = end - 2; at >= table + 7; at -= 2) // The default last, so the walk goes on with the first key
+            if (!claim(verifier, offset, end + readShort(block, at), depth)) return false;
+        return true;
+    }
+
+    int capacity = readShort(block, table + 1);
+    if (capacity == 0 || (capacity & (capacity - 1)) != 0) return invalid(offset, "the switch table's capacity is not a power of two");
+    bool empty = false; // Lookups stop at an empty slot, without one a missing key would probe forever
+    for (int i = capacity - 1; i >= 0; i--) {
+        int slot = table + SWITCH_STRINGS_HEADER + SWITCH_SLOT * i;
+        int constant = block->bytes[slot] | (block->bytes[slot + 1] << 8) | (block->bytes[slot + 2] << 16);
+        if (constant == SWITCH_EMPTY) {
+            empty = true;
+            continue;
+        }
+        if (constant >= block->constants.count || !IS_STRING(block->constants.values[constant])) return invalid(offset, "a switch key is not a string constant");
+        if (!claim(verifier, offset, end + readShort(block, slot + 3), depth)) return false;
+    }
+    if (!empty) return invalid(offset, "the switch table has no empty slot");
+    return claim(verifier, offset, end + readShort(block, table + 3), depth);
+}
+
+static bool checkStackInstruction(Verifier* verifier, int offset) {
+    Block* block = verifier->block;
+    uint8_t* bytes = &block->bytes[offset];
+    int size = stackInstructionSize(block, offset);
+    int depth = verifier->depths[offset] - DEPTH(0);
+    int pops = 0, pushes = 0;
+    bool jumps = false;
+    int target = 0; // Where a jump lands, can be outside the code
+    bool fallsThrough = true;
+
+    switch (bytes[0]) {
+        case OP_CONSTANT:
+        case OP_CONSTANT_LONG: {
+            int index = bytes[0] == OP_CONSTANT ? bytes[1] : bytes[1] | (bytes[2] << 8) | (bytes[3] << 16);
+            if (index >= block->constants.count) return invalid(offset, "no such constant");
+            pushes = 1;
+            break;
+        }
+        case OP_NEG1:
+        case OP_0:
+        case OP_1:
+        case OP_2:
+        case OP_TRUE:
+        case OP_FALSE:
+        case OP_NULL:
+            pushes = 1;
+            break;
+        case OP_PRINT:
+        case OP_POP:
+            pops = 1;
+            break;
+        case OP_NEGATE:
+        case OP_NOT:
+        case OP_FACT:
+        case OP_GET_INPUT:
+            pops = pushes = 1;
+            break;
+        case OP_ADD: case OP_SUB: case OP_MUL: case OP_DIV: case OP_MOD: case OP_POW:
+        case OP_EQ: case OP_LT: case OP_GT: case OP_AND: case OP_OR: case OP_SUBSCRIPT:
+        case OP_ADD_II: case OP_SUB_II: case OP_MUL_II: case OP_MOD_II: case OP_EQ_II: case OP_LT_II: case OP_GT_II:
+        case OP_ADD_FF: case OP_SUB_FF: case OP_MUL_FF: case OP_LT_FF: case OP_GT_FF:
+            pops = 2;
+            pushes = 1;
+            break;
+        case OP_JUMP_IF_FLS:
+            pops = pushes = 1; // Only looks at the condition
+            jumps = true;
+            target = offset + size + readShort(block, offset + 1);
+            break;
+        case OP_JUMP:
+            jumps = true;
+            target = offset + size + readShort(block, offset + 1);
+            fallsThrough = false;
+            break;
+        case OP_LOOP:
+            jumps = true;
+            target = offset + size - readShort(block, offset + 1);
+            fallsThrough = false;
+            break;
+        case OP_DEFINE_GLOBAL:
+        case OP_GET_GLOBAL:
+        case OP_SET_GLOBAL: {
+            int index = namedIndex(bytes);
+            if (index >= block->constants.count || !IS_STRING(block->constants.values[index])) return invalid(offset, "the global's name is not a string constant");
+            pops = bytes[0] == OP_GET_GLOBAL ? 0 : 1;
+            pushes = bytes[0] == OP_DEFINE_GLOBAL ? 0 : 1;
+            break;
+        }
+        case OP_GET_LOCAL:
+        case OP_SET_LOCAL:
+            if (namedIndex(bytes) >= depth) return invalid(offset, "no such local");
+            pops = bytes[0] == OP_SET_LOCAL ? 1 : 0;
+            pushes = 1;
+            break;
+        case OP_BUILD_DICT:
+            pops = 2 * readShort(block, offset + 1);
+            pushes = 1;
+            break;
+        case OP_BUILD_ARRAY:
+            pops = readShort(block, offset + 1);
+            pushes = 1;
+            break;
+        case OP_FOR_PREP:
+        case OP_FOR_RANGE: {
+            if (readShort(block, offset + 1) + 3 > depth) return invalid(offset, "the counter, end and step are not all locals");
+            int distance = readShort(block, offset + 3);
+            jumps = true;
+            target = bytes[0] == OP_FOR_PREP ? offset + size + distance : offset + size - distance;
+            break;
+        }
+        case OP_DEFINE_GLOBAL_SLOT:
+        case OP_GET_GLOBAL_SLOT:
+        case OP_SET_GLOBAL_SLOT:
+            if (namedIndex(bytes) >= verifier->globalCount) return invalid(offset, "no such global");
+            pops = bytes[0] == OP_GET_GLOBAL_SLOT ? 0 : 1;
+            pushes = bytes[0] == OP_DEFINE_GLOBAL_SLOT ? 0 : 1;
+            break;
+        case OP_SWITCH:
+            pops = 1;
+            fallsThrough = false;
+            break;
+        case OP_RETURN:
+            fallsThrough = false;
+            break;
+    }
+
+    if (depth < pops) return invalid(offset, "the stack underflows");
+    int after = depth - pops + pushes;
+    if (after > verifier->stackSize) return invalid(offset, "the stack grows past the size the file gives");
+    if (bytes[0] == OP_SWITCH) return checkSwitch(verifier, offset, offset + 1, after);
+
+    if (jumps && !claim(verifier, offset, target, after)) return false;
+    return !fallsThrough || claim(verifier, offset, offset + size, after); // Last, so it is checked next and the walk goes through the code in order
+}
+
+static bool checkRegisterInstruction(Verifier* verifier, int offset) {
+    Block* block = verifier->block;
+    uint8_t op = block->bytes[offset];
+    bool jumps = false;
+    int target = 0;
+
+    int at = offset + 1;
+    for (const char* kind = registerOperands(op); *kind != '\0'; kind++, at += 2) {
+        uint16_t operand = readShort(block, at);
+        switch (*kind) {
+            case 'A':
+                if (operand >= verifier->stackSize) return invalid(offset, "no such register");
+                break;
+            case 'K':
+                if (operand & 0x8000 ? (operand & 0x7fff) >= block->constants.count : operand >= verifier->stackSize)
+                    return invalid(offset, "no such register or constant");
+                break;
+            case 'G':
+                if (operand >= verifier->globalCount) return invalid(offset, "no such global");
+                break;
+            case '+': jumps = true; target = at + 2 + operand; break;
+            case '-': jumps = true; target = at + 2 - operand; break;
+        }
+    }
+
+    if (op == R_BUILD_DICT || op == R_BUILD_ARRAY) { // The elements are in the registers from the first operand on
+        int count = readShort(block, offset + 3) * (op == R_BUILD_DICT ? 2 : 1);
+        if (readShort(block, offset + 1) + count > verifier->stackSize) return invalid(offset, "the elements are not all in registers");
+    }
+    if ((op == R_FOR_PREP || op == R_FOR_RANGE) && readShort(block, offset + 1) + 3 > verifier->stackSize)
+        return invalid(offset, "the counter, end and step are not all in registers");
+
+    if (op == R_SWITCH) return checkSwitch(verifier, offset, at, 0);
+    if (jumps && !claim(verifier, offset, target, 0)) return false;
+    return op == R_JUMP || op == R_LOOP || op == R_RETURN || claim(verifier, offset, at, 0);
+}
+
+bool verifyBlock(Block* block, int globalCount, int stackSize, bool registerCode) {
+    if (stackSize > MAX_STACK_SIZE) return invalid(0, "the stack size is too large");
+
+    Verifier verifier;
+    verifier.block = block;
+    verifier.globalCount = globalCount;
+    verifier.stackSize = stackSize;
+    verifier.registerCode = registerCode;
+    verifier.depths = ALLOCATE(uint16_t, block->count);
+    verifier.pending = ALLOCATE(int, block->count); // An instruction is claimed once, there are fewer of them than bytes
+    verifier.pendingCount = 0;
+    memset(verifier.depths, 0, sizeof(uint16_t) * block->count); // Every byte UNSEEN
+
+    bool valid = claim(&verifier, 0, 0, 0);
+    while (valid && verifier.pendingCount > 0) {
+        int offset = verifier.pending[--verifier.pendingCount];
+        valid = registerCode ? checkRegisterInstruction(&verifier, offset) : checkStackInstruction(&verifier, offset);
+    }
+
+    FREE_ARRAY(uint16_t, verifier.depths, block->count);
+    FREE_ARRAY(int, verifier.pending, block->count);
+    return valid;
+}
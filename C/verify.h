@@ -0,0 +1,12 @@
+#ifndef T_VERIFY_H
+#define T_VERIFY_H
+
+#include "block.h"
+#include "common.h"
+
+// Checks a loaded block once, before it runs, so the run loops can trust it: every instruction that can run is whole, the constants,
+// globals, locals and registers it names exist, jumps land on the start of an instruction and the stack never holds more than stackSize values.
+// Prints what is wrong and returns false otherwise
+bool verifyBlock(Block* block, int globalCount, int stackSize, bool registerCode);
+
+#endif
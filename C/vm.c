@@ -3,9 +3,12 @@
 #include <string.h>
 #include <stdlib.h>
 
+#include "array.h"
 #include "common.h"
 #include "debug.h"
+#include "input.h"
 #include "object.h"
+#include "verify.h"
 #include "vm.h"
 #include "memory.h"
 
@@ -31,6 +34,11 @@ void vmInit() {
     resetStack();
     vm.objects = NULL;
     tableInit(&vm.globals);
+    vaInit(&vm.globalNames);
+    vm.globalSlots = NULL;
+    vm.registerCode = false;
+    vm.stackSize = 0;
+    vm.stack = NULL;
     #ifdef T_VM_DBG
     printf("vm.c :: vmInit : initialize vm\n");
     #endif
@@ -39,15 +47,16 @@ void vmInit() {
 void vmFree() {
     tableFree(&vm.strings);
     tableFree(&vm.globals);
+    FREE_ARRAY(Value, vm.globalSlots, vm.globalNames.count);
+    vaFree(&vm.globalNames);
+    FREE_ARRAY(Value, vm.stack, vm.stackSize);
     freeObjects();
     #ifdef T_VM_DBG
     printf("vm.c :: vmFree : free vm\n");
     #endif
 }
 
-void concatenate() {
-    Value b_ = pop(); // Second operand
-    Value a_ = pop(); // First operand
+static Value concatenate(Value a_, Value b_) {
     ObjString* a = toString(a_);
     ObjString* b = toString(b_);
 
@@ -59,16 +68,13 @@ void concatenate() {
     chars[length] = '\0';
 
     ObjString* result = makeString(true, chars, length);
-    push(TIMID_STR_2_VAL(result));
+    return TIMID_STR_2_VAL(result);
 }
 
-void stringMultiplication(Value value, int times) {
+static Value stringMultiplication(Value value, int times) {
     ObjString* string = toString(value);
 
-    if (times <= 0) {
-        push(TIMID_EMPTY_STR);
-        return;
-    }
+    if (times <= 0) return TIMID_EMPTY_STR;
 
     int length = string->length * times;
     char* chars = ALLOCATE(char, length + 1);
@@ -79,7 +85,7 @@ void stringMultiplication(Value value, int times) {
     chars[length] = '\0';
 
     ObjString* result = makeString(true, chars, length);
-    push(TIMID_STR_2_VAL(result));
+    return TIMID_STR_2_VAL(result);
 }
 
 static void emitByte(uint8_t byte) {
@@ -87,12 +93,15 @@ static void emitByte(uint8_t byte) {
 }
 
 typedef enum {
-    B_INT, B_FLOAT, B_STRING, B_COUNT
+    B_INT, B_FLOAT, B_STRING,
+    B_GLOBAL, // Not a constant: the next global slot, named by the string constant at the 3 byte index that follows
+    B_COUNT
 } BytecodeValType;
 
 #define HEADER_BYTES 0xFACC
+#define REGISTER_HEADER 0xCD // After 0xFA instead of 0xCC. Either way the stack size follows in two bytes
 
-static void readBytecode(uint8_t* bytecode, size_t bytecodeLength) {
+static bool readBytecode(uint8_t* bytecode, size_t bytecodeLength) {
     #define READ_BYTE() (bytecode[offset++])
     #define PEEK(distance) (bytecode[offset + distance])
     #ifdef T_VM_DBG
@@ -156,46 +165,337 @@ static void readBytecode(uint8_t* bytecode, size_t bytecodeLength) {
                 addConstant(vm.block, TIMID_STRING(buffer, len));
                 break;
             }
+            case B_GLOBAL: {
+                int index = READ_BYTE();
+                index |= READ_BYTE() << 8;
+                index |= READ_BYTE() << 16;
+                if (index >= vm.block->constants.count) {
+                    fprintf(stderr, "Invalid file format\n");
+                    return false;
+                }
+                vaWrite(&vm.globalNames, vm.block->constants.values[index]); // Names come after the constants they point to
+                break;
+            }
             default:
-                if (PEEK(-1) == 0xFA && PEEK(0) == 0xCC) {
+                if (PEEK(-1) == 0xFA && (PEEK(0) == 0xCC || PEEK(0) == REGISTER_HEADER)) {
                     //printf("Reached header\n");
+                    vm.registerCode = PEEK(0) == REGISTER_HEADER;
                     readConstants = true;
                     break;
                 } else {
                     fprintf(stderr, "Invalid file format\n");
-                    return;
+                    return false;
                 }
         }
     }
 
-    for (offset += 1; offset < bytecodeLength;) { // Loop through every byte, after checking the header
-        uint8_t instruction = READ_BYTE(); // We can move our offset pointer further ahead based on certain instructions
-        switch (instruction) {
-            case OP_GET_LOCAL:
-            case OP_SET_LOCAL:
-            case OP_DEFINE_GLOBAL:
-            case OP_GET_GLOBAL:
-            case OP_SET_GLOBAL: {
-                emitByte(instruction);
-                uint8_t constType = READ_BYTE();
-                emitByte(constType);
-
-                if (constType == OP_CONSTANT) {
-                    emitByte(READ_BYTE());
-                } else if (constType == OP_CONSTANT_LONG) {
-                    emitByte(READ_BYTE());
-                    emitByte(READ_BYTE());
-                    emitByte(READ_BYTE());
+    vm.globalSlots = ALLOCATE(Value, vm.globalNames.count); // Every global the code uses is known now
+    for (int i = 0; i < vm.globalNames.count; i++)
+        vm.globalSlots[i] = TIMID_UNDEFINED;
+
+    if (!readConstants || offset + 2 >= bytecodeLength) { // No header, or no stack size after it
+        fprintf(stderr, "Invalid file format\n");
+        return false;
+    }
+    vm.stackSize = PEEK(1) | (PEEK(2) << 8);
+    vm.stack = ALLOCATE(Value, vm.stackSize);
+    resetStack();
+
+    for (offset += 3; offset < bytecodeLength;) emitByte(READ_BYTE()); // The code is copied as it is, then checked once
+    return verifyBlock(vm.block, vm.globalNames.count, vm.stackSize, vm.registerCode);
+    #undef READ_BYTE
+    #undef PEEK
+}
+
+static bool arrayOperation(OpCode op, Value a, Value b, Value* result) { // Element-wise arithmetic, at least one operand is an array
+    switch (arrayArithmetic(op, a, b, result)) {
+        case ARRAY_OK:
+            return true;
+        case ARRAY_NOT_NUMERIC:
+            printf("Expected an array or a number\n");
+            return false;
+        case ARRAY_LENGTH_MISMATCH:
+            printf("Arrays have different lengths\n");
+            return false;
+        case ARRAY_DIVISION_BY_ZERO:
+            printf("Division by zero\n");
+            return false;
+    }
+    return false;
+}
+
+// The generic instructions, shared by the stack and the register VM. On operands they can't take they print why and return false
+static bool binaryOperation(OpCode op, Value a, Value b, Value* result) {
+    switch (op) {
+        case OP_ADD:
+            if (IS_ARRAY(a) || IS_ARRAY(b)) return arrayOperation(op, a, b, result);
+            if (isNumeric(a) && isNumeric(b)) {
+                if (a.type == V_FLOAT || b.type == V_FLOAT) // If both values are numeric and one is a float, make the result a float
+                    *result = TIMID_FLOAT(toFloat(a) + toFloat(b));
+                else
+                    *result = TIMID_INT(toInt(a) + toInt(b));
+                return true;
+            } else if (IS_STRING(a) || IS_STRING(b)) { // If any operand is a string then concatenation can occur;
+                *result = concatenate(a, b);
+                return true;
+            }
+            printf("Expected numerical values to add, or at least one string to concatenate\n");
+            return false;
+        case OP_SUB:
+            if (IS_ARRAY(a) || IS_ARRAY(b)) return arrayOperation(op, a, b, result);
+            if (isNumeric(a) && isNumeric(b)) {
+                if (a.type == V_FLOAT || b.type == V_FLOAT)
+                    *result = TIMID_FLOAT(toFloat(a) - toFloat(b));
+                else
+                    *result = TIMID_INT(toInt(a) - toInt(b));
+                return true;
+            }
+            printf("Expected numerical values to subtract\n");
+            return false;
+        case OP_MUL:
+            if (IS_ARRAY(a) || IS_ARRAY(b)) return arrayOperation(op, a, b, result);
+            if (isNumeric(a) && isNumeric(b)) {
+                if (a.type == V_FLOAT || b.type == V_FLOAT)
+                    *result = TIMID_FLOAT(toFloat(a) * toFloat(b));
+                else
+                    *result = TIMID_INT(toInt(a) * toInt(b));
+                return true;
+            } else if (IS_STRING(b) && isIntegral(a)) { // integer * string
+                *result = stringMultiplication(b, toInt(a));
+                return true;
+            } else if (IS_STRING(a) && isIntegral(b)) { // string * integer
+                *result = stringMultiplication(a, toInt(b));
+                return true;
+            }
+            printf("Expected numerical values to multiply, or a string and an integer\n");
+            return false;
+        case OP_DIV:
+            if (IS_ARRAY(a) || IS_ARRAY(b)) return arrayOperation(op, a, b, result);
+            if (isNumeric(a) && isNumeric(b)) {
+                if (toFloat(b) == 0) {
+                    printf("Division by zero\n");
+                    return false;
                 }
-                break;
+                *result = TIMID_FLOAT(toFloat(a) / toFloat(b));
+                return true;
             }
-            default:
-                emitByte(instruction);
-                break;
+            printf("Expected numerical values to divide\n");
+            return false;
+        case OP_MOD:
+            if (isNumeric(a) && isNumeric(b)) {
+                if (IS_INT(a) && IS_INT(b) ? toInt(b) == 0 : toFloat(b) == 0) {
+                    printf("Modulus by zero\n");
+                    return false;
+                }
+                if (IS_INT(a) && IS_INT(b))
+                    *result = TIMID_INT(toInt(a) % toInt(b));
+                else
+                    *result = TIMID_FLOAT((t_float)fmod(toFloat(a), toFloat(b)));
+                return true;
+            }
+            printf("Expected numerical values to mod\n");
+            return false;
+        case OP_POW:
+            if (IS_ARRAY(a) || IS_ARRAY(b)) return arrayOperation(op, a, b, result);
+            if (isNumeric(a) && isNumeric(b)) {
+                if (a.type == V_FLOAT || b.type == V_FLOAT ? toFloat(a) == 0 && toFloat(b) == 0 : toInt(a) == 0 && toInt(b) == 0) {
+                    printf("Zero to zero\n");
+                    return false;
+                }
+                if (a.type == V_FLOAT || b.type == V_FLOAT)
+                    *result = TIMID_FLOAT((t_float)pow(toFloat(a), toFloat(b)));
+                else
+                    *result = TIMID_INT((t_int)(t_float)pow(toInt(a), toInt(b)));
+                return true;
+            }
+            printf("Expected numerical values to exponentiate\n");
+            return false;
+        case OP_EQ: *result = TIMID_BOOL(equals(a, b));              return true;
+        case OP_LT: *result = TIMID_BOOL(lessThan(a, b));            return true;
+        case OP_GT: *result = TIMID_BOOL(greaterThan(a, b));         return true;
+        case OP_AND: *result = TIMID_BOOL(truth(a) && truth(b));     return true;
+        case OP_OR: *result = TIMID_BOOL(truth(a) || truth(b));      return true;
+        case OP_SUBSCRIPT:
+            if (IS_ARRAY(a)) {
+                if (!isIntegral(b)) {
+                    printf("Expected an integral type as an index\n");
+                    return false;
+                }
+                if (!arrayGet(AS_ARRAY(a), toInt(b), result)) {
+                    printf("Index is out of bounds\n");
+                    return false;
+                }
+            } else if (IS_DICT(a)) {
+                Value key;
+                if (!dictKey(b, &key) || !dictGet(AS_DICT(a), key, result)) {
+                    printf("Key is not in the dictionary\n");
+                    return false;
+                }
+            } else if (!subscriptValue(a, b, result)) {
+                printf("Expected a string and integer to subscript\n");
+                return false;
+            }
+            return true;
+        default:
+            printf("Unknown opcode '%d'\n", op);
+            return false;
+    }
+}
+
+static bool unaryOperation(OpCode op, Value value, Value* result) {
+    switch (op) {
+        case OP_NEGATE:
+            if (IS_NUMERIC(value)) {
+                if (IS_BOOL(value) || IS_NULL(value))
+                    *result = TIMID_INT(-AS_INT(NUM_2_INT(value)));
+                else if (IS_INT(value))
+                    *result = TIMID_INT(-AS_INT(value));
+                else
+                    *result = TIMID_FLOAT(-AS_FLOAT(value));
+                return true;
+            }
+            printf("Expected a numeric value to negate\n");
+            return false;
+        case OP_NOT:
+            *result = TIMID_BOOL(!truth(value));
+            return true;
+        case OP_FACT:
+            if (isIntegral(value)) {
+                int number = AS_INT(value);
+                if (number < 0) {
+                    printf("Math error: cannot factorial negative number '%d'\n", number);
+                    return false;
+                }
+                int factorial = 1;
+
+                for (int i = 1; i <= number; i++) {
+                    factorial *= i;
+                }
+                *result = TIMID_INT(factorial);
+                return true;
+            }
+            printf("Expected an integer to factorial\n");
+            return false;
+        default:
+            printf("Unknown opcode '%d'\n", op);
+            return false;
+    }
+}
+
+static Value readInput(Value prompt) {
+    if (inputIsBatch()) { // No prompt, the string points straight into the chunk the line was read into
+        char* line;
+        int length;
+        return inputLine(&line, &length) ? TIMID_STRING(line, length) : TIMID_EMPTY_STR;
+    }
+
+    printValue(prompt);
+    fflush(stdout); // The prompt, and everything before it, has to be seen before waiting
+
+    size_t bufferSize = sizeof(char) * 1024;
+    char* buffer = ALLOCATE(char, bufferSize);
+
+    ssize_t size = getline(&buffer, &bufferSize, stdin);
+    if (size < 0) size = 0; // The end of the input reads as an empty line
+    else if (buffer[size - 1] == '\n') size--; // The last line may not have one
+    //buffer[size] = '\0';
+    return TIMID_STRING(buffer, size);
+}
+
+static bool buildDict(Value* entries, int count, Value* result) { // Keys and values in order, a repeated key keeps the last value
+    ObjDict* dict = makeDict();
+
+    for (int i = 0; i < count; i++) {
+        Value key;
+        if (!dictKey(entries[2 * i], &key)) {
+            printf("Expected a number or string as a dictionary key\n");
+            return false;
         }
+        dictSet(dict, key, entries[2 * i + 1]);
     }
-    #undef READ_BYTE
-    #undef PEEK
+
+    *result = TIMID_OBJ(&dict->obj);
+    return true;
+}
+
+static bool buildArray(Value* elements, int count, Value* result) {
+    bool isFloat = false;
+
+    for (int i = 0; i < count; i++) {
+        if (!isNumeric(elements[i]) && !IS_NULL(elements[i])) {
+            printf("Expected a number as an array element\n");
+            return false;
+        }
+        isFloat = isFloat || IS_FLOAT(elements[i]);
+    }
+
+    ObjArray* array = makeArray(isFloat, count);
+    for (int i = 0; i < count; i++) { // tru, fls and nul are stored as numbers
+        if (isFloat)
+            array->as.floats[i] = toFloat(elements[i]);
+        else
+            array->as.ints[i] = toInt(elements[i]);
+    }
+
+    *result = TIMID_OBJ(&array->obj);
+    return true;
+}
+
+static bool rangeContinues(Value* range) { // range points at the counter, end and step locals
+    if (IS_INT(range[0]) && IS_INT(range[1]) && IS_INT(range[2]))
+        return AS_INT(range[2]) > 0 ? AS_INT(range[0]) < AS_INT(range[1]) : AS_INT(range[0]) > AS_INT(range[1]);
+    return toFloat(range[2]) > 0 ? lessThan(range[0], range[1]) : greaterThan(range[0], range[1]);
+}
+
+static bool rangeReady(Value* range) { // Before the first iteration
+    if (!isNumeric(range[0]) || !isNumeric(range[2])) {
+        printf("Expected a number in a range\n");
+        return false;
+    }
+    if (toFloat(range[2]) == 0) {
+        printf("Range step cannot be zero\n");
+        return false;
+    }
+    return true;
+}
+
+static bool rangeStep(Value* range) { // Any counter that is not a plain integer range, the body can assign anything to it
+    if (!isNumeric(range[0])) {
+        printf("Expected the loop counter to stay a number\n");
+        return false;
+    }
+    if (IS_FLOAT(range[0]) || IS_FLOAT(range[2]))
+        range[0] = TIMID_FLOAT(toFloat(range[0]) + toFloat(range[2]));
+    else
+        range[0] = TIMID_INT(toInt(range[0]) + toInt(range[2]));
+    return true;
+}
+
+static uint16_t switchDistance(uint8_t* table, Value value) { // Where a switch table sends value, it matches a key when equals() would
+    #define TABLE_SHORT(at) ((uint16_t)(table[at] | (table[(at) + 1] << 8)))
+    if (table[0] == SWITCH_INTS) {
+        if (!isIntegral(value)) return TABLE_SHORT(7); // Floats are never equal to an int
+        t_int low = (int32_t)(table[1] | (table[2] << 8) | (table[3] << 16) | ((uint32_t)table[4] << 24));
+        t_int key = toInt(value);
+        if (key < low || key >= low + TABLE_SHORT(5)) return TABLE_SHORT(7);
+        return TABLE_SHORT(SWITCH_INTS_HEADER + 2 * (key - low));
+    }
+
+    if (!IS_STRING(value)) return TABLE_SHORT(3);
+    int mask = TABLE_SHORT(1) - 1;
+    for (int i = AS_STRING(value)->hash & mask;; i = (i + 1) & mask) { // The compiler left an empty slot
+        uint8_t* slot = &table[SWITCH_STRINGS_HEADER + SWITCH_SLOT * i];
+        int constant = slot[0] | (slot[1] << 8) | (slot[2] << 16);
+        if (constant == SWITCH_EMPTY) return TABLE_SHORT(3);
+        if (objEquals(value, vm.block->constants.values[constant])) return slot[3] | (slot[4] << 8);
+    }
+    #undef TABLE_SHORT
+}
+
+static void undefinedVariable(Value name) {
+    printf("Undefined variable '");
+    printValue(name);
+    printf("'\n");
 }
 
 static void logInstruction(const char* message) {
@@ -252,192 +552,30 @@ static InterpretResult run() {
                 break;
             }
             case OP_POP: pop(); break;
-            case OP_NEGATE: {
-                Value peeked = peek(0);
-                if (IS_NUMERIC(peeked)) {
-                    if (IS_BOOL(peeked) || IS_NULL(peeked))
-                        push(TIMID_INT(-AS_INT(NUM_2_INT(pop()))));
-                    else if (IS_INT(peeked))
-                        push(TIMID_INT(-AS_INT(pop())));
-                    else if (IS_FLOAT(peeked))
-                        push(TIMID_FLOAT(-AS_FLOAT(pop())));
-                    break;
-                }
-                printf("Expected a numeric value to negate\n");
-                return INTERPRET_RUNTIME_ERROR;
-            }
-            case OP_NOT: {
-                Value value = pop();
-                push(TIMID_BOOL(!truth(value)));
-                break;
-            }
+            case OP_NEGATE:
+            case OP_NOT:
             case OP_FACT: {
-                if (isIntegral(peek(0))) {
-                    int value = AS_INT(pop());
-                    if (value < 0) {
-                        printf("Math error: cannot factorial negative number '%d'\n", value);
-                        return INTERPRET_RUNTIME_ERROR;
-                    }
-                    int result = 1;
-                    
-                    for (int i = 1; i <= value; i++) {
-                        result *= i;
-                    }
-                    push(TIMID_INT(result));
-                    break;
-
-                }
-                printf("Expected an integer to factorial\n");
-                return INTERPRET_RUNTIME_ERROR;
-            }
-            case OP_ADD: {
-                if (isNumeric(peek(0)) && isNumeric(peek(1))) {
-                    Value b = pop(), a = pop();
-                    if (a.type == V_FLOAT || b.type == V_FLOAT) // If both values are numeric and one is a float, make the result a float
-                        push(TIMID_FLOAT(toFloat(a) + toFloat(b)));
-                    else
-                        push(TIMID_INT(toInt(a) + toInt(b)));
-                    break;
-                } else if (IS_STRING(peek(0)) || IS_STRING(peek(1))) { // If any operand is a string then concatenation can occur;
-                    concatenate();
-                    break;
-                }
-                printf("Expected numerical values to add, or at least one string to concatenate\n");
-                return INTERPRET_RUNTIME_ERROR;
-            }
-            case OP_SUB: {
-                if (isNumeric(peek(0)) && isNumeric(peek(1))) {
-                    Value b = pop(), a = pop();
-                    if (a.type == V_FLOAT || b.type == V_FLOAT)
-                        push(TIMID_FLOAT(toFloat(a) - toFloat(b)));
-                    else
-                        push(TIMID_INT(toInt(a) - toInt(b)));
-                    break;
-                }
-                printf("Expected numerical values to subtract\n");
-                return INTERPRET_RUNTIME_ERROR;
-            }
-            case OP_MUL: {
-                if (isNumeric(peek(0)) && isNumeric(peek(1))) {
-                    Value b = pop(), a = pop();
-                    if (a.type == V_FLOAT || b.type == V_FLOAT)
-                        push(TIMID_FLOAT(toFloat(a) * toFloat(b)));
-                    else
-                        push(TIMID_INT(toInt(a) * toInt(b)));
-                    break;
-                } else if (IS_STRING(peek(0)) && isIntegral(peek(1))) { // string * integer
-                    Value value = pop();
-                    int times = toInt(pop());  
-                    if (times <= 0) { // If the times is less than or equal to zero then bail out and return an empty string
-                        push(TIMID_EMPTY_STR);
-                        break;
-                    }
-                    stringMultiplication(value, times);
-                    break;
-
-                } else if (IS_STRING(peek(1)) && isIntegral(peek(0))) { // integer * string
-                    int times = toInt(pop());
-                    if (times <= 0) {
-                        push(TIMID_EMPTY_STR);
-                        break;
-                    }
-                    Value value = pop();
-                    stringMultiplication(value, times);
-                    break;
-                }
-                printf("Expected numerical values to multiply, or a string and an integer\n");
-                return INTERPRET_RUNTIME_ERROR;
-            }
-            case OP_DIV: {
-                if (isNumeric(peek(0)) && isNumeric(peek(1))) {
-                    Value b = pop(), a = pop();
-                    
-                    if (isNumeric(a) && isNumeric(b)) {
-                        if (toFloat(b) == 0) {
-                            printf("Division by zero\n");
-                            return INTERPRET_RUNTIME_ERROR;
-                        } 
-                        push(TIMID_FLOAT(toFloat(a) / toFloat(b)));
-                    }
-                    break;
-                }
-                printf("Expected numerical values to divide\n");
-                return INTERPRET_RUNTIME_ERROR;
-            }
-            case OP_MOD: {
-                if (isNumeric(peek(0)) && isNumeric(peek(1))) {
-                    Value b = pop(), a = pop();
-
-                    if (IS_INT(a) && IS_INT(b)) {
-                        if (toInt(b) == 0) {
-                            printf("Modulus by zero\n");
-                            return INTERPRET_RUNTIME_ERROR;
-                        } 
-                        push(TIMID_INT(toInt(a) % toInt(b)));
-                        break;
-                    }
-                    
-                    if (isNumeric(a) && isNumeric(b)) {
-                        if (toFloat(b) == 0) {
-                            printf("Modulus by zero\n");
-                            return INTERPRET_RUNTIME_ERROR;
-                        } 
-                        push(TIMID_FLOAT((t_float)fmod(toFloat(a), toFloat(b))));
-                    }
-                    break;
-                }
-                printf("Expected numerical values to mod\n");
-                return INTERPRET_RUNTIME_ERROR;
-            }
-            case OP_POW: {
-                if (isNumeric(peek(0)) && isNumeric(peek(1))) {
-                    Value b = pop(), a = pop();
-
-                    if (a.type == V_FLOAT || b.type == V_FLOAT) {
-                        if (toFloat(a) == 0 && toFloat(b) == 0) {
-                            printf("Zero to zero\n");
-                            return INTERPRET_RUNTIME_ERROR;
-                        }
-                        
-                        push(TIMID_FLOAT((t_float)pow(toFloat(a), toFloat(b))));
-                    }
-                    else {
-                        if (toInt(a) == 0 && toInt(b) == 0) {
-                            printf("Zero to zero\n");
-                            return INTERPRET_RUNTIME_ERROR;
-                        }
-                        t_float result = (t_float)pow(toInt(a), toInt(b));
-                        push(TIMID_INT((t_int)result));
-
-                    }
-                    break;
-                }
-                printf("Expected numerical values to exponentiate\n");
-                return INTERPRET_RUNTIME_ERROR;
-            }
-            case OP_EQ: {
-                Value b = pop(), a = pop();
-                push(TIMID_BOOL(equals(a, b)));
-                break;
-            }
-            case OP_LT: {
-                Value b = pop(), a = pop();
-                push(TIMID_BOOL(lessThan(a, b)));
-                break;
-            }
-            case OP_GT: {
-                Value b = pop(), a = pop();
-                push(TIMID_BOOL(greaterThan(a, b)));
-                break;
-            }
-            case OP_AND: {
-                Value b = pop(), a = pop();
-                push(TIMID_BOOL(truth(a) && truth(b)));
+                Value result;
+                if (!unaryOperation(instruction, peek(0), &result)) return INTERPRET_RUNTIME_ERROR;
+                vm.stackTop[-1] = result;
                 break;
             }
-            case OP_OR: {
-                Value b = pop(), a = pop();
-                push(TIMID_BOOL(truth(a) || truth(b)));
+            case OP_ADD:
+            case OP_SUB:
+            case OP_MUL:
+            case OP_DIV:
+            case OP_MOD:
+            case OP_POW:
+            case OP_EQ:
+            case OP_LT:
+            case OP_GT:
+            case OP_AND:
+            case OP_OR:
+            case OP_SUBSCRIPT: {
+                Value result;
+                if (!binaryOperation(instruction, peek(1), peek(0), &result)) return INTERPRET_RUNTIME_ERROR;
+                pop();
+                vm.stackTop[-1] = result;
                 break;
             }
             case OP_JUMP_IF_FLS: {
@@ -465,9 +603,7 @@ static InterpretResult run() {
                 ObjString* name = READ_STRING();
                 Value value;
                 if (!tableGet(&vm.globals, name, &value)) {
-                    printf("Undefined variable '");
-                    printValue(TIMID_STR_2_VAL(name));
-                    printf("'\n");
+                    undefinedVariable(TIMID_STR_2_VAL(name));
                     return INTERPRET_RUNTIME_ERROR;
                 }
                 push(value);
@@ -477,9 +613,7 @@ static InterpretResult run() {
                 ObjString* name = READ_STRING();
                 if (tableSet(&vm.globals, name, peek(0))) {
                     tableDelete(&vm.globals, name);
-                    printf("Undefined variable '");
-                    printValue(TIMID_STR_2_VAL(name));
-                    printf("'\n");
+                    undefinedVariable(TIMID_STR_2_VAL(name));
                     return INTERPRET_RUNTIME_ERROR;
                 }
                 break;
@@ -495,30 +629,109 @@ static InterpretResult run() {
                 break;
             }
             case OP_GET_INPUT: {
-                Value prompt = pop();
-                printValue(prompt);
-
-                size_t bufferSize = sizeof(char) * 1024;
-                char* buffer = ALLOCATE(char, bufferSize);
+                vm.stackTop[-1] = readInput(peek(0));
+                break;
+            }
+            case OP_BUILD_DICT: {
+                uint16_t count = READ_SHORT();
+                Value* entries = vm.stackTop - 2 * count;
+                Value result;
+                if (!buildDict(entries, count, &result)) return INTERPRET_RUNTIME_ERROR;
+
+                vm.stackTop = entries;
+                push(result);
+                break;
+            }
+            case OP_BUILD_ARRAY: {
+                uint16_t count = READ_SHORT();
+                Value* elements = vm.stackTop - count;
+                Value result;
+                if (!buildArray(elements, count, &result)) return INTERPRET_RUNTIME_ERROR;
+
+                vm.stackTop = elements;
+                push(result);
+                break;
+            }
+            case OP_FOR_PREP: {
+                Value* range = &vm.stack[READ_SHORT()];
+                uint16_t offset = READ_SHORT();
 
-                size_t size = getline(&buffer, &bufferSize, stdin) - 1;
-                //buffer[size] = '\0';
-                push(TIMID_STRING(buffer, size));
+                if (!rangeReady(range)) return INTERPRET_RUNTIME_ERROR;
+                if (!rangeContinues(range)) vm.ip += offset; // Empty range, skip the loop
                 break;
             }
-            case OP_SUBSCRIPT: {
-                Value subscript = pop();
-                Value iterable = pop();
-                Value value;
+            case OP_FOR_RANGE: {
+                Value* range = &vm.stack[READ_SHORT()];
+                uint16_t offset = READ_SHORT();
 
-                if (!subscriptValue(iterable, subscript, &value)) {
-                    printf("Expected a string and integer to subscript\n");
-                    return INTERPRET_RUNTIME_ERROR;
+                if (IS_INT(range[0]) && IS_INT(range[1]) && IS_INT(range[2])) { // Step, compare and jump on plain integers
+                    t_int counter = AS_INT(range[0]) + AS_INT(range[2]);
+                    range[0] = TIMID_INT(counter);
+                    if (AS_INT(range[2]) > 0 ? counter < AS_INT(range[1]) : counter > AS_INT(range[1]))
+                        vm.ip -= offset;
+                    break;
                 }
 
+                if (!rangeStep(range)) return INTERPRET_RUNTIME_ERROR;
+                if (rangeContinues(range)) vm.ip -= offset;
+                break;
+            }
+            // The compiler proved both operands have this type, see Analysis.infer_types, so the result replaces the left one in place
+            #define TYPED_BINARY(make, as, operator) { \
+                Value b = pop(); \
+                vm.stackTop[-1] = make(as(vm.stackTop[-1]) operator as(b)); \
+            }
+            case OP_ADD_II: TYPED_BINARY(TIMID_INT, AS_INT, +);     break;
+            case OP_SUB_II: TYPED_BINARY(TIMID_INT, AS_INT, -);     break;
+            case OP_MUL_II: TYPED_BINARY(TIMID_INT, AS_INT, *);     break;
+            case OP_EQ_II:  TYPED_BINARY(TIMID_BOOL, AS_INT, ==);   break;
+            case OP_LT_II:  TYPED_BINARY(TIMID_BOOL, AS_INT, <);    break;
+            case OP_GT_II:  TYPED_BINARY(TIMID_BOOL, AS_INT, >);    break;
+            case OP_ADD_FF: TYPED_BINARY(TIMID_FLOAT, AS_FLOAT, +); break;
+            case OP_SUB_FF: TYPED_BINARY(TIMID_FLOAT, AS_FLOAT, -); break;
+            case OP_MUL_FF: TYPED_BINARY(TIMID_FLOAT, AS_FLOAT, *); break;
+            case OP_LT_FF:  TYPED_BINARY(TIMID_BOOL, AS_FLOAT, <);  break;
+            case OP_GT_FF:  TYPED_BINARY(TIMID_BOOL, AS_FLOAT, >);  break;
+            #undef TYPED_BINARY
+            case OP_MOD_II: {
+                t_int b = AS_INT(pop());
+                if (b == 0) {
+                    printf("Modulus by zero\n");
+                    return INTERPRET_RUNTIME_ERROR;
+                }
+                vm.stackTop[-1] = TIMID_INT(AS_INT(vm.stackTop[-1]) % b);
+                break;
+            }
+            case OP_DEFINE_GLOBAL_SLOT: {
+                uint32_t slot = READ_BYTE_OR_LONG();
+                vm.globalSlots[slot] = pop();
+                break;
+            }
+            case OP_GET_GLOBAL_SLOT: {
+                uint32_t slot = READ_BYTE_OR_LONG();
+                Value value = vm.globalSlots[slot];
+                if (IS_UNDEFINED(value)) {
+                    undefinedVariable(vm.globalNames.values[slot]);
+                    return INTERPRET_RUNTIME_ERROR;
+                }
                 push(value);
                 break;
             }
+            case OP_SET_GLOBAL_SLOT: {
+                uint32_t slot = READ_BYTE_OR_LONG();
+                if (IS_UNDEFINED(vm.globalSlots[slot])) { // Assigning does not define
+                    undefinedVariable(vm.globalNames.values[slot]);
+                    return INTERPRET_RUNTIME_ERROR;
+                }
+                vm.globalSlots[slot] = peek(0);
+                break;
+            }
+            case OP_SWITCH: {
+                uint8_t* table = vm.ip;
+                vm.ip += switchTableSize(table);
+                vm.ip += switchDistance(table, pop());
+                break;
+            }
             case OP_RETURN:
                 // Exit program
                 return INTERPET_OK;
@@ -538,13 +751,204 @@ static InterpretResult run() {
     return INTERPET_OK;
 }
 
+static InterpretResult runRegisters() { // Three address code, see Registers.py. Every operand is two bytes
+    #define READ_BYTE() (*vm.ip++)
+    #define READ_SHORT() (vm.ip += 2, (uint16_t)(vm.ip[-2] | (vm.ip[-1] << 8)))
+    #define RK(operand) ((operand) & 0x8000 ? constants[(operand) & 0x7fff] : registers[operand]) // A register, or a constant with the top bit set
+    Value* registers = vm.stack;
+    Value* constants = vm.block->constants.values;
+    vm.stackTop = vm.stack + vm.stackSize; // Only for tracing
+
+    uint8_t instruction;
+    for (;;) {
+        #ifdef T_STACK_DBG
+        printf("        ");
+        for (Value* slot = vm.stack; slot < vm.stackTop; slot++) {
+            printf("[ ");
+            printValue(*slot);
+            printf(" ]");
+        }
+        printf("\n");
+        disassembleRegisterInstruction(vm.block, (int)(vm.ip - vm.block->bytes));
+        #endif
+        switch (instruction = READ_BYTE()) {
+            case R_MOVE: {
+                uint16_t a = READ_SHORT(), b = READ_SHORT();
+                registers[a] = RK(b);
+                break;
+            }
+            case R_TRUE: registers[READ_SHORT()] = TIMID_BOOL(true);   break;
+            case R_FALSE: registers[READ_SHORT()] = TIMID_BOOL(false); break;
+            case R_NULL: registers[READ_SHORT()] = TIMID_NULL;         break;
+            case R_PRINT: {
+                uint16_t b = READ_SHORT();
+                printValue(RK(b));
+                printf("\n");
+                break;
+            }
+            // Operands are read before the result is written, it may go to one of their registers
+            #define REGISTER_UNARY(op) { \
+                uint16_t a = READ_SHORT(), b = READ_SHORT(); \
+                Value result; \
+                if (!unaryOperation(op, RK(b), &result)) return INTERPRET_RUNTIME_ERROR; \
+                registers[a] = result; \
+            }
+            case R_NEGATE: REGISTER_UNARY(OP_NEGATE); break;
+            case R_NOT: REGISTER_UNARY(OP_NOT);       break;
+            case R_FACT: REGISTER_UNARY(OP_FACT);     break;
+            #undef REGISTER_UNARY
+            case R_GET_INPUT: {
+                uint16_t a = READ_SHORT(), b = READ_SHORT();
+                registers[a] = readInput(RK(b));
+                break;
+            }
+            #define REGISTER_BINARY(op) { \
+                uint16_t a = READ_SHORT(), b = READ_SHORT(), c = READ_SHORT(); \
+                Value result; \
+                if (!binaryOperation(op, RK(b), RK(c), &result)) return INTERPRET_RUNTIME_ERROR; \
+                registers[a] = result; \
+            }
+            case R_ADD: REGISTER_BINARY(OP_ADD);             break;
+            case R_SUB: REGISTER_BINARY(OP_SUB);             break;
+            case R_MUL: REGISTER_BINARY(OP_MUL);             break;
+            case R_DIV: REGISTER_BINARY(OP_DIV);             break;
+            case R_MOD: REGISTER_BINARY(OP_MOD);             break;
+            case R_POW: REGISTER_BINARY(OP_POW);             break;
+            case R_EQ: REGISTER_BINARY(OP_EQ);               break;
+            case R_LT: REGISTER_BINARY(OP_LT);               break;
+            case R_GT: REGISTER_BINARY(OP_GT);               break;
+            case R_AND: REGISTER_BINARY(OP_AND);             break;
+            case R_OR: REGISTER_BINARY(OP_OR);               break;
+            case R_SUBSCRIPT: REGISTER_BINARY(OP_SUBSCRIPT); break;
+            #undef REGISTER_BINARY
+            #define TYPED_BINARY(make, as, operator) { \
+                uint16_t a = READ_SHORT(), b = READ_SHORT(), c = READ_SHORT(); \
+                registers[a] = make(as(RK(b)) operator as(RK(c))); \
+            }
+            case R_ADD_II: TYPED_BINARY(TIMID_INT, AS_INT, +);     break;
+            case R_SUB_II: TYPED_BINARY(TIMID_INT, AS_INT, -);     break;
+            case R_MUL_II: TYPED_BINARY(TIMID_INT, AS_INT, *);     break;
+            case R_EQ_II:  TYPED_BINARY(TIMID_BOOL, AS_INT, ==);   break;
+            case R_LT_II:  TYPED_BINARY(TIMID_BOOL, AS_INT, <);    break;
+            case R_GT_II:  TYPED_BINARY(TIMID_BOOL, AS_INT, >);    break;
+            case R_ADD_FF: TYPED_BINARY(TIMID_FLOAT, AS_FLOAT, +); break;
+            case R_SUB_FF: TYPED_BINARY(TIMID_FLOAT, AS_FLOAT, -); break;
+            case R_MUL_FF: TYPED_BINARY(TIMID_FLOAT, AS_FLOAT, *); break;
+            case R_LT_FF:  TYPED_BINARY(TIMID_BOOL, AS_FLOAT, <);  break;
+            case R_GT_FF:  TYPED_BINARY(TIMID_BOOL, AS_FLOAT, >);  break;
+            #undef TYPED_BINARY
+            case R_MOD_II: {
+                uint16_t a = READ_SHORT(), b = READ_SHORT(), c = READ_SHORT();
+                t_int divisor = AS_INT(RK(c));
+                if (divisor == 0) {
+                    printf("Modulus by zero\n");
+                    return INTERPRET_RUNTIME_ERROR;
+                }
+                registers[a] = TIMID_INT(AS_INT(RK(b)) % divisor);
+                break;
+            }
+            case R_JUMP_IF_FLS: {
+                uint16_t b = READ_SHORT(), offset = READ_SHORT();
+                if (!truth(RK(b))) vm.ip += offset;
+                break;
+            }
+            case R_JUMP: {
+                uint16_t offset = READ_SHORT();
+                vm.ip += offset;
+                break;
+            }
+            case R_LOOP: {
+                uint16_t offset = READ_SHORT();
+                vm.ip -= offset;
+                break;
+            }
+            case R_DEFINE_GLOBAL: {
+                uint16_t slot = READ_SHORT(), b = READ_SHORT();
+                vm.globalSlots[slot] = RK(b);
+                break;
+            }
+            case R_GET_GLOBAL: {
+                uint16_t a = READ_SHORT(), slot = READ_SHORT();
+                if (IS_UNDEFINED(vm.globalSlots[slot])) {
+                    undefinedVariable(vm.globalNames.values[slot]);
+                    return INTERPRET_RUNTIME_ERROR;
+                }
+                registers[a] = vm.globalSlots[slot];
+                break;
+            }
+            case R_SET_GLOBAL: {
+                uint16_t slot = READ_SHORT(), b = READ_SHORT();
+                if (IS_UNDEFINED(vm.globalSlots[slot])) { // Assigning does not define
+                    undefinedVariable(vm.globalNames.values[slot]);
+                    return INTERPRET_RUNTIME_ERROR;
+                }
+                vm.globalSlots[slot] = RK(b);
+                break;
+            }
+            case R_BUILD_DICT: {
+                uint16_t a = READ_SHORT(), count = READ_SHORT();
+                if (!buildDict(&registers[a], count, &registers[a])) return INTERPRET_RUNTIME_ERROR;
+                break;
+            }
+            case R_BUILD_ARRAY: {
+                uint16_t a = READ_SHORT(), count = READ_SHORT();
+                if (!buildArray(&registers[a], count, &registers[a])) return INTERPRET_RUNTIME_ERROR;
+                break;
+            }
+            case R_FOR_PREP: {
+                Value* range = &registers[READ_SHORT()];
+                uint16_t offset = READ_SHORT();
+
+                if (!rangeReady(range)) return INTERPRET_RUNTIME_ERROR;
+                if (!rangeContinues(range)) vm.ip += offset; // Empty range, skip the loop
+                break;
+            }
+            case R_FOR_RANGE: {
+                Value* range = &registers[READ_SHORT()];
+                uint16_t offset = READ_SHORT();
+
+                if (IS_INT(range[0]) && IS_INT(range[1]) && IS_INT(range[2])) {
+                    t_int counter = AS_INT(range[0]) + AS_INT(range[2]);
+                    range[0] = TIMID_INT(counter);
+                    if (AS_INT(range[2]) > 0 ? counter < AS_INT(range[1]) : counter > AS_INT(range[1]))
+                        vm.ip -= offset;
+                    break;
+                }
+
+                if (!rangeStep(range)) return INTERPRET_RUNTIME_ERROR;
+                if (rangeContinues(range)) vm.ip -= offset;
+                break;
+            }
+            case R_SWITCH: {
+                uint16_t b = READ_SHORT();
+                uint8_t* table = vm.ip;
+                vm.ip += switchTableSize(table);
+                vm.ip += switchDistance(table, RK(b));
+                break;
+            }
+            case R_RETURN:
+                return INTERPET_OK;
+            default:
+                printf("Unknown opcode '%d'\n", instruction);
+                return INTERPRET_RUNTIME_ERROR;
+        }
+    }
+    #undef RK
+    #undef READ_SHORT
+    #undef READ_BYTE
+    return INTERPET_OK;
+}
+
 InterpretResult interpret(uint8_t* bytecode, size_t bytecodeLength) {
     Block block;
     blockInit(&block);
 
     vm.block = &block;
     
-    readBytecode(bytecode, bytecodeLength);
+    if (!readBytecode(bytecode, bytecodeLength)) {
+        blockFree(&block);
+        return INTERPRET_RUNTIME_ERROR;
+    }
 
     #ifdef T_VM_DBG
     dumpBlock(vm.block, "Block");
@@ -554,7 +958,7 @@ InterpretResult interpret(uint8_t* bytecode, size_t bytecodeLength) {
     vm.ip = vm.block->bytes;
 
     #ifndef NO
-    InterpretResult result = run();
+    InterpretResult result = vm.registerCode ? runRegisters() : run();
 
     blockFree(&block);
     return result;
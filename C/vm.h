@@ -5,16 +5,18 @@
 #include "object.h"
 #include "table.h"
 
-#define STACK_MAX
-
 typedef struct {
     Block* block;
     uint8_t* ip;
     Obj* objects;
-    Table globals;
+    Table globals; // Globals by name, for code that uses OP_GET_GLOBAL and the like
+    ValueArray globalNames; // The name of each global slot, from the .timb
+    Value* globalSlots; // Globals by slot, undefined until OP_DEFINE_GLOBAL_SLOT
     Table strings;
+    bool registerCode; // The file had the register header, run by runRegisters
+    int stackSize; // From the header: the deepest the stack code goes, or the registers the register code uses, they live in the stack
     Value* stackTop;
-    Value stack[STACK_MAX];
+    Value* stack; // Exactly stackSize values, the verifier made sure nothing goes past them
 } VM;
 
 typedef enum {
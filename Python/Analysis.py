@@ -1,4 +1,5 @@
 from Nodes import *
+from types import GeneratorType
 
 class Resolver(Visitor):
     def resolveS(self, statements : list[Stmt]):
@@ -18,4 +19,495 @@ class Resolver(Visitor):
     
     def visitUnaryExpr(self, expr: UnaryExpr):
         self.resolve(expr.right)
-    
\ No newline at end of file
+
+### Expression analysis ###
+# Walks are done with an explicit stack, so deeply nested expressions are fine
+
+def subexpressions(expr : Expr) -> list[Expr]: # The expressions directly inside an expression
+    expr_type = type(expr)
+    if expr_type == BinaryExpr: children = [expr.left, expr.right]
+    elif expr_type == ArrayExpr: children = expr.elements
+    elif expr_type == AssignExpr: children = [expr.value]
+    elif expr_type == CallExpr: children = [expr.callee, *expr.args]
+    elif expr_type == DictionaryExpr: children = [*expr.keys, *expr.values]
+    elif expr_type == FactorialExpr: children = [expr.expr]
+    elif expr_type == InputExpr: children = [expr.prompt]
+    elif expr_type == LambdaExpr: children = [expr.body]
+    elif expr_type == SubscriptExpr: children = [expr.iterable, expr.subscript]
+    elif expr_type == TernaryExpr: children = [expr.condition, expr.if_branch, expr.else_branch]
+    elif expr_type == UnaryExpr: children = [expr.right]
+    else: return []
+    return [child for child in children if child != None]
+
+def analyze_lambda(expr : LambdaExpr): # Fills in the names a lambda's body uses from outside, whether it makes lambdas of its own and if it is pure
+    captures = []
+    makes_lambdas = False
+    pure = True # No input and no assignments other than to its own parameters, what it calls is checked when called
+
+    pending = [(expr.body, (expr.identifier.lexeme,))] # Expressions still to look at, with the parameters in scope there
+    while len(pending) > 0:
+        node, parameters = pending.pop()
+        node_type = type(node)
+
+        if node_type == VariableExpr or node_type == AssignExpr:
+            name = node.name.lexeme
+            if name not in parameters and name not in captures:
+                captures.append(name)
+            if node_type == AssignExpr and name not in parameters:
+                pure = False
+        elif node_type == LambdaExpr: # A cached result would hand out the same closure every time
+            makes_lambdas = True
+            pure = False
+            parameters = parameters + (node.identifier.lexeme,)
+        elif node_type == InputExpr:
+            pure = False
+
+        for child in subexpressions(node):
+            pending.append((child, parameters))
+
+    expr.captures = captures
+    expr.makes_lambdas = makes_lambdas
+    expr.pure = pure
+
+### Statement analysis ###
+
+def substatements(stmt : Stmt) -> list[Stmt]: # The statements directly inside a statement
+    stmt_type = type(stmt)
+    if stmt_type == Block: children = stmt.statements
+    elif stmt_type == IfStmt: children = [stmt.if_branch, stmt.else_branch]
+    elif stmt_type == ForStmt: children = [stmt.initializer, stmt.body]
+    elif stmt_type in (WhileStmt, ForeverStmt, ForRangeStmt): children = [stmt.body]
+    else: return []
+    return [child for child in children if child != None]
+
+def statement_expressions(stmt : Stmt) -> list[Expr]: # The expressions a statement evaluates itself, not those of statements inside it
+    stmt_type = type(stmt)
+    if stmt_type == ExprStmt: children = [stmt.expr]
+    elif stmt_type == PrintStmt: children = [stmt.value]
+    elif stmt_type == VarDeclStmt: children = [stmt.initializer]
+    elif stmt_type == AssertStmt: children = [stmt.condition, stmt.error_msg]
+    elif stmt_type in (IfStmt, WhileStmt): children = [stmt.condition]
+    elif stmt_type == ForStmt: children = [stmt.condition, stmt.step]
+    elif stmt_type == ForRangeStmt: children = [stmt.start, stmt.end, stmt.step]
+    else: return []
+    return [child for child in children if child != None]
+
+def loop_writes(body : Stmt, *extra : Expr) -> tuple[set[str], bool]: # Names a loop body, and the extra expressions it runs, assign or declare, and if it has a goto or label that could skip around
+    names = set()
+    jumps = False
+
+    statements = [body]
+    expressions = [expr for expr in extra if expr != None]
+    while len(statements) > 0:
+        stmt = statements.pop()
+        stmt_type = type(stmt)
+        if stmt_type == VarDeclStmt: names.add(stmt.name.lexeme)
+        elif stmt_type == ForRangeStmt: names.add(stmt.name.lexeme)
+        elif stmt_type in (GotoStmt, Label): jumps = True
+        statements.extend(substatements(stmt))
+        expressions.extend(statement_expressions(stmt))
+
+    while len(expressions) > 0:
+        expr = expressions.pop()
+        if type(expr) == AssignExpr: names.add(expr.name.lexeme)
+        expressions.extend(subexpressions(expr))
+
+    return names, jumps
+
+INVARIANT_EXPRESSIONS = (LiteralExpr, VariableExpr, BinaryExpr, UnaryExpr, FactorialExpr, TernaryExpr, SubscriptExpr) # No calls, input or assignments
+
+def is_invariant(expr : Expr, written : set[str]) -> bool: # Whether expr has the same value every time a loop that writes these names evaluates it
+    pending = [expr]
+    while len(pending) > 0:
+        node = pending.pop()
+        if type(node) not in INVARIANT_EXPRESSIONS: return False
+        if type(node) == VariableExpr and node.name.lexeme in written: return False
+        pending.extend(subexpressions(node))
+    return True
+
+def int_literal(expr : Expr) -> int | None:
+    if type(expr) == LiteralExpr and expr.token.type == T_INT: return expr.token.value
+    if type(expr) == UnaryExpr and expr.operator.type == T_MINUS:
+        value = int_literal(expr.right)
+        if value != None: return -value
+    return None
+
+def counter_step(step : Expr, name : str) -> int | None: # How much 'i = i + 1', 'i = i - 1' or 'i += 1' moves the counter, None for anything else
+    if type(step) != AssignExpr or step.name.lexeme != name: return None
+
+    operator = step.operand.type
+    if operator in (T_PLUS_ASSIGN, T_MINUS_ASSIGN):
+        amount = int_literal(step.value)
+        if amount == None: return None
+        return amount if operator == T_PLUS_ASSIGN else -amount
+
+    value = step.value
+    if operator != T_EQ or type(value) != BinaryExpr or value.operator.type not in (T_PLUS, T_MINUS): return None
+
+    is_counter = lambda expr: type(expr) == VariableExpr and expr.name.lexeme == name
+    if is_counter(value.left) and int_literal(value.right) != None:
+        amount = int_literal(value.right)
+        return amount if value.operator.type == T_PLUS else -amount
+    if value.operator.type == T_PLUS and is_counter(value.right) and int_literal(value.left) != None:
+        return int_literal(value.left)
+    return None
+
+def counted_loop(stmt : ForStmt) -> tuple[Token, Expr, Expr, int] | None: # The counter, start, end and step of 'for $i = start, i < end, i = i + step', if the loop is one
+    initializer = stmt.initializer
+    if type(initializer) != VarDeclStmt or initializer.initializer == None: return None
+    name = initializer.name.lexeme
+
+    condition = stmt.condition
+    if type(condition) != BinaryExpr or condition.operator.type not in (T_LT, T_GT): return None
+    if type(condition.left) != VariableExpr or condition.left.name.lexeme != name: return None
+
+    step = counter_step(stmt.step, name)
+    if step == None or step == 0: return None
+    if (step > 0) != (condition.operator.type == T_LT): return None # Counting away from the end never stops, leave that to the plain loop
+
+    written, jumps = loop_writes(stmt.body)
+    if jumps or not is_invariant(condition.right, written | {name}): return None
+
+    return initializer.name, initializer.initializer, condition.right, step
+
+### Loop invariant code motion ###
+
+HOISTED_EXPRESSIONS = (BinaryExpr, UnaryExpr, FactorialExpr, TernaryExpr, SubscriptExpr) # Worth computing once, a lone variable or literal is already one instruction
+
+def expression_key(expr : Expr) -> tuple: # Equal for expressions that are written the same, so they can share one hoisted value
+    key = []
+    pending = [expr]
+    while len(pending) > 0: # Every expression type has a fixed number of children, so the order alone tells them apart
+        node = pending.pop()
+        node_type = type(node)
+        if node_type == LiteralExpr: key.append((node_type, node.token.type, node.token.lexeme))
+        elif node_type == VariableExpr: key.append((node_type, node.name.lexeme))
+        elif node_type in (BinaryExpr, UnaryExpr): key.append((node_type, node.operator.type))
+        else: key.append((node_type,))
+        pending.extend(reversed(subexpressions(node)))
+    return tuple(key)
+
+def has_input(expr : Expr) -> bool:
+    pending = [expr]
+    while len(pending) > 0:
+        node = pending.pop()
+        if type(node) == InputExpr: return True
+        pending.extend(subexpressions(node))
+    return False
+
+def is_literal_sign(expr : Expr) -> bool: # Like -1, which already compiles to a constant and one instruction at most
+    return type(expr) == UnaryExpr and type(expr.right) == LiteralExpr
+
+def invariant_parts(expr : Expr, written : set[str]) -> list[Expr]: # The largest parts of expr that are invariant and worth hoisting, never a branch of a ternary that might not run
+    order = []
+    pending = [expr]
+    while len(pending) > 0: # Parents come before their children
+        node = pending.pop()
+        order.append(node)
+        pending.extend(subexpressions(node))
+
+    invariant = {}
+    for node in reversed(order):
+        node_type = type(node)
+        if node_type not in INVARIANT_EXPRESSIONS: invariant[id(node)] = False
+        elif node_type == VariableExpr: invariant[id(node)] = node.name.lexeme not in written
+        else: invariant[id(node)] = all(invariant[id(child)] for child in subexpressions(node))
+
+    parts = []
+    pending = [expr]
+    while len(pending) > 0:
+        node = pending.pop()
+        if invariant[id(node)] and type(node) in HOISTED_EXPRESSIONS and not is_literal_sign(node): parts.append(node)
+        elif type(node) == TernaryExpr: pending.append(node.condition)
+        elif type(node) != LambdaExpr: pending.extend(subexpressions(node))
+    return parts
+
+def loop_invariants(stmt : Stmt, fused : bool = False) -> list[Expr]: # What can be computed once before a loop instead of on every iteration
+    # Only what every iteration evaluates first is taken, so nothing runs that the loop would not have run:
+    # the condition, and the body's statements up to the first one that prints, reads input or branches
+    # fused is for loops compiled to OP_FOR_RANGE, which check their condition and step themselves
+    stmt_type = type(stmt)
+    condition = stmt.condition if stmt_type in (WhileStmt, ForStmt) else None
+    step = stmt.step if stmt_type == ForStmt else None
+
+    written, jumps = loop_writes(stmt.body, condition, step)
+    if jumps: return [] # A goto could run the body without passing the computed values
+    if stmt_type == ForRangeStmt: written.add(stmt.name.lexeme)
+
+    expressions = [condition] if condition != None and not fused else []
+    body = stmt.body.statements if type(stmt.body) == Block else [stmt.body]
+    for inner in body:
+        inner_type = type(inner)
+        if inner_type not in (ExprStmt, VarDeclStmt, PrintStmt, IfStmt): break
+        own = statement_expressions(inner)
+        if any(has_input(expr) for expr in own): break
+        expressions.extend(own)
+        if inner_type in (PrintStmt, IfStmt): break # Its expressions run before it prints or branches, what follows may not run
+
+    parts = []
+    for expr in expressions:
+        parts.extend(invariant_parts(expr, written))
+    return parts
+
+### Type inference ###
+# Flow sensitive: follows the statements in order, so an assignment changes what a name holds from there on
+# A type is T_INT, T_FLOAT or None for anything else, or not known. Where paths meet, after an if or at the top of a loop, a name keeps its type only if every path agrees
+# The results go on the nodes, as the operand_type of binary expressions and compound assignments, for the compiler to pick typed instructions
+
+NUMBERS = (T_INT, T_FLOAT)
+ARITHMETIC = (T_PLUS, T_MINUS, T_STAR, T_PERCENT, T_CARET) # Two ints give an int, otherwise a float
+COMPOUND_OPERATORS = {T_PLUS_ASSIGN: T_PLUS, T_MINUS_ASSIGN: T_MINUS, T_STAR_ASSIGN: T_STAR, T_SLASH_ASSIGN: T_SLASH, T_PERCENT_ASSIGN: T_PERCENT, T_CARET_ASSIGN: T_CARET}
+
+def join_types(a : int | None, b : int | None) -> int | None: return a if a == b else None
+
+def shared_type(left : int | None, right : int | None) -> int | None: # The type both operands have, if it is a number
+    return left if left == right and left in NUMBERS else None
+
+def result_type(operator : int, left : int | None, right : int | None) -> int | None: # What the runtime gives for two numbers
+    if left not in NUMBERS or right not in NUMBERS: return None
+    if operator == T_SLASH: return T_FLOAT
+    if operator in ARITHMETIC: return T_INT if left == T_INT and right == T_INT else T_FLOAT
+    return None # Comparisons and logic give booleans
+
+class Types: # What every name in scope holds at one point, the scopes follow the compiler's so a name finds the same variable
+    def __init__(self, scopes : list[dict[str, int | None]], reachable : bool = True):
+        self.scopes = scopes
+        self.reachable = reachable # False after a break, continue or goto, until a label
+
+    def copy(self, depth : int = -1): # depth keeps only that many scopes, for jumps out of inner ones
+        scopes = self.scopes if depth < 0 else self.scopes[:depth]
+        return Types([dict(scope) for scope in scopes], self.reachable)
+
+    def lookup(self, name : str) -> int | None:
+        for scope in reversed(self.scopes):
+            if name in scope: return scope[name]
+        return None
+
+    def assign(self, name : str, value_type : int | None):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                scope[name] = value_type
+                return
+        self.scopes[0][name] = value_type # An undeclared global, the runtime fails before anything reads it
+
+    def declare(self, name : str, value_type : int | None): self.scopes[-1][name] = value_type
+
+    def forget(self, names = None): # None forgets every name
+        for scope in self.scopes:
+            for name in scope:
+                if names == None or name in names: scope[name] = None
+
+def join(*paths : Types) -> Types: # What holds where the paths meet, paths that are never taken do not count
+    reached = [path for path in paths if path.reachable]
+    if len(reached) == 0: return paths[0].copy()
+
+    joined = reached[0].copy()
+    for path in reached[1:]:
+        for scope, other in zip(joined.scopes, path.scopes):
+            for name in scope.keys() | other.keys():
+                scope[name] = join_types(scope.get(name), other.get(name))
+    return joined
+
+def expression_type(expr : Expr, types : Types, conditional : bool = False) -> int | None:
+    # The type of expr, assignments in it update types as they happen
+    # conditional is for expressions that might not run, like the branches of a ternary, an assignment there leaves the name unknown
+    results = {}
+    reads = {} # What a compound assignment's name held before its value ran
+    pending = [(expr, conditional, False)]
+    while len(pending) > 0: # Children before their parents, in the order they run
+        node, conditional, ready = pending.pop()
+        node_type = type(node)
+
+        if not ready:
+            pending.append((node, conditional, True))
+            if node_type == TernaryExpr: children = [(node.condition, conditional), (node.if_branch, True), (node.else_branch, True)]
+            elif node_type == LambdaExpr: children = [] # Its body runs when it is called
+            else: children = [(child, conditional) for child in subexpressions(node)]
+            if node_type == AssignExpr: reads[id(node)] = types.lookup(node.name.lexeme)
+            pending.extend((child, flag, False) for child, flag in reversed(children) if child != None)
+            continue
+
+        result = None
+        if node_type == LiteralExpr:
+            if node.token.type in NUMBERS: result = node.token.type
+        elif node_type == VariableExpr:
+            result = types.lookup(node.name.lexeme)
+        elif node_type == BinaryExpr:
+            left, right = results[id(node.left)], results[id(node.right)]
+            node.operand_type = shared_type(left, right)
+            result = result_type(node.operator.type, left, right)
+        elif node_type == UnaryExpr:
+            right = results[id(node.right)]
+            if node.operator.type in (T_MINUS, T_PLUS) and right in NUMBERS: result = right
+        elif node_type == FactorialExpr:
+            if results[id(node.expr)] == T_INT: result = T_INT
+        elif node_type == TernaryExpr:
+            result = join_types(results[id(node.if_branch)], None if node.else_branch == None else results[id(node.else_branch)])
+        elif node_type == AssignExpr:
+            value = results[id(node.value)]
+            operator = COMPOUND_OPERATORS.get(node.operand.type)
+            if operator == None:
+                node.operand_type = None
+                result = value
+            else:
+                node.operand_type = shared_type(reads[id(node)], value)
+                result = result_type(operator, reads[id(node)], value)
+            types.assign(node.name.lexeme, None if conditional else result)
+        elif node_type == CallExpr: # The lambda may assign anything it can see
+            types.forget()
+        results[id(node)] = result
+    return results[id(expr)]
+
+SPECULATIVE_DEPTH = 4 # Loops nested deeper than this give up on a name's type as soon as the loop changes it
+
+class TypeInference:
+    def __init__(self):
+        self.types = Types([{}]) # The global scope
+        self.loops : list[tuple[int, list[Types], list[Types]]] = [] # For each loop around, its scope depth and where its breaks and continues left from
+
+    def run(self, statements : list[Stmt]): # Statements that nest are generators yielding the work of their children, run here on an explicit stack like Compiler.visit
+        for stmt in statements:
+            work = self.walk(stmt)
+            if type(work) != GeneratorType: continue
+
+            stack = [work]
+            while len(stack) > 0:
+                try:
+                    work = next(stack[-1])
+                except StopIteration:
+                    stack.pop()
+                    continue
+                if type(work) == GeneratorType: stack.append(work)
+
+    def walk(self, stmt : Stmt):
+        stmt_type = type(stmt)
+        if stmt_type == Block: return self.walk_block(stmt)
+        if stmt_type == IfStmt: return self.walk_if(stmt)
+        if stmt_type in (WhileStmt, ForStmt, ForeverStmt): return self.walk_loop(stmt)
+        if stmt_type == ForRangeStmt: return self.walk_range(stmt)
+
+        if stmt_type == VarDeclStmt:
+            value_type = None if stmt.initializer == None else expression_type(stmt.initializer, self.types)
+            self.types.declare(stmt.name.lexeme, value_type)
+        elif stmt_type in (BreakStmt, ContinueStmt):
+            if len(self.loops) > 0:
+                depth, breaks, continues = self.loops[-1]
+                (breaks if stmt_type == BreakStmt else continues).append(self.types.copy(depth))
+            self.types.reachable = False
+        elif stmt_type == GotoStmt:
+            self.types.reachable = False
+        elif stmt_type == Label: # Any goto may land here
+            self.types.forget()
+            self.types.reachable = True
+        else:
+            for expr in statement_expressions(stmt):
+                expression_type(expr, self.types)
+
+    def walk_block(self, block : Block):
+        if not block.needs_scope: # Nothing to declare, and copies stay short in deeply nested code
+            for stmt in block.statements:
+                yield self.walk(stmt)
+            return
+
+        self.types.scopes.append({})
+        for stmt in block.statements:
+            yield self.walk(stmt)
+        self.types.scopes.pop()
+
+    def walk_body(self, body : Stmt): # Loops compile their body in a scope of its own, a block adds its own only if it declares something
+        if type(body) == Block:
+            yield self.walk(body)
+            return
+        self.types.scopes.append({})
+        yield self.walk(body)
+        self.types.scopes.pop()
+
+    def walk_if(self, stmt : IfStmt):
+        expression_type(stmt.condition, self.types)
+        before = self.types
+        self.types = before.copy()
+        yield self.walk(stmt.if_branch)
+        after_if = self.types
+
+        self.types = before
+        if stmt.else_branch != None:
+            yield self.walk(stmt.else_branch)
+        self.types = join(after_if, self.types)
+
+    def walk_loop(self, stmt : WhileStmt | ForStmt | ForeverStmt):
+        stmt_type = type(stmt)
+        condition = stmt.condition if stmt_type != ForeverStmt else None
+        step = stmt.step if stmt_type == ForStmt else None
+        if stmt_type == ForStmt and stmt.initializer != None:
+            yield self.walk(stmt.initializer)
+
+        head = self.types.copy() # What holds each time the condition is checked
+        widening = self.widening()
+        for attempt in range(len(widening) + 1):
+            self.types = head.copy()
+            if condition != None: expression_type(condition, self.types)
+            checked = self.types.copy()
+
+            depth = len(self.types.scopes)
+            breaks, continues = [], []
+            self.loops.append((depth, breaks, continues))
+            yield from self.walk_body(stmt.body)
+            self.loops.pop()
+
+            self.types = join(self.types, *continues)
+            if step != None: expression_type(step, self.types)
+
+            following = join(head, self.types)
+            if following.scopes == head.scopes: break
+            if attempt < len(widening): head = self.widen(following, widening[attempt], stmt.body, condition, step)
+
+        if condition == None: checked.reachable = False # Only a break leaves it
+        self.types = join(checked, *breaks)
+
+    def walk_range(self, stmt : ForRangeStmt):
+        start = expression_type(stmt.start, self.types)
+        self.types.scopes.append({})
+        self.types.declare(stmt.name.lexeme, start)
+        expression_type(stmt.end, self.types)
+        step = T_INT if stmt.step == None else expression_type(stmt.step, self.types)
+
+        head = self.types.copy()
+        widening = self.widening()
+        for attempt in range(len(widening) + 1):
+            self.types = head.copy()
+
+            depth = len(self.types.scopes)
+            breaks, continues = [], []
+            self.loops.append((depth, breaks, continues))
+            yield from self.walk_body(stmt.body)
+            self.loops.pop()
+
+            self.types = join(self.types, *continues)
+            counter = self.types.lookup(stmt.name.lexeme)
+            self.types.assign(stmt.name.lexeme, result_type(T_PLUS, counter, step)) # OP_FOR_RANGE adds the step
+
+            following = join(head, self.types)
+            if following.scopes == head.scopes: break
+            if attempt < len(widening): head = self.widen(following, widening[attempt], stmt.body, stmt.name)
+
+        self.types = join(head, *breaks)
+        self.types.scopes.pop()
+
+    def widening(self) -> list[str]:
+        # What each pass over a loop that changed what its names hold starts from, the last one cannot change again:
+        # where the paths met, then with every name the loop writes unknown, then with every name unknown
+        # Every pass goes over the loops inside again, so deeply nested loops skip the first step
+        if len(self.loops) < SPECULATIVE_DEPTH: return ["join", "written", "all"]
+        return ["written", "all"]
+
+    def widen(self, types : Types, how : str, body : Stmt, *extra) -> Types:
+        if how == "written":
+            written, _ = loop_writes(body, *[expr for expr in extra if isinstance(expr, Expr)])
+            written |= {token.lexeme for token in extra if isinstance(token, Token)}
+            types.forget(written)
+        elif how == "all":
+            types.forget()
+        return types
+
+def infer_types(statements : list[Stmt]): # Sets operand_type on every binary expression and compound assignment the statements run
+    TypeInference().run(statements)
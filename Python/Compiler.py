@@ -1,21 +1,27 @@
-import pathlib
+from Analysis import counted_loop, expression_key, infer_types, loop_invariants
 from Enum import iota
 from Error import ErrorReporter
+from Flow import MAX_STACK_SIZE, FlowReport, StackError, max_stack_depth, optimize
 from Nodes import *
-from Token import Token
+from Token import Token, SymbolTable
 from Globals import COMPILER_DEBUG
 from Opcodes import *
+from Registers import RegisterReport, lower
+from Switch import MIN_ARMS, SWITCH_INTS, SWITCH_STRINGS, int_table, string_table, write_distances
 
 ### Headers ###
 HEADER0 = 0xFA
 HEADER1 = 0xCC
+CODE_START = 4 # After the header and the two bytes of stack size
 
 import struct
+from types import GeneratorType
 
 ### Value types ###
 V_INT = iota(True)
 V_FLOAT = iota()
 V_STRING = iota()
+V_GLOBAL = iota() # Not a constant, names a global slot, see Chunk.as_bytes
 
 class Value:
     def __init__(self, type : int = V_INT, bytes_ : bytes = None):
@@ -51,6 +57,7 @@ class Chunk:
     def __init__(self):
         self.code : list[int] = []
         self.constants : list[Value] = []
+        self.globals : list[int] = [] # The constant index of each global slot's name, for errors
 
     @property
     def code_length(self): return len(self.code)
@@ -68,6 +75,9 @@ class Chunk:
 
         for constant in constants:
             bytecode.append(constant)
+
+        for name in self.globals: # After the constants, so the names are there already
+            bytecode.extend((V_GLOBAL, name & 0xff, (name >> 8) & 0xff, (name >> 16) & 0xff))
         
         bytecode.extend(self.code)
         return bytecode
@@ -90,7 +100,13 @@ class Chunk:
 
     def emit_const_w_count(self, count : int): self.emit_byte(OP_CONSTANT if count < 256 else OP_CONSTANT_LONG)
 
-    def emit_header(self): self.emit_bytes(HEADER0, HEADER1)
+    def emit_operand(self, index : int): # The tag tells the VM how many bytes the index takes, so it has to follow the index and not the pool size
+        self.emit_const_w_count(index)
+        self.emit_1_or_3(index)
+
+    def emit_header(self): self.emit_bytes(HEADER0, HEADER1, 0xFF, 0xFF) # The stack size is patched in once the code is final
+
+    def patch_stack_size(self, size : int): self.code[2:CODE_START] = [size & 0xff, (size >> 8) & 0xff]
 
     def emit_jump(self, instruction : int):
         self.emit_byte(instruction)
@@ -141,37 +157,77 @@ def clog(message, end = '\n', debug = False): # Prints only if debug is enabled
     if debug:
         print(message, end = end)
     
+### Optimization levels ###
+# 0 compiles every statement as written
+# 1 runs counted three clause for loops on OP_FOR_RANGE, removes unreachable code and branches on constants, see Flow.py,
+#   uses typed arithmetic where both operands are known to be ints or floats, see Analysis.infer_types,
+#   and turns else if chains that compare one variable to int or string constants into an OP_SWITCH, see Switch.py
+# 2 also computes loop invariant expressions once before their loop and drops stores to globals that are never read
+DEFAULT_OPT_LEVEL = 1
+MAX_OPT_LEVEL = 2
+
+TYPED_OPS = { # Generic instruction and the type of both operands to the instruction that skips the type checks
+    (OP_ADD, T_INT): OP_ADD_II, (OP_SUB, T_INT): OP_SUB_II, (OP_MUL, T_INT): OP_MUL_II, (OP_MOD, T_INT): OP_MOD_II,
+    (OP_EQ, T_INT): OP_EQ_II, (OP_LT, T_INT): OP_LT_II, (OP_GT, T_INT): OP_GT_II,
+    (OP_ADD, T_FLOAT): OP_ADD_FF, (OP_SUB, T_FLOAT): OP_SUB_FF, (OP_MUL, T_FLOAT): OP_MUL_FF,
+    (OP_LT, T_FLOAT): OP_LT_FF, (OP_GT, T_FLOAT): OP_GT_FF, # Float equality stays generic, it compares as ints
+}
+
 class Compiler(Visitor):
-    def __init__(self, statements : list[Stmt], debug = False):
+    def __init__(self, statements : list[Stmt], symbols : SymbolTable, debug = False, opt_level : int = DEFAULT_OPT_LEVEL, registers : bool = False):
         self.statements = statements
+        self.symbols = symbols # The table the statements were lexed with
         self._chunk = Chunk()
 
-        self.interned_strings : dict[str, int] = {}
+        self.interned_strings : dict[int, int] = {} # Symbol id to constant index
+        self.int_constants : dict[int, int] = {} # Ints the register code needs as constants, to their index
+        self.global_slots : dict[int, int] = {} # Symbol id to global slot
 
         self.locals = []
         self.local_count = 0
         self.scope_depth = 0
 
-        self.break_position = -1
-        self.continue_position = -1
+        self.breaks : list[int] = [] # Jumps of the innermost loop's breaks and continues that still need patching
+        self.continues : list[int] = []
+        self.outer_jumps : list[tuple[list[int], list[int], int]] = [] # Those of the loops around it, with their scope depths
 
         self.inner_loop_start = -1
         self.inner_loop_end = -1
-        self.inner_loop_scope_depth = 0
-        self.breaking = False
-        self.continuing = False
+        self.inner_loop_scope_depth = 0 # Locals deeper than this are popped by a break or continue, they are not on the stack where it lands
         
         self.label_addrs : dict[str, int] = {}
         self.gotos : list[tuple[str, int]] = [] # List of gotos that require patching using their index in the code
 
         self.continue_type = OP_LOOP # Because continue in for loops can jump either forwards or backwards, but typically it jumps back to the top
 
+        self.opt_level = opt_level
+        self.hoisted : dict[int, int] = {} # Id of an expression computed before its loop to the hidden local holding it
+        self.hoisted_count = 0
+        self.flow_report : FlowReport | None = None # What the bytecode pass removed, None if it did not run
+        self.typed_count = 0 # Typed instructions emitted
+        self.switch_count = 0 # Else if chains compiled to OP_SWITCH
+
+        self.registers = registers # Lower the finished code to register code, see Registers.py
+        self.register_report : RegisterReport | None = None
+
         self.debug = debug
 
     @property
     def chunk(self): return self._chunk
 
-    def visit(self, expr : Expr | Stmt): expr.accept(self)
+    def visit(self, node : Expr | Stmt): # Visitors of nodes that nest are generators, they yield the work of their children to be run here on an explicit stack
+        work = node.accept(self)
+        if type(work) != GeneratorType: return
+
+        stack = [work]
+        while len(stack) > 0:
+            try:
+                work = next(stack[-1])
+            except StopIteration: # That visitor is done
+                stack.pop()
+                continue
+
+            if type(work) == GeneratorType: stack.append(work)
 
     # Variable methods
     def begin_scope(self): self.scope_depth += 1
@@ -181,20 +237,23 @@ class Compiler(Visitor):
         while self.local_count > 0 and self.locals[self.local_count - 1]["depth"] > self.scope_depth: # Pop all the locals at the end of the scope
             clog("End scope pop", debug = self.debug)
             self.chunk.emit_pop()
+            self.locals.pop() # So the next local takes this one's slot
             self.local_count -= 1
 
     def add_local(self, name : Token):
         local = {
             "name": name,
+            "symbol": self.symbol(name),
             "depth": -1 # -1 means not ready for use
         }
         self.locals.append(local)
         self.local_count += 1
 
     def resolve_local(self, name : Token):
+        symbol = self.symbol(name)
         for i in range(self.local_count - 1, -1, -1):
             local = self.locals[i]
-            if (local["name"].lexeme == name.lexeme):
+            if (local["symbol"] == symbol):
                 if local["depth"] == -1:
                     ErrorReporter.resolve_error(name, "Cannot read a variable in its own initializer")
                 return i
@@ -203,97 +262,145 @@ class Compiler(Visitor):
     def parse_variable(self, name : Token) -> int:
         self.declare_variable(name)
         if self.scope_depth > 0: return 0
-        return self.identifier_constant(name)
+        return self.global_slot(name)
 
     def mark_initialized(self):
         self.locals[self.local_count - 1]["depth"] = self.scope_depth
 
     def identifier_constant(self, name : Token) -> int: # Add name to the constant pool and return its index
-        new, index = self.register_string(name.lexeme)
+        new, index = self.register_string(self.symbol(name))
         if new:
             self.chunk.add_value(Value.init_string(name.lexeme))
         return index
 
-    def define_variable(self, global_idx : int):
+    def global_slot(self, name : Token) -> int: # Globals are numbered in the order they first appear
+        symbol = self.symbol(name)
+        slot = self.global_slots.get(symbol, -1)
+        if slot == -1:
+            slot = self.global_slots[symbol] = len(self.chunk.globals)
+            self.chunk.globals.append(self.identifier_constant(name))
+        return slot
+
+    def define_variable(self, global_slot : int):
         if (self.scope_depth > 0):
             self.mark_initialized()
             return
 
-        self.chunk.emit_byte(OP_DEFINE_GLOBAL)
-        self.chunk.emit_const_w_count(self.chunk.constant_count)
-        self.chunk.emit_1_or_3(global_idx)
+        self.chunk.emit_byte(OP_DEFINE_GLOBAL_SLOT)
+        self.chunk.emit_operand(global_slot)
 
     def declare_variable(self, name : Token):
         if (self.scope_depth == 0): return
 
+        symbol = self.symbol(name)
         for i in range(self.local_count - 1, -1, -1):
             local = self.locals[i]
 
             # If the variable already exists and is in an outer scope we can declare the variable
             if local["depth"] != -1 and local["depth"] < self.scope_depth: break
 
-            if name.lexeme == local["name"].lexeme:
+            if symbol == local["symbol"]:
                 ErrorReporter.resolve_error(name, f"Variable '{name.lexeme}' has already been declared in this scope")
 
         self.add_local(name)
 
-    def named_variable(self, name : Token, is_assign : bool = False):
-        get_op, set_op = OP_GET_GLOBAL, OP_SET_GLOBAL
+    def get_local(self, slot : int):
+        self.chunk.emit_byte(OP_GET_LOCAL)
+        self.chunk.emit_operand(slot)
 
+    def named_variable(self, name : Token, is_assign : bool = False):
         arg = self.resolve_local(name)
  
         if arg != -1:
             get_op = OP_GET_LOCAL
             set_op = OP_SET_LOCAL
         else:
-            arg = self.identifier_constant(name)
-            get_op = OP_GET_GLOBAL
-            set_op = OP_SET_GLOBAL
+            arg = self.global_slot(name)
+            get_op = OP_GET_GLOBAL_SLOT
+            set_op = OP_SET_GLOBAL_SLOT
         
         if is_assign:
             self.chunk.emit_byte(set_op)
         else:
             self.chunk.emit_byte(get_op)
-        self.chunk.emit_const_w_count(self.chunk.constant_count)
-        self.chunk.emit_1_or_3(arg)
-
-    def write(self, path : str):
-        bytecode = self.chunk.as_bytes
-
-        # TODO: write to file
+        self.chunk.emit_operand(arg)
 
+    def write(self, path : str, bytecode : bytes):
         with open(path, "wb") as f:
-           f.write(bytes(bytecode))
+           f.write(bytecode)
 
     def dump(self): self.chunk.dump(self.chunk.as_bytes, self.debug)
 
-    def compile(self, path : str):
+    def assemble(self) -> bytes | None: # Compiles the statements and returns the .timb contents, or None if there were errors
         self.chunk.emit_header()
 
+        if self.opt_level >= 1: infer_types(self.statements)
+
         for stmt in self.statements: self.visit(stmt)
 
         self.chunk.emit_end()
 
-        if ErrorReporter.HAD_ERROR: return
-
-        self.dump()
+        if ErrorReporter.HAD_ERROR: return None
 
         if len(self.gotos) > 0: # If we still have gotos that require patching then raise error
             # TODO: track the corresponding goto
             ErrorReporter.compile_error(self.statements[-1], "Unmatched goto")
-            return
+            return None
+
+        if self.opt_level >= 1: # Every jump is patched, so the control flow is known
+            names = {slot: self.symbols.names[symbol] for symbol, slot in self.global_slots.items()}
+            self.chunk.code, self.flow_report = optimize(self.chunk.code, CODE_START, names, self.opt_level >= 2)
+
+        try: # The VM makes its stack exactly this deep and checks the code against it when it loads the file
+            depth = max_stack_depth(self.chunk.code, CODE_START)
+        except StackError as e:
+            ErrorReporter.compile_error(self.statements[-1], f"Compiled code the VM would reject, {e}")
+            return None
+        if depth > MAX_STACK_SIZE:
+            ErrorReporter.compile_error(self.statements[-1], "Too many values on the stack at once")
+            return None
+        self.chunk.patch_stack_size(depth)
+
+        if self.registers: # Last, the stack code is final
+            self.chunk.code, self.register_report = lower(self.chunk.code, CODE_START, self.int_constant)
+
+        self.dump()
 
-        self.write(path)
         assert not COMPILER_DEBUG, "Still in debug mode"
+        return bytes(self.chunk.as_bytes)
+
+    def opt_report(self) -> list[str]: # What the optimizations did, for --opt-report
+        lines = [] if self.flow_report == None else self.flow_report.lines()
+        if self.typed_count > 0: lines.append(f"emitted {self.typed_count} typed arithmetic and comparison instructions")
+        if self.hoisted_count > 0: lines.append(f"computed {self.hoisted_count} loop invariant values before their loops")
+        if self.switch_count > 0: lines.append(f"turned {self.switch_count} else if chains into switches")
+        if self.register_report != None: lines.extend(self.register_report.lines())
+        return lines
 
-    def register_string(self, string : str): # For string interning optimisation, returns true if the string is unique and new
-        if string not in self.interned_strings.keys(): # If new string
-            self.interned_strings[string] = self.chunk.constant_count
+    def compile(self, path : str):
+        bytecode = self.assemble()
+
+        if bytecode == None: return
+
+        self.write(path, bytecode)
+
+    def symbol(self, token : Token) -> int:
+        if token.symbol < 0: return self.symbols.intern(token.lexeme) # Made up tokens were never interned
+        return token.symbol
+
+    def register_string(self, symbol : int): # For string interning optimisation, returns true if the string is unique and new
+        if symbol not in self.interned_strings: # If new string
+            self.interned_strings[symbol] = self.chunk.constant_count
             return (True, self.chunk.constant_count) # Return index of string in constant pool
-        return (False, self.interned_strings[string]) # Otherwise return the index of the furst string in the constant pool
+        return (False, self.interned_strings[symbol]) # Otherwise return the index of the furst string in the constant pool
+
+    def int_constant(self, value : int) -> int: # For ints that have their own push instruction in stack code but not in register code
+        index = self.int_constants.get(value, -1)
+        if index == -1: index = self.int_constants[value] = self.chunk.add_value(Value(V_INT, struct.pack('=q', value)))
+        return index
 
     def emit_empty_str(self):
-        new, index = self.register_string("") # There might not have been an empty string registered yet
+        new, index = self.register_string(self.symbols.intern("")) # There might not have been an empty string registered yet
         if new:
             self.chunk.add_value(Value.init_string("")) # If not then add it
         self.chunk.emit_const_w_count(index) # We shouldn't have to decide if we want to push it to the stack because there is no reason not to
@@ -305,41 +412,42 @@ class Compiler(Visitor):
             self.chunk.emit_const_w_count(index)
             self.chunk.emit_1_or_3(index)
 
-    def emit_string(self, string : str, with_instruction = True):
-        new, index = self.register_string(string) # Check for interned strings
+    def emit_string(self, token : Token, with_instruction = True):
+        new, index = self.register_string(self.symbol(token)) # Check for interned strings
 
         if new:
-            val = Value.init_string(string)
+            val = Value.init_string(token.lexeme)
             i = self.chunk.add_value(val) # Confirm that the string index matches the calculated index
             assert i == index, "WTF happened with string interning"
 
         if with_instruction:
             self.chunk.emit_const_w_count(index)
             self.chunk.emit_1_or_3(index)
+        return index
 
     def patch_break(self, stmt : Stmt): # Take statement position for error reporting
-        if self.breaking: # If we encountered a break statatement recently that hasnt been handled
-            jump_distance = self.inner_loop_end - self.break_position - 2 # Get jump size between the required position to jump to and the break instruction
+        for break_position in self.breaks: # Every break of the loop, not only the last one
+            jump_distance = self.inner_loop_end - break_position - 2 # Get jump size between the required position to jump to and the break instruction
 
             if jump_distance > 2**16 - 1:
                 ErrorReporter.compile_error(stmt, "Too much code to jump")
 
-            self.chunk.code[self.break_position] = jump_distance & 0xff # Little endian
-            self.chunk.code[self.break_position + 1] = (jump_distance >> 8) & 0xff
-            self.breaking = False # Turn of toggle to prevent overwriting the instruction
+            self.chunk.code[break_position] = jump_distance & 0xff # Little endian
+            self.chunk.code[break_position + 1] = (jump_distance >> 8) & 0xff
+        self.breaks.clear() # Prevent overwriting the instructions
 
     def patch_continue(self, stmt : Stmt, jump_pos : int = -1): # Take statement position for error reporting
-        if self.continuing: # If we encountered a continue statatement recently that hasnt been handled
-            if jump_pos == -1:
-                jump_pos = self.inner_loop_start
-            jump_distance = abs(jump_pos - self.continue_position - 2) # Get jump size
+        if jump_pos == -1:
+            jump_pos = self.inner_loop_start
+        for continue_position in self.continues:
+            jump_distance = abs(jump_pos - continue_position - 2) # Get jump size
 
             if jump_distance > 2**16 - 1:
                 ErrorReporter.compile_error(stmt, "Too much code to jump")
 
-            self.chunk.code[self.continue_position] = jump_distance & 0xff # Little endian
-            self.chunk.code[self.continue_position + 1] = (jump_distance >> 8) & 0xff
-            self.continuing = False # Turn of toggle to prevent overwriting the instruction
+            self.chunk.code[continue_position] = jump_distance & 0xff # Little endian
+            self.chunk.code[continue_position + 1] = (jump_distance >> 8) & 0xff
+        self.continues.clear()
 
     def patch_goto(self, stmt : Stmt, label_addr : int, goto_addr : int):
         distance = label_addr - goto_addr - 2 # Get distance between goto instruction index and label index
@@ -359,6 +467,9 @@ class Compiler(Visitor):
     def begin_loop(self):
         previous_start = self.inner_loop_start
         self.inner_loop_start = self.chunk.code_length
+        self.outer_jumps.append((self.breaks, self.continues, self.inner_loop_scope_depth))
+        self.breaks, self.continues = [], []
+        self.inner_loop_scope_depth = self.scope_depth
         return previous_start
 
     def end_loop(self):
@@ -369,34 +480,38 @@ class Compiler(Visitor):
     def exit_loop(self, previous_start, previous_end): # Resets positions, at the end of program should both be -1
         self.inner_loop_start = previous_start
         self.inner_loop_end = previous_end
+        self.breaks, self.continues, self.inner_loop_scope_depth = self.outer_jumps.pop()
 
     ### Statements ###
 
     def visitBlock(self, block: Block):
+        if not block.needs_scope: # Nothing to declare, so nothing to pop either
+            for stmt in block.statements:
+                yield stmt.accept(self)
+            return
+
         previous_depth = self.scope_depth
         self.begin_scope()
         assert self.scope_depth == previous_depth + 1, "Error in creating new scope"
         for stmt in block.statements:
-            self.visit(stmt)
+            yield stmt.accept(self)
         self.end_scope()
 
     def visitBreakStmt(self, stmt: BreakStmt):
         if self.inner_loop_start == -1:
             ErrorReporter.compile_error(stmt, "Break statement outside of loop")
         for i in range(self.local_count - 1, -1, -1): # Discard loop locals
-            if self.locals[i]["depth"] <= self.scope_depth: break
+            if self.locals[i]["depth"] <= self.inner_loop_scope_depth: break
             self.chunk.emit_pop()
-        self.break_position = self.chunk.emit_jump(OP_JUMP)
-        self.breaking = True # Set to true to allow for patching
+        self.breaks.append(self.chunk.emit_jump(OP_JUMP)) # Patched when the loop ends
 
     def visitContinueStmt(self, stmt: ContinueStmt):
         if self.inner_loop_start == -1:
             ErrorReporter.compile_error(stmt, "Continue statement outside of loop")
         for i in range(self.local_count - 1, -1, -1):
-            if self.locals[i]["depth"] <= self.scope_depth: break
+            if self.locals[i]["depth"] <= self.inner_loop_scope_depth: break
             self.chunk.emit_pop()
-        self.continue_position = self.chunk.emit_jump(self.continue_type)
-        self.continuing = True
+        self.continues.append(self.chunk.emit_jump(self.continue_type))
 
     def visitExprStmt(self, stmt: ExprStmt):
         self.visit(stmt.expr)
@@ -404,12 +519,23 @@ class Compiler(Visitor):
         self.chunk.emit_pop()
 
     def visitForStmt(self, stmt: ForStmt):
+        counted = counted_loop(stmt) if self.opt_level >= 1 else None
+        if counted != None: # for $i = start, i < end, i = i + step
+            name, start, end, step = counted
+            yield from self.range_loop(stmt, name, start, end, step, True)
+            return
+
         if stmt.initializer != None:
-            self.visit(stmt.initializer)
+            yield stmt.initializer.accept(self)
+
+        invariants = loop_invariants(stmt) if self.opt_level >= 2 else []
+        if len(invariants) > 0:
+            yield from self.hoisting_loop(stmt, stmt.condition, stmt.step, invariants)
+            return
 
         previous_continue_type = self.continue_type
-        if stmt.step != None: # If there is a step, it will be at the very end of the body, and in a for loop, continue should jump to the step statement before looping
-            self.continue_type = OP_JUMP
+        # If there is a step, it will be at the very end of the body, and in a for loop, continue should jump to the step statement before looping
+        self.continue_type = OP_JUMP if stmt.step != None else OP_LOOP # An outer loop's type must not leak in
 
         previous_start = self.begin_loop()
         previous_depth = self.scope_depth
@@ -417,7 +543,7 @@ class Compiler(Visitor):
         exit_jump = -1
 
         if stmt.condition != None:
-            self.visit(stmt.condition)
+            yield stmt.condition.accept(self)
 
             exit_jump = self.chunk.emit_jump(OP_JUMP_IF_FLS)
             clog("For stmt condition pop", debug = self.debug)
@@ -425,13 +551,13 @@ class Compiler(Visitor):
 
         self.begin_scope()
 
-        self.visit(stmt.body)
+        yield stmt.body.accept(self)
 
         continue_pos = -1
 
         if stmt.step != None:
             continue_pos = self.chunk.code_length # If there is a step the VM needs to know where to go for the step in the case of a continue
-            self.visit(stmt.step)
+            yield stmt.step.accept(self)
             self.chunk.emit_pop()
         
         self.chunk.emit_loop(stmt.body, self.inner_loop_start)
@@ -453,12 +579,83 @@ class Compiler(Visitor):
 
         self.continue_type = previous_continue_type
 
+    def visitForRangeStmt(self, stmt: ForRangeStmt):
+        yield from self.range_loop(stmt, stmt.name, stmt.start, stmt.end, stmt.step, False)
+
+    def range_loop(self, stmt : Stmt, name : Token, start : Expr, end : Expr, step : Expr | int | None, keep : bool):
+        # The counter, end and step are three locals in a row, OP_FOR_RANGE steps, compares and jumps back on them in one instruction
+        # keep leaves the counter declared after the loop like the three clause form does, at the top level it becomes a global again
+        own_scope = not keep or self.scope_depth == 0
+        if own_scope: self.begin_scope()
+
+        self.visit(start)
+        self.declare_variable(name)
+        self.mark_initialized()
+        slot = self.local_count - 1
+
+        self.begin_scope()
+        for hidden, value in ((" end", end), (" step", step)): # Names no identifier can have
+            if isinstance(value, Expr): self.visit(value)
+            elif value == None: self.chunk.emit_byte(OP_1)
+            else: self.emit_constant(Value(V_INT, struct.pack('=q', value)))
+            self.add_local(Token(T_IDENTIFIER, hidden, None, name.pos_start, name.pos_end))
+            self.mark_initialized()
+
+        previous_continue_type = self.continue_type
+        self.continue_type = OP_JUMP # Continue jumps ahead to OP_FOR_RANGE
+
+        self.chunk.emit_bytes(OP_FOR_PREP, slot & 0xff, (slot >> 8) & 0xff) # Checks the range and skips the loop if it is empty
+        exit_jump = self.chunk.code_length
+        self.chunk.emit_bytes(0xFF, 0xFF)
+
+        invariants = loop_invariants(stmt, True) if self.opt_level >= 2 else []
+        if len(invariants) > 0: # Only once the range is known not to be empty
+            self.begin_scope()
+            previous_hoisted = self.hoist(invariants)
+
+        previous_start = self.begin_loop()
+        yield stmt.body.accept(self)
+
+        continue_pos = self.chunk.code_length
+        self.chunk.emit_bytes(OP_FOR_RANGE, slot & 0xff, (slot >> 8) & 0xff)
+        loop_distance = self.chunk.code_length - self.inner_loop_start + 2
+        if loop_distance > 2**16 - 1:
+            ErrorReporter.compile_error(stmt.body, "Loop body too large")
+        self.chunk.emit_bytes(loop_distance & 0xff, (loop_distance >> 8) & 0xff)
+
+        previous_end = self.end_loop() # Breaks land before the end and step are popped
+
+        self.patch_break(stmt)
+        self.patch_continue(stmt, continue_pos)
+        self.exit_loop(previous_start, previous_end)
+        self.continue_type = previous_continue_type
+
+        if len(invariants) > 0:
+            self.end_scope()
+            self.hoisted = previous_hoisted
+        self.chunk.patch_jump(stmt, exit_jump) # An empty range skips the hoisted values too
+
+        self.end_scope()
+
+        if keep and own_scope: # Publish the final count as the global the plain loop would have left
+            self.get_local(slot)
+            self.chunk.emit_byte(OP_DEFINE_GLOBAL_SLOT)
+            self.chunk.emit_operand(self.global_slot(name))
+        if own_scope: self.end_scope()
+
     def visitForeverStmt(self, stmt: ForeverStmt):
+        invariants = loop_invariants(stmt) if self.opt_level >= 2 else []
+        if len(invariants) > 0:
+            yield from self.hoisting_loop(stmt, None, None, invariants)
+            return
+
         previous_start = self.begin_loop()
         previous_depth = self.scope_depth
+        previous_continue_type = self.continue_type
+        self.continue_type = OP_LOOP
 
         self.begin_scope()
-        self.visit(stmt.body) # Compile body
+        yield stmt.body.accept(self) # Compile body
         self.end_scope()
 
         self.chunk.emit_loop(stmt.body, self.inner_loop_start)
@@ -469,6 +666,7 @@ class Compiler(Visitor):
         self.patch_continue(stmt)
 
         self.exit_loop(previous_start, previous_end)
+        self.continue_type = previous_continue_type
         self.scope_depth = previous_depth
 
     def visitGotoStmt(self, stmt: GotoStmt):
@@ -487,13 +685,18 @@ class Compiler(Visitor):
             self.gotos.append(goto) # Add the label to the gotos requiring patching
 
     def visitIfStmt(self, stmt: IfStmt):
-        self.visit(stmt.condition)
+        chain = self.switch_chain(stmt) if self.opt_level >= 1 else None
+        if chain != None:
+            yield self.switch_stmt(stmt, *chain)
+            return
+
+        yield stmt.condition.accept(self)
 
         then_jump = self.chunk.emit_jump(OP_JUMP_IF_FLS)
         clog("If stmt if clause pop", debug = self.debug)
         self.chunk.emit_pop()
 
-        self.visit(stmt.if_branch)
+        yield stmt.if_branch.accept(self)
 
         else_jump = self.chunk.emit_jump(OP_JUMP)
 
@@ -502,10 +705,66 @@ class Compiler(Visitor):
         self.chunk.emit_pop()
 
         if stmt.else_branch != None:
-            self.visit(stmt.else_branch)
+            yield stmt.else_branch.accept(self)
 
         self.chunk.patch_jump(stmt.if_branch if stmt.else_branch == None else stmt.else_branch, else_jump)
 
+    def switch_arm(self, condition : Expr) -> tuple[VariableExpr, int, int | Token] | None:
+        # The variable, table kind and key of a condition like x == 3 or 'a' == x, None if a switch table cannot test it.
+        # Bools are keys 1 and 0 like OP_EQ compares them, floats and nul are left to OP_EQ
+        if type(condition) != BinaryExpr or condition.operator.type != T_EE or id(condition) in self.hoisted: return None
+        for variable, constant in ((condition.left, condition.right), (condition.right, condition.left)):
+            negated = type(constant) == UnaryExpr and constant.operator.type == T_MINUS
+            literal = constant.right if negated else constant
+            if type(variable) != VariableExpr or type(literal) != LiteralExpr: continue
+            token = literal.token
+            if token.type == T_INT: return variable, SWITCH_INTS, -token.value if negated else token.value
+            if negated: continue
+            if token.type in (T_TRUE, T_FALSE): return variable, SWITCH_INTS, 1 if token.type == T_TRUE else 0
+            if token.type == T_STRING: return variable, SWITCH_STRINGS, token
+        return None
+
+    def switch_chain(self, stmt : IfStmt) -> tuple[VariableExpr, list[int], list[int | None], list[Stmt], Stmt | None] | None:
+        # The variable, the table, the arm of each of its distances, the branches and what runs if no key matches,
+        # for an else if chain that starts with at least MIN_ARMS tests of one variable against constants of one kind
+        first = self.switch_arm(stmt.condition)
+        if first == None: return None
+        keys, branches = [], []
+        while type(stmt) == IfStmt:
+            arm = self.switch_arm(stmt.condition)
+            if arm == None or arm[0].name.lexeme != first[0].name.lexeme or arm[1] != first[1]: break # The rest is compiled as it is, as the default
+            keys.append(arm[2])
+            branches.append(stmt.if_branch)
+            stmt = stmt.else_branch
+        if len(keys) < MIN_ARMS: return None
+
+        layout = int_table(keys) if first[1] == SWITCH_INTS else string_table([(token.lexeme, self.emit_string(token, False)) for token in keys])
+        if layout == None: return None
+        return first[0], *layout, branches, stmt
+
+    def switch_stmt(self, stmt : IfStmt, variable : VariableExpr, table : list[int], arms : list[int | None], branches : list[Stmt], default : Stmt | None):
+        self.visit(variable) # Read once, the conditions could not change it
+        self.chunk.emit_byte(OP_SWITCH)
+        table_start = self.chunk.code_length
+        self.chunk.emit_bytes(*table)
+        after = self.chunk.code_length
+
+        starts = []
+        exits = []
+        for i, branch in enumerate(branches):
+            starts.append(self.chunk.code_length)
+            yield branch.accept(self)
+            if i < len(branches) - 1 or default != None: exits.append(self.chunk.emit_jump(OP_JUMP))
+        default_start = self.chunk.code_length
+        if default != None: yield default.accept(self)
+
+        distances = [(default_start if arm == None else starts[arm]) - after for arm in arms]
+        if max(distances) > 2**16 - 1: ErrorReporter.compile_error(stmt, "Too much code to jump")
+        write_distances(table, distances)
+        self.chunk.code[table_start:after] = table
+        for jump in exits: self.chunk.patch_jump(stmt, jump)
+        self.switch_count += 1
+
     def visitLabel(self, label: Label):
         name = label.label.lexeme
         if name in self.label_addrs: # No duplicate labels are allowed
@@ -522,18 +781,25 @@ class Compiler(Visitor):
         self.chunk.emit_byte(OP_PRINT)
 
     def visitVarDeclStmt(self, stmt: VarDeclStmt):
-        global_idx = self.parse_variable(stmt.name)
+        global_slot = self.parse_variable(stmt.name)
         if stmt.initializer == None:
             self.chunk.emit_null()
         else:
             self.visit(stmt.initializer)
-        self.define_variable(global_idx)
+        self.define_variable(global_slot)
 
     def visitWhileStmt(self, stmt: WhileStmt):
+        invariants = loop_invariants(stmt) if self.opt_level >= 2 else []
+        if len(invariants) > 0:
+            yield from self.hoisting_loop(stmt, stmt.condition, None, invariants)
+            return
+
         previous_start = self.begin_loop()
         previous_scope = self.scope_depth
+        previous_continue_type = self.continue_type
+        self.continue_type = OP_LOOP # Back to the condition, even inside a for loop that continues forwards
 
-        self.visit(stmt.condition)
+        yield stmt.condition.accept(self)
 
         exit_jump = self.chunk.emit_jump(OP_JUMP_IF_FLS)
         clog("While stmt condition pop", debug = self.debug)
@@ -541,7 +807,7 @@ class Compiler(Visitor):
 
         self.begin_scope()
 
-        self.visit(stmt.body)
+        yield stmt.body.accept(self)
 
         self.end_scope()
 
@@ -557,49 +823,155 @@ class Compiler(Visitor):
         self.patch_continue(stmt)
 
         self.exit_loop(previous_start, previous_end)
+        self.continue_type = previous_continue_type
         self.scope_depth = previous_scope
 
+    ### Loop invariant code motion ###
+
+    def hoist(self, invariants : list[Expr]) -> dict[int, int]: # Computes every distinct invariant once into a hidden local, returns the previous hoisted map to restore
+        previous = self.hoisted
+        self.hoisted = dict(previous)
+        slots = {}
+        for expr in invariants:
+            if id(expr) in previous: continue # An outer loop already computed it
+            key = expression_key(expr)
+            if key not in slots:
+                self.visit(expr)
+                self.add_local(Token(T_IDENTIFIER, f" hoisted {len(slots)}", None, expr.pos_start, expr.pos_end)) # No identifier can have this name
+                self.mark_initialized()
+                slots[key] = self.local_count - 1
+            self.hoisted[id(expr)] = slots[key]
+        self.hoisted_count += len(slots)
+        clog(f"Hoisted {len(slots)} loop invariant values", debug = self.debug)
+        return previous
+
+    def emit_hoisted(self, expr : Expr) -> bool: # Reads the hidden local if expr was computed before its loop
+        slot = self.hoisted.get(id(expr), -1)
+        if slot == -1: return False
+        self.get_local(slot)
+        return True
+
+    def hoisting_loop(self, stmt : Stmt, condition : Expr | None, step : Expr | None, invariants : list[Expr]):
+        # A while, for or forever loop whose invariant values are hidden locals computed before it
+        # The condition is checked once as written first, so a loop that never runs computes nothing:
+        #   condition, skip if false, hoisted values, jump to the body
+        #   top: condition, exit if false, body, step, loop to top
+        #   exit: pop the hoisted values, skip: ...
+        previous_depth = self.scope_depth
+        previous_continue_type = self.continue_type
+
+        skip_jump = -1
+        enter_jump = -1
+        if condition != None:
+            yield condition.accept(self)
+            skip_jump = self.chunk.emit_jump(OP_JUMP_IF_FLS)
+            self.chunk.emit_pop()
+
+        self.begin_scope()
+        previous_hoisted = self.hoist(invariants)
+
+        if condition != None:
+            enter_jump = self.chunk.emit_jump(OP_JUMP)
+
+        self.continue_type = OP_JUMP if step != None else OP_LOOP # Continue goes forward to the step, or back to the condition
+
+        previous_start = self.begin_loop()
+
+        exit_jump = -1
+        if condition != None:
+            yield condition.accept(self)
+            exit_jump = self.chunk.emit_jump(OP_JUMP_IF_FLS)
+            self.chunk.emit_pop()
+            self.chunk.patch_jump(stmt, enter_jump)
+
+        self.begin_scope()
+        yield stmt.body.accept(self)
+        self.end_scope()
+
+        continue_pos = -1
+        if step != None:
+            continue_pos = self.chunk.code_length
+            yield step.accept(self)
+            self.chunk.emit_pop()
+
+        self.chunk.emit_loop(stmt.body, self.inner_loop_start)
+
+        if exit_jump != -1:
+            self.chunk.patch_jump(stmt, exit_jump)
+            self.chunk.emit_pop()
+
+        previous_end = self.end_loop() # Breaks land before the hoisted values are popped
+
+        self.patch_break(stmt)
+        self.patch_continue(stmt, continue_pos)
+
+        self.exit_loop(previous_start, previous_end)
+        self.continue_type = previous_continue_type
+
+        self.end_scope()
+        self.hoisted = previous_hoisted
+
+        if skip_jump != -1:
+            end_jump = self.chunk.emit_jump(OP_JUMP)
+            self.chunk.patch_jump(stmt, skip_jump)
+            self.chunk.emit_pop()
+            self.chunk.patch_jump(stmt, end_jump)
+
+        self.scope_depth = previous_depth
+
     ### Expressions ###
 
+    def emit_operator(self, op : int, operand_type : int | None): # The typed form of op if both operands are known to have that type
+        typed = TYPED_OPS.get((op, operand_type), -1) if self.opt_level >= 1 else -1
+        if typed == -1:
+            self.chunk.emit_byte(op)
+            return
+        self.chunk.emit_byte(typed)
+        self.typed_count += 1
+
     def visitAssignExpr(self, expr: AssignExpr):
         op = expr.operand.type
 
         if op != T_EQ: # If it is a modified assignment then push the values the other way around
             self.named_variable(expr.name) # Add variable to stack to operate on
             self.visit(expr.value) # Add value to stack
-            if op == T_PLUS_ASSIGN: self.chunk.emit_byte(OP_ADD)
-            if op == T_MINUS_ASSIGN: self.chunk.emit_byte(OP_SUB)
-            if op == T_STAR_ASSIGN: self.chunk.emit_byte(OP_MUL)
+            if op == T_PLUS_ASSIGN: self.emit_operator(OP_ADD, expr.operand_type)
+            if op == T_MINUS_ASSIGN: self.emit_operator(OP_SUB, expr.operand_type)
+            if op == T_STAR_ASSIGN: self.emit_operator(OP_MUL, expr.operand_type)
             if op == T_SLASH_ASSIGN: self.chunk.emit_byte(OP_DIV)
-            if op == T_PERCENT_ASSIGN: self.chunk.emit_byte(OP_MOD)
+            if op == T_PERCENT_ASSIGN: self.emit_operator(OP_MOD, expr.operand_type)
             if op == T_CARET_ASSIGN: self.chunk.emit_byte(OP_POW)
         else:
             self.visit(expr.value)
 
         self.named_variable(expr.name, True) # Assign
 
-    def visitBinaryExpr(self, expr: BinaryExpr):
-        self.visit(expr.left)
-        self.visit(expr.right)
+    def visitBinaryExpr(self, expr: BinaryExpr): # A generator, generated code can chain thousands of operators
+        if self.emit_hoisted(expr): return
+
+        yield expr.left.accept(self)
+        yield expr.right.accept(self)
 
         op = expr.operator.type
+        operand_type = expr.operand_type
 
-        if op == T_PLUS:        self.chunk.emit_byte(OP_ADD)
-        elif op == T_MINUS:     self.chunk.emit_byte(OP_SUB)
-        elif op == T_STAR:      self.chunk.emit_byte(OP_MUL)
+        if op == T_PLUS:        self.emit_operator(OP_ADD, operand_type)
+        elif op == T_MINUS:     self.emit_operator(OP_SUB, operand_type)
+        elif op == T_STAR:      self.emit_operator(OP_MUL, operand_type)
         elif op == T_SLASH:     self.chunk.emit_byte(OP_DIV)
-        elif op == T_PERCENT:   self.chunk.emit_byte(OP_MOD)
+        elif op == T_PERCENT:   self.emit_operator(OP_MOD, operand_type)
         elif op == T_CARET:     self.chunk.emit_byte(OP_POW)
-        elif op == T_EE:        self.chunk.emit_byte(OP_EQ)
-        elif op == T_NE:        self.chunk.emit_bytes(OP_EQ, OP_NOT)
-        elif op == T_LT:        self.chunk.emit_byte(OP_LT)
-        elif op == T_LTE:       self.chunk.emit_bytes(OP_GT, OP_NOT)
-        elif op == T_GT:        self.chunk.emit_byte(OP_GT)
-        elif op == T_GTE:       self.chunk.emit_bytes(OP_LT, OP_NOT)
+        elif op == T_EE:        self.emit_operator(OP_EQ, operand_type)
+        elif op == T_NE:        self.emit_operator(OP_EQ, operand_type); self.chunk.emit_byte(OP_NOT)
+        elif op == T_LT:        self.emit_operator(OP_LT, operand_type)
+        elif op == T_LTE:       self.emit_operator(OP_GT, operand_type); self.chunk.emit_byte(OP_NOT)
+        elif op == T_GT:        self.emit_operator(OP_GT, operand_type)
+        elif op == T_GTE:       self.emit_operator(OP_LT, operand_type); self.chunk.emit_byte(OP_NOT)
         elif op == T_AND:       self.chunk.emit_byte(OP_AND)
         elif op == T_OR:        self.chunk.emit_byte(OP_OR)
 
     def visitFactorialExpr(self, expr: FactorialExpr):
+        if self.emit_hoisted(expr): return
         self.visit(expr.expr)
         self.chunk.emit_byte(OP_FACT)
 
@@ -610,12 +982,18 @@ class Compiler(Visitor):
             self.emit_empty_str()
         self.chunk.emit_byte(OP_GET_INPUT)
 
+    def visitLambdaExpr(self, expr: LambdaExpr): # The VM has no calls yet, these compiled to nothing and left the stack short
+        ErrorReporter.compile_error(expr, "Lambdas only run in the interpreter (--interpret)")
+
+    def visitCallExpr(self, expr: CallExpr):
+        ErrorReporter.compile_error(expr, "Calls only run in the interpreter (--interpret)")
+
     def visitLiteralExpr(self, expr: LiteralExpr):
         value = expr.token.value
         expr_type = expr.token.type
 
         if expr_type == T_STRING:
-            self.emit_string(expr.token.lexeme) 
+            self.emit_string(expr.token)
         elif expr_type in (T_TRUE, T_FALSE): self.chunk.emit_byte(OP_TRUE if expr.token.type == T_TRUE else OP_FALSE)
         elif expr_type == T_NULL: self.chunk.emit_null()
         elif expr.token.type == T_FLOAT: self.emit_constant(Value(V_FLOAT, struct.pack('=d', value))) #Use native byte order for constants
@@ -628,12 +1006,35 @@ class Compiler(Visitor):
                 # Add value to constant pool then add instruction
                 self.emit_constant(Value(V_INT, struct.pack('=q', value)))
 
+    def visitArrayExpr(self, expr: ArrayExpr): # Push every element, the VM packs them into an array
+        if len(expr.elements) > 2**16 - 1:
+            ErrorReporter.compile_error(expr, "Too many array elements")
+
+        for element in expr.elements:
+            self.visit(element)
+
+        count = len(expr.elements)
+        self.chunk.emit_bytes(OP_BUILD_ARRAY, count & 0xff, (count >> 8) & 0xff) # Little endian
+
+    def visitDictionaryExpr(self, expr: DictionaryExpr): # Push every key and value in order, the VM builds the dictionary from them
+        if len(expr.keys) > 2**16 - 1:
+            ErrorReporter.compile_error(expr, "Too many dictionary entries")
+
+        for key, value in zip(expr.keys, expr.values):
+            self.visit(key)
+            self.visit(value)
+
+        count = len(expr.keys)
+        self.chunk.emit_bytes(OP_BUILD_DICT, count & 0xff, (count >> 8) & 0xff) # Little endian
+
     def visitSubscriptExpr(self, expr: SubscriptExpr): # Like list indexing or dictionary key access
+        if self.emit_hoisted(expr): return
         self.visit(expr.iterable)
         self.visit(expr.subscript)
         self.chunk.emit_byte(OP_SUBSCRIPT)
 
     def visitTernaryExpr(self, expr: TernaryExpr): # Exactly like if statement
+        if self.emit_hoisted(expr): return
         self.visit(expr.condition)
 
         then_jump = self.chunk.emit_jump(OP_JUMP_IF_FLS)
@@ -652,12 +1053,13 @@ class Compiler(Visitor):
         self.chunk.patch_jump(expr.else_branch, else_jump)
 
     def visitUnaryExpr(self, expr: UnaryExpr):
+        if self.emit_hoisted(expr): return
         self.visit(expr.right)
 
         op = expr.operator.type
 
         if op == T_MINUS:
-            if self.chunk.code[-1] == OP_1: # If the number is -1 we can emit a specific instruction for it
+            if type(expr.right) == LiteralExpr and self.chunk.code[-1] == OP_1: # If the number is -1 we can emit a specific instruction for it, an operand byte could look like OP_1 too
                 self.chunk.code[-1] = OP_NEG1
                 return
             self.chunk.emit_byte(OP_NEGATE)
@@ -1,21 +1,84 @@
-import pathlib
-import sys
+import os, sys
+from bisect import bisect_left, bisect_right
+from threading import local as ThreadLocal
 
-from Runtime import RuntimeError
 from Token import *
 
-class ErrorReporter: # To report errors
-    HAD_ERROR = False
-    HAD_RUNTIME_ERROR = False
+class ReporterState(ThreadLocal): # Every thread gets its own error flags and output stream, so concurrent compiles stay isolated
+    def __init__(self):
+        self.had_error = False
+        self.had_runtime_error = False
+        self.stream = None # None means sys.stderr
+        self.source = None # The source the counters and line index below belong to
+        self.newlines = None # Sorted indices of every '\n' in the source, built on its first error
+        self.error_count = 0
+
+class TooManyErrors(Exception): pass # Raised once a source reaches ErrorReporter.MAX_ERRORS
+
+class ReporterMeta(type): # Keeps ErrorReporter.HAD_ERROR and friends working as plain class attributes
+    @property
+    def HAD_ERROR(cls): return cls.state.had_error
+    @HAD_ERROR.setter
+    def HAD_ERROR(cls, value : bool): cls.state.had_error = value
+
+    @property
+    def HAD_RUNTIME_ERROR(cls): return cls.state.had_runtime_error
+    @HAD_RUNTIME_ERROR.setter
+    def HAD_RUNTIME_ERROR(cls, value : bool): cls.state.had_runtime_error = value
+
+class ErrorReporter(metaclass = ReporterMeta): # To report errors
+    state = ReporterState()
+
+    MAX_ERRORS = 100 # Per source, 0 means no limit
+
+    @staticmethod
+    def begin(stream = None): # Start a fresh compilation on this thread, optionally capturing the diagnostics
+        ErrorReporter.state.had_error = False
+        ErrorReporter.state.had_runtime_error = False
+        ErrorReporter.state.stream = stream
+        ErrorReporter.state.source = None
+        ErrorReporter.state.newlines = None
+        ErrorReporter.state.error_count = 0
+
+    @staticmethod
+    def use_source(source : str) -> ReporterState: # Errors from a different source start a new count and index
+        state = ErrorReporter.state
+        if state.source is not source:
+            state.source = source
+            state.newlines = None
+            state.error_count = 0
+        return state
+
+    @staticmethod
+    def line_index(source : str) -> list[int]:
+        state = ErrorReporter.use_source(source)
+        if state.newlines == None:
+            newlines = []
+            index = source.find('\n')
+            while index >= 0:
+                newlines.append(index)
+                index = source.find('\n', index + 1)
+            state.newlines = newlines
+        return state.newlines
+
+    @staticmethod
+    def write(message : str):
+        stream = ErrorReporter.state.stream
+        (sys.stderr if stream == None else stream).write(message)
 
     def string_with_arrows(pos_start : Position, pos_end : Position):
         result = ''
         text = pos_start.source
+        newlines = ErrorReporter.line_index(text)
+
+        def next_newline(after : int): # Same as text.find('\n', after + 1), but a binary search
+            i = bisect_right(newlines, after)
+            return newlines[i] if i < len(newlines) else len(text)
 
         # Calculate indices
-        idx_start = max(text.rfind('\n', 0, pos_start.index), 0)
-        idx_end = text.find('\n', idx_start + 1)
-        if idx_end < 0: idx_end = len(text)
+        before = bisect_left(newlines, pos_start.index) # Newlines before the start, rfind('\n', 0, index) is the last of them
+        idx_start = newlines[before - 1] if before > 0 else 0
+        idx_end = next_newline(idx_start)
         
         # Generate each line
         line_count = pos_end.line - pos_start.line + 1
@@ -31,15 +94,14 @@ class ErrorReporter: # To report errors
 
             # Re-calculate indices
             idx_start = idx_end
-            idx_end = text.find('\n', idx_start + 1)
-            if idx_end < 0: idx_end = len(text)
+            idx_end = next_newline(idx_start)
 
         return result.replace('\t', '')
 
     @staticmethod
-    def file_not_found(path : pathlib.Path):
-        sys.stderr.write("File not found error: \n")
-        sys.stderr.write(f"\tFile {path.absolute()} could not be found")
+    def file_not_found(path : str):
+        ErrorReporter.write("File not found error: \n")
+        ErrorReporter.write(f"\tFile {os.path.abspath(path)} could not be found")
 
     @staticmethod
     def invalid_character(pos_start : Position, pos_end : Position, message : str): # Lexer
@@ -62,22 +124,28 @@ class ErrorReporter: # To report errors
         ErrorReporter.report("Compile", expr.pos_start, expr.pos_end, message)
 
     @staticmethod
-    def assertion_error(error : RuntimeError):
-        sys.stderr.write(f"Assertion Error @ {error.position}:\n")
-        sys.stderr.write(f"\t{error.message}\n")
-        sys.stderr.write(ErrorReporter.string_with_arrows(error.position, error.pos_end) + "\n")
+    def assertion_error(error : "Runtime.RuntimeError"):
+        ErrorReporter.write(f"Assertion Error @ {error.position}:\n")
+        ErrorReporter.write(f"\t{error.message}\n")
+        ErrorReporter.write(ErrorReporter.string_with_arrows(error.position, error.pos_end) + "\n")
         ErrorReporter.HAD_RUNTIME_ERROR = True
 
     @staticmethod
-    def runtime_error(error : RuntimeError): # Interpreter
-        sys.stderr.write(f"Runtime Error @ {error.position}:\n")
-        sys.stderr.write(f"\t{error.message}\n")
-        sys.stderr.write(ErrorReporter.string_with_arrows(error.position, error.pos_end) + "\n")
+    def runtime_error(error : "Runtime.RuntimeError"): # Interpreter
+        ErrorReporter.write(f"Runtime Error @ {error.position}:\n")
+        ErrorReporter.write(f"\t{error.message}\n")
+        ErrorReporter.write(ErrorReporter.string_with_arrows(error.position, error.pos_end) + "\n")
         ErrorReporter.HAD_RUNTIME_ERROR = True
 
     @staticmethod
     def report(err_name : str, pos_start : Position, pos_end, message : str):
-        sys.stderr.write(f"{err_name} Error @ {pos_start}:\n")
-        sys.stderr.write(f"\t{message}\n")
-        sys.stderr.write(ErrorReporter.string_with_arrows(pos_start, pos_end) + "\n")
-        ErrorReporter.HAD_ERROR = True
\ No newline at end of file
+        ErrorReporter.write(f"{err_name} Error @ {pos_start}:\n")
+        ErrorReporter.write(f"\t{message}\n")
+        ErrorReporter.write(ErrorReporter.string_with_arrows(pos_start, pos_end) + "\n")
+        ErrorReporter.HAD_ERROR = True
+
+        state = ErrorReporter.use_source(pos_start.source)
+        state.error_count += 1
+        if state.error_count == ErrorReporter.MAX_ERRORS: # Don't spend ages on a hopeless input
+            ErrorReporter.write(f"Too many errors, stopping after {state.error_count} in {pos_start.fn}\n")
+            raise TooManyErrors()
\ No newline at end of file
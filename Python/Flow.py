@@ -0,0 +1,297 @@
+from Opcodes import *
+from Switch import read_distances, table_size, write_distances
+
+### Bytecode control flow ###
+# Works on the finished code of a Chunk, after every jump, break, continue and goto has been patched:
+# decodes it, follows the jumps to see what can run, drops what cannot and writes the jumps back for the new positions.
+# With no calls the stack depth before every instruction is known too, the VM sizes its stack by the deepest one
+
+JUMPS_FORWARD = (OP_JUMP, OP_JUMP_IF_FLS, OP_FOR_PREP) # Instructions whose last two bytes are a distance ahead
+JUMPS_BACK = (OP_LOOP, OP_FOR_RANGE) # And behind
+NO_FALLTHROUGH = (OP_JUMP, OP_LOOP, OP_SWITCH, OP_RETURN)
+NAMED = (OP_GET_LOCAL, OP_SET_LOCAL, OP_DEFINE_GLOBAL, OP_GET_GLOBAL, OP_SET_GLOBAL, OP_DEFINE_GLOBAL_SLOT, OP_GET_GLOBAL_SLOT, OP_SET_GLOBAL_SLOT) # A tagged operand follows, like OP_CONSTANT or OP_CONSTANT_LONG
+OPERAND_SIZES = {OP_CONSTANT: 1, OP_CONSTANT_LONG: 3, OP_JUMP: 2, OP_JUMP_IF_FLS: 2, OP_LOOP: 2, OP_BUILD_DICT: 2, OP_BUILD_ARRAY: 2, OP_FOR_PREP: 4, OP_FOR_RANGE: 4}
+
+PURE_PUSHES = (OP_CONSTANT, OP_CONSTANT_LONG, OP_NEG1, OP_0, OP_1, OP_2, OP_TRUE, OP_FALSE, OP_NULL, OP_GET_LOCAL) # Push a value and cannot fail
+TRUTHY_PUSHES = (OP_NEG1, OP_1, OP_2, OP_TRUE)
+FALSY_PUSHES = (OP_0, OP_FALSE, OP_NULL)
+
+PUSHES = (OP_CONSTANT, OP_CONSTANT_LONG, OP_NEG1, OP_0, OP_1, OP_2, OP_TRUE, OP_FALSE, OP_NULL, OP_GET_LOCAL, OP_GET_GLOBAL, OP_GET_GLOBAL_SLOT)
+POPS = (OP_PRINT, OP_POP, OP_DEFINE_GLOBAL, OP_DEFINE_GLOBAL_SLOT, OP_SWITCH)
+REPLACES_TOP = (OP_NEGATE, OP_NOT, OP_FACT, OP_GET_INPUT, OP_JUMP_IF_FLS, OP_SET_GLOBAL, OP_SET_LOCAL, OP_SET_GLOBAL_SLOT) # Need a value there, leave the depth as it is
+BINARY = (
+    OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_MOD, OP_POW, OP_EQ, OP_LT, OP_GT, OP_AND, OP_OR, OP_SUBSCRIPT,
+    OP_ADD_II, OP_SUB_II, OP_MUL_II, OP_MOD_II, OP_EQ_II, OP_LT_II, OP_GT_II, OP_ADD_FF, OP_SUB_FF, OP_MUL_FF, OP_LT_FF, OP_GT_FF,
+)
+MAX_STACK_SIZE = 2**16 - 3 # Two bytes in the header, the VM's verifier keeps the depth plus two in two bytes
+
+class StackError(Exception): pass # Code whose stack depth can't be followed
+
+class Instruction:
+    def __init__(self, op : int, operands : list[int], offset : int):
+        self.op = op
+        self.operands = operands
+        self.offset = offset
+        self.target : Instruction | None = None # Where a jump lands
+        self.cases : list[Instruction] = [] # Where an OP_SWITCH can land, in the order of its table's distances
+        self.removed = False
+        self.replacement : Instruction | None = None # The first kept instruction after a removed one
+        self.position = 0 # Index in the instruction list
+
+    @property
+    def size(self): return 1 + len(self.operands)
+
+    @property
+    def index(self) -> int: # The constant or slot a named instruction uses
+        if self.operands[0] == OP_CONSTANT: return self.operands[1]
+        return self.operands[1] | (self.operands[2] << 8) | (self.operands[3] << 16)
+
+    @property
+    def targets(self) -> list: # Every instruction it can jump to
+        return self.cases if self.target == None else [self.target]
+
+class FlowReport:
+    def __init__(self):
+        self.unreachable = 0 # Instructions no path reaches
+        self.folded_branches = 0 # Conditional jumps on a constant
+        self.dead_stores : list[str] = [] # Globals that were stored but never read
+        self.pairs = 0 # Values pushed only to be popped
+        self.jumps = 0 # Jumps to the next instruction
+        self.size_before = 0
+        self.size_after = 0
+
+    def lines(self) -> list[str]:
+        lines = [f"{self.size_before} -> {self.size_after} bytes of code"]
+        if self.unreachable > 0: lines.append(f"removed {self.unreachable} unreachable instructions")
+        if self.folded_branches > 0: lines.append(f"folded {self.folded_branches} branches on a constant")
+        if len(self.dead_stores) > 0: lines.append(f"removed stores to globals that are never read: {', '.join(self.dead_stores)}")
+        if self.pairs > 0: lines.append(f"removed {self.pairs} pushes that were popped right away")
+        if self.jumps > 0: lines.append(f"removed {self.jumps} jumps to the next instruction")
+        return lines
+
+def decode(code : list[int], start : int) -> list[Instruction]:
+    instructions = []
+    at = {} # Offset to instruction
+    offset = start
+    while offset < len(code):
+        op = code[offset]
+        if op in NAMED:
+            size = 3 if code[offset + 1] == OP_CONSTANT else 5
+        elif op == OP_SWITCH:
+            size = 1 + table_size(code, offset + 1)
+        else:
+            size = 1 + OPERAND_SIZES.get(op, 0)
+        instruction = Instruction(op, code[offset + 1:offset + size], offset)
+        at[offset] = instruction
+        instructions.append(instruction)
+        offset += size
+
+    for instruction in instructions:
+        if instruction.op in JUMPS_FORWARD or instruction.op in JUMPS_BACK:
+            distance = instruction.operands[-2] | (instruction.operands[-1] << 8)
+            after = instruction.offset + instruction.size
+            instruction.target = at[after + distance if instruction.op in JUMPS_FORWARD else after - distance]
+        elif instruction.op == OP_SWITCH:
+            after = instruction.offset + instruction.size
+            instruction.cases = [at[after + distance] for distance in read_distances(instruction.operands)]
+    return instructions
+
+def encode(code : list[int], start : int, instructions : list[Instruction]) -> list[int] | None: # None if a jump no longer fits in its two bytes
+    offset = start
+    for instruction in instructions:
+        instruction.offset = offset
+        offset += instruction.size
+
+    encoded = code[:start]
+    for instruction in instructions:
+        if instruction.target != None:
+            after = instruction.offset + instruction.size
+            distance = instruction.target.offset - after if instruction.op in JUMPS_FORWARD else after - instruction.target.offset
+            if not 0 <= distance <= 2**16 - 1: return None
+            instruction.operands[-2:] = [distance & 0xff, (distance >> 8) & 0xff]
+        elif instruction.op == OP_SWITCH:
+            distances = [case.offset - (instruction.offset + instruction.size) for case in instruction.cases]
+            if any(not 0 <= distance <= 2**16 - 1 for distance in distances): return None
+            write_distances(instruction.operands, distances)
+        encoded.append(instruction.op)
+        encoded.extend(instruction.operands)
+    return encoded
+
+def successors(instructions : list[Instruction], i : int) -> list[int]:
+    instruction = instructions[i]
+    following = [i + 1] if instruction.op not in NO_FALLTHROUGH and i + 1 < len(instructions) else []
+    following.extend(target.position for target in instruction.targets)
+    return following
+
+def stack_effect(instruction : Instruction) -> tuple[int, int]: # Values it needs on the stack, and values it leaves in their place
+    op = instruction.op
+    if op in PUSHES: return 0, 1
+    if op in POPS: return 1, 0
+    if op in REPLACES_TOP: return 1, 1
+    if op in BINARY: return 2, 1
+    count = instruction.operands[0] | (instruction.operands[1] << 8) if op in (OP_BUILD_DICT, OP_BUILD_ARRAY) else 0
+    if op == OP_BUILD_DICT: return 2 * count, 1
+    if op == OP_BUILD_ARRAY: return count, 1
+    return 0, 0
+
+def stack_depths(instructions : list[Instruction]) -> tuple[list[int | None], int]: # The depth before every instruction, None where nothing reaches, and the deepest
+    # Positions have to be set. Raises StackError where the code takes more than there is or paths meet with different depths
+    depths : list[int | None] = [None] * len(instructions)
+    depths[0] = 0
+    deepest = 0
+    pending = [0]
+    while len(pending) > 0:
+        i = pending.pop()
+        needs, leaves = stack_effect(instructions[i])
+        if depths[i] < needs: raise StackError("the stack underflows")
+        after = depths[i] - needs + leaves
+        deepest = max(deepest, after)
+        for j in successors(instructions, i):
+            if depths[j] == None:
+                depths[j] = after
+                pending.append(j)
+            elif depths[j] != after:
+                raise StackError("the stack depth differs where paths join")
+    return depths, deepest
+
+def max_stack_depth(code : list[int], start : int) -> int: # What the VM's stack has to hold
+    try:
+        instructions = decode(code, start)
+    except (KeyError, IndexError):
+        raise StackError("a jump does not land on an instruction")
+    for position, instruction in enumerate(instructions): instruction.position = position
+    return stack_depths(instructions)[1]
+
+def compact(instructions : list[Instruction]) -> list[Instruction]: # Drops removed instructions, jumps to one land on the next that is kept
+    kept = []
+    pending = [] # Removed since the last kept instruction
+    for instruction in instructions:
+        if instruction.removed:
+            pending.append(instruction)
+            continue
+        for removed in pending: removed.replacement = instruction
+        pending.clear()
+        kept.append(instruction)
+
+    for instruction in kept:
+        while instruction.target != None and instruction.target.removed:
+            instruction.target = instruction.target.replacement
+        for i, case in enumerate(instruction.cases):
+            while case.removed: case = case.replacement
+            instruction.cases[i] = case
+    for position, instruction in enumerate(kept): instruction.position = position
+    return kept
+
+def fold_branches(instructions : list[Instruction], targets : set[int], report : FlowReport):
+    for i in range(1, len(instructions)):
+        instruction = instructions[i]
+        if instruction.op != OP_JUMP_IF_FLS or id(instruction) in targets: continue # Something else may jump straight to it
+        previous = instructions[i - 1].op
+        if previous in FALSY_PUSHES: # Always jumps, the value is still popped where it lands
+            instruction.op = OP_JUMP
+            report.folded_branches += 1
+        elif previous in TRUTHY_PUSHES: # Never jumps
+            instruction.removed = True
+            report.folded_branches += 1
+
+def remove_unreachable(instructions : list[Instruction], report : FlowReport):
+    reached = [False] * len(instructions)
+    pending = [0]
+    while len(pending) > 0:
+        i = pending.pop()
+        if reached[i]: continue
+        reached[i] = True
+        pending.extend(successors(instructions, i))
+
+    for i, instruction in enumerate(instructions[:-1]): # The final OP_RETURN stays even after a loop that never ends
+        if not reached[i]:
+            instruction.removed = True
+            report.unreachable += 1
+
+def defined_globals(instructions : list[Instruction], slots : set[int]) -> list[frozenset[int] | None]:
+    # The slots out of slots that every path to an instruction has defined, None where nothing reaches. Positions have to be set
+    defined : list[frozenset[int] | None] = [None] * len(instructions)
+    defined[0] = frozenset()
+    pending = [0]
+    while len(pending) > 0:
+        i = pending.pop()
+        instruction = instructions[i]
+        after = defined[i]
+        if instruction.op == OP_DEFINE_GLOBAL_SLOT and instruction.index in slots: after = after | {instruction.index}
+        for j in successors(instructions, i):
+            joined = after if defined[j] == None else defined[j] & after # Only shrinks once set, so this ends
+            if joined != defined[j]:
+                defined[j] = joined
+                pending.append(j)
+    return defined
+
+def remove_dead_stores(instructions : list[Instruction], names : dict[int, str], report : FlowReport):
+    read = {instruction.index for instruction in instructions if instruction.op == OP_GET_GLOBAL_SLOT} # Compound assignments read too
+    written = {instruction.index for instruction in instructions if instruction.op in (OP_DEFINE_GLOBAL_SLOT, OP_SET_GLOBAL_SLOT)} - read
+    defined = defined_globals(instructions, written)
+    for instruction, before in zip(instructions, defined): # An assignment that can run before its global is defined has to fail like it would have
+        if instruction.op == OP_SET_GLOBAL_SLOT and (before == None or instruction.index not in before): written.discard(instruction.index)
+
+    for instruction in instructions:
+        if instruction.op not in (OP_DEFINE_GLOBAL_SLOT, OP_SET_GLOBAL_SLOT) or instruction.index not in written: continue
+        if instruction.op == OP_DEFINE_GLOBAL_SLOT: # It popped the value, the value itself still has to be computed
+            instruction.op = OP_POP
+            instruction.operands = []
+        else: # An assignment leaves its value for the expression around it
+            instruction.removed = True
+    report.dead_stores.extend(sorted(names.get(index, f"#{index}") for index in written))
+
+def remove_pairs(instructions : list[Instruction], targets : set[int], report : FlowReport):
+    kept = [] # Stack of instructions that survived so far, a pop can cancel the push just before it
+    for instruction in instructions:
+        if instruction.op == OP_POP and id(instruction) not in targets and len(kept) > 0 and kept[-1] != None and kept[-1].op in PURE_PUSHES:
+            push = kept.pop()
+            push.removed = True
+            instruction.removed = True
+            report.pairs += 1
+            if id(push) in targets: kept.append(None) # Jumps land after the pair now, the pop after them must stay paired with its own push
+            continue
+        kept.append(instruction)
+
+def remove_jumps_to_next(instructions : list[Instruction], report : FlowReport):
+    for i in range(len(instructions) - 1):
+        instruction = instructions[i]
+        if instruction.op == OP_JUMP and instruction.target is instructions[i + 1]:
+            instruction.removed = True
+            report.jumps += 1
+
+def jump_targets(instructions : list[Instruction]) -> set[int]:
+    return {id(target) for instruction in instructions for target in instruction.targets}
+
+def optimize(code : list[int], start : int, names : dict[int, str], dead_stores : bool) -> tuple[list[int], FlowReport]:
+    # start is where the instructions begin, after the header. names maps global slots to their names
+    report = FlowReport()
+    report.size_before = report.size_after = len(code) - start
+
+    try:
+        instructions = decode(code, start)
+    except (KeyError, IndexError): # A jump that does not land on an instruction, leave the code as it is
+        return code, report
+    for position, instruction in enumerate(instructions): instruction.position = position
+
+    fold_branches(instructions, jump_targets(instructions), report)
+    instructions = compact(instructions)
+
+    remove_unreachable(instructions, report)
+    instructions = compact(instructions)
+
+    if dead_stores:
+        remove_dead_stores(instructions, names, report)
+        instructions = compact(instructions)
+
+    remove_pairs(instructions, jump_targets(instructions), report)
+    instructions = compact(instructions)
+
+    remove_jumps_to_next(instructions, report)
+    instructions = compact(instructions)
+
+    optimized = encode(code, start, instructions)
+    if optimized == None: return code, FlowReport() # Cannot happen while code only shrinks, but never hand back broken jumps
+
+    report.size_after = len(optimized) - start
+    return optimized, report
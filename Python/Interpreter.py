@@ -1,29 +1,99 @@
+from array import array
+from itertools import repeat
+from operator import add, sub, mul, truediv, mod, pow, eq, ne, lt, le, gt, ge
+from types import GeneratorType
+
+from Analysis import analyze_lambda
 from Runtime import *
 from Value import Clock, TimidAnon
 from Nodes import*
 from Error import ErrorReporter
+from Streams import InputBuffer, OutputBuffer
+
+MAX_BINARY_RECURSION = 100 # Deeper operator nesting is evaluated with an explicit stack
+
+# Binary operations on operand types that need no coercion, keyed by (operator, left type, right type)
+# Everything else, like bools, nul or mixing strings with numbers, goes through Interpreter.coerced_binary_op
+BINARY_DISPATCH = {}
+
+for left_type, right_type in ((int, int), (float, float), (int, float), (float, int)):
+    BINARY_DISPATCH.update({
+        (T_PLUS, left_type, right_type): add,
+        (T_MINUS, left_type, right_type): sub,
+        (T_STAR, left_type, right_type): mul,
+        (T_SLASH, left_type, right_type): truediv,
+        (T_PERCENT, left_type, right_type): mod,
+        (T_CARET, left_type, right_type): pow,
+        (T_EE, left_type, right_type): eq,
+        (T_NE, left_type, right_type): ne,
+        (T_LT, left_type, right_type): lt,
+        (T_LTE, left_type, right_type): le,
+        (T_GT, left_type, right_type): gt,
+        (T_GTE, left_type, right_type): ge,
+        (T_AND, left_type, right_type): lambda left, right: left and right,
+        (T_OR, left_type, right_type): lambda left, right: left or right,
+    })
+
+BINARY_DISPATCH.update({
+    (T_PLUS, str, str): add,
+    (T_EE, str, str): eq,
+    (T_NE, str, str): ne,
+    (T_LT, str, str): lt,
+    (T_LTE, str, str): le,
+    (T_GT, str, str): gt,
+    (T_GTE, str, str): ge,
+})
+
+ARRAY_OPERATIONS = { T_PLUS: add, T_MINUS: sub, T_STAR: mul, T_SLASH: truediv, T_CARET: pow } # Done element-wise when either operand is an array
 
 class Interpreter(Visitor): # TODO: organize REPL runtime
-    def __init__(self):
+    def __init__(self, debug = False, memo_size = 0, output_policy : str | int | None = None, input_buffer : InputBuffer | None = None):
         self.globals = Environment()
         self.environment = self.globals
         self.statements = []
-        self.current_stmt = None
-        self.labels : dict[str, int] = {}
+        self.labels : dict[str, list[tuple[list[Stmt], int]]] = {} # Label name to its path, see Interpreter.find_labels
+
+        self.binary_depth = 0 # Binary expressions currently being evaluated by recursion
+
+        self.frames : dict[int, list[Environment]] = {} # Call frames free for reuse, by arity
+
+        self.memo_size = memo_size # Results each pure lambda keeps, 0 turns memoization off
+        self.memo_caller = None # The memoized lambda being evaluated
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.impure_calls = 0 # Calls whose results can't be cached, a memoized call only keeps its result if this didn't change
 
-        self.should_break = False
-        self.should_continue = False
+        self.output = OutputBuffer(output_policy) # Everything print writes, see Streams.py
+        self.input = input_buffer # None asks for every line with input()
+
+        self.debug = debug
+        self.cache_hits = 0 # Variable lookups answered by a node's inline cache
+        self.cache_misses = 0
 
         self.globals.define("Clock", Clock())
 
     def interpret(self, statements : list[Stmt]):
         self.statements = statements
+        self.labels = self.find_labels(statements)
+        self.binary_depth = 0
         try:
-            for stmt in self.statements:
-                self.current_stmt = stmt
-                self.execute(stmt)
+            signal = self.run(self.execute_block(statements, self.environment))
+            if type(signal) == BreakStmt:
+                raise RuntimeError(signal.pos_start, signal.pos_end, "Break statement outside of loop")
+            if type(signal) == ContinueStmt:
+                raise RuntimeError(signal.pos_start, signal.pos_end, "Continue statement outside of loop")
         except (RuntimeError, TypeError) as e:
+            self.output.flush() # What was printed before the error comes first
             ErrorReporter.runtime_error(e)
+        finally:
+            self.output.flush()
+
+        if self.debug:
+            lookups = self.cache_hits + self.cache_misses
+            rate = 100 * self.cache_hits / lookups if lookups > 0 else 0
+            print(f"Variable cache: {self.cache_hits} hits, {self.cache_misses} misses ({rate:.1f}% hit rate)")
+            if self.memo_size > 0:
+                print(f"Lambda memo: {self.memo_hits} hits, {self.memo_misses} misses")
 
     def evaluate(self, expr : Expr, environment : Environment = None):
         previous = self.environment
@@ -37,96 +107,233 @@ class Interpreter(Visitor): # TODO: organize REPL runtime
             result = expr.accept(self)
         return result
 
-    def execute(self, stmt : Stmt): stmt.accept(self)
+    ### Control flow ###
+    # Statements complete with None, or with the break, continue or goto statement that cut them short
+    # Blocks stop at the first such signal and hand it up, loops consume breaks and continues
+    # A goto is handled by the innermost block holding its label, which carries on from there
+
+    def execute(self, stmt : Stmt): return self.run(stmt.accept(self))
+
+    def run(self, work): # Statements that nest statements are generators, they yield the work of their children to be run here on an explicit stack
+        if type(work) != GeneratorType: return work # Nothing nested, or an expression used as a statement
+
+        stack = [work]
+        result = None # How the last child completed, sent back to its parent
+        error = None
+        while len(stack) > 0:
+            try:
+                if error != None: # Unwind through the statements around it, so blocks restore their environment
+                    raised, error = error, None
+                    work = stack[-1].throw(raised)
+                else:
+                    work = stack[-1].send(result)
+            except StopIteration as stop:
+                stack.pop()
+                result = stop.value
+                continue
+            except Exception as e:
+                stack.pop()
+                if len(stack) <= 0: raise
+                error = e
+                continue
+
+            if type(work) == GeneratorType:
+                stack.append(work)
+                result = None
+            else:
+                result = work
 
-    def execute_block(self, statements : list[Stmt], environment : Environment):
+        return result
+
+    def execute_block(self, statements : list[Stmt], environment : Environment, path : list = None, depth : int = 0):
         previous = self.environment
         try:
             self.environment = environment
-            for stmt in statements:
-                self.execute(stmt)
+            start = 0
+            while True:
+                signal = None
+                if path != None: # Carry on from a label, path[depth] is where it is in this block
+                    start = path[depth][1] + 1
+                    if depth + 1 < len(path): # The label is further in
+                        signal = yield self.enter(statements[start - 1], path, depth + 1)
+                    path = None
+
+                if signal == None:
+                    for stmt in statements if start == 0 else statements[start:]:
+                        signal = yield stmt.accept(self)
+                        if signal != None: break
+                    else:
+                        return None
+
+                if type(signal) != GotoStmt: return signal
+
+                path = self.labels[signal.label.lexeme]
+                depth = 0
+                while depth < len(path) and path[depth][0] is not statements: depth += 1
+                if depth == len(path): return signal # The label is outside this block
         finally:
             self.environment = previous
 
-    def visitBlock(self, block: Block):
-        self.execute_block(block.statements, Environment(self.environment))
-
-    def visitContinueStmt(self, stmt: ContinueStmt):
-        self.should_continue = True
+    def enter(self, stmt : Stmt, path : list, depth : int): # Work that runs stmt from the label inside it, path[depth] is the next block on the way
+        while type(stmt) == IfStmt: # Straight into the branch holding the label, without testing the condition
+            stmt = stmt.if_branch if self.reaches(stmt.if_branch, path[depth][0]) else stmt.else_branch
+
+        if type(stmt) == Block: return self.visitBlock(stmt, path, depth)
+        if type(stmt) == WhileStmt: return self.visitWhileStmt(stmt, path, depth)
+        if type(stmt) == ForStmt: return self.visitForStmt(stmt, path, depth)
+        if type(stmt) == ForRangeStmt: return self.visitForRangeStmt(stmt, path, depth)
+        return self.visitForeverStmt(stmt, path, depth)
+
+    def reaches(self, stmt : Stmt, statements : list[Stmt]) -> bool: # Whether entering stmt can lead straight to this block
+        for block in self.nested_blocks(stmt):
+            if block.statements is statements: return True
+        return False
+
+    def nested_blocks(self, stmt : Stmt) -> list[Block]: # Blocks directly inside a statement, without another block in between
+        blocks = []
+        pending = [stmt]
+        while len(pending) > 0:
+            stmt = pending.pop()
+            if type(stmt) == Block:
+                blocks.append(stmt)
+            elif type(stmt) in (WhileStmt, ForStmt, ForeverStmt, ForRangeStmt):
+                pending.append(stmt.body)
+            elif type(stmt) == IfStmt:
+                if stmt.else_branch != None: pending.append(stmt.else_branch)
+                pending.append(stmt.if_branch)
+        return blocks
+
+    def find_labels(self, statements : list[Stmt]) -> dict: # Each label's path, the blocks leading to it and the index taken in each
+        labels = {}
+        pending = [(statements, [])]
+        while len(pending) > 0:
+            statements, path = pending.pop()
+            for index, stmt in enumerate(statements):
+                here = path + [(statements, index)]
+                if type(stmt) == Label:
+                    labels[stmt.label.lexeme] = here
+                    continue
+                for block in self.nested_blocks(stmt):
+                    pending.append((block.statements, here))
+        return labels
+
+    def visitBlock(self, block: Block, path : list = None, depth : int = 0):
+        environment = Environment(self.environment) if block.needs_scope else self.environment
+        return self.execute_block(block.statements, environment, path, depth)
+
+    def visitContinueStmt(self, stmt: ContinueStmt): return stmt
 
     def visitPrintStmt(self, stmt: PrintStmt):
         result = ""
         if stmt.value != None:
             result = self.evaluate(stmt.value)
-        print(ToString(result))
+        self.output.write(ToString(result) + "\n")
 
     def visitExprStmt(self, stmt: ExprStmt): self.evaluate(stmt.expr)
 
-    def visitForStmt(self, stmt: ForStmt):
-        if stmt.initializer != None:
+    def visitForStmt(self, stmt: ForStmt, path : list = None, depth : int = 0):
+        if stmt.initializer != None and path == None:
             self.execute(stmt.initializer)
 
         if stmt.condition == None:
             stmt.condition = LiteralExpr(Token(T_TRUE, "tru", None, Position(0, 0, 0, "", ""), Position(0, 0, 0, "", "")))
-        
-        while self.evaluate(stmt.condition):
-            if self.should_break: break
-            if self.should_continue:
-                self.should_continue = False
-                continue
 
-            self.execute(stmt.body)
+        if path != None: # Jumped into the body
+            signal = yield self.enter(stmt.body, path, depth)
+            if signal != None and type(signal) != ContinueStmt:
+                return None if type(signal) == BreakStmt else signal
+            if stmt.step != None:
+                self.execute(stmt.step)
 
+        while self.evaluate(stmt.condition):
+            signal = yield stmt.body.accept(self)
+            if signal != None and type(signal) != ContinueStmt:
+                return None if type(signal) == BreakStmt else signal
             if stmt.step != None:
                 self.execute(stmt.step)
 
-        self.should_break = False
+    def visitForRangeStmt(self, stmt: ForRangeStmt, path : list = None, depth : int = 0):
+        start = self.evaluate(stmt.start)
+        end = self.evaluate(stmt.end)
+        step = 1 if stmt.step == None else self.evaluate(stmt.step)
 
-    def visitForeverStmt(self, stmt: ForeverStmt):
-        while True:
-            if self.should_break: break
-            self.execute(stmt.body)
-            if self.should_continue:
-                self.should_continue = False
-                continue
-        self.should_break = False
-        self.should_continue = False
+        for value, expr in ((start, stmt.start), (end, stmt.end), (step, stmt.step)):
+            if not IsNumeric(value):
+                raise RuntimeError(expr.pos_start, expr.pos_end, "Expected a number in a range")
+        start, end, step = ToNumber(start), ToNumber(end), ToNumber(step)
+        if step == 0:
+            raise RuntimeError(stmt.step.pos_start, stmt.step.pos_end, "Range step cannot be zero")
 
-    def visitLabel(self, label: Label):
-        self.labels[label.label.lexeme] = self.statements.index(self.current_stmt) + 1
+        name = stmt.name.lexeme
+        previous = self.environment
+        try:
+            self.environment = Environment(previous) # The counter only lives as long as the loop
+            self.environment.define(name, start)
+            values = self.environment.values
+
+            counter = start
+            if path != None: # Jumped into the body
+                signal = yield self.enter(stmt.body, path, depth)
+                if signal != None and type(signal) != ContinueStmt:
+                    return None if type(signal) == BreakStmt else signal
+                counter = self.next_count(stmt, values, step)
+
+            while counter < end if step > 0 else counter > end:
+                signal = yield stmt.body.accept(self)
+                if signal != None and type(signal) != ContinueStmt:
+                    return None if type(signal) == BreakStmt else signal
+                counter = self.next_count(stmt, values, step)
+        finally:
+            self.environment = previous
 
-    def visitGotoStmt(self, stmt: GotoStmt):
-        label = stmt.label.lexeme
+    def next_count(self, stmt : ForRangeStmt, values : dict, step : int | float): # The body can assign the counter, the next one carries on from there
+        counter = values[stmt.name.lexeme]
+        if not IsNumeric(counter):
+            raise RuntimeError(stmt.name.pos_start, stmt.name.pos_end, "Expected the loop counter to stay a number")
+        counter = ToNumber(counter) + step
+        values[stmt.name.lexeme] = counter
+        return counter
 
-        if label not in self.labels:
-            raise RuntimeError(stmt.label.pos_start, stmt.label.pos_end, f"Label '{label}' is not defined")
+    def visitForeverStmt(self, stmt: ForeverStmt, path : list = None, depth : int = 0):
+        if path != None: # Jumped into the body
+            signal = yield self.enter(stmt.body, path, depth)
+            if signal != None and type(signal) != ContinueStmt:
+                return None if type(signal) == BreakStmt else signal
 
-        index = self.labels[label]
+        while True:
+            signal = yield stmt.body.accept(self)
+            if signal != None and type(signal) != ContinueStmt:
+                return None if type(signal) == BreakStmt else signal
 
-        self.execute(self.statements[index])
+    def visitLabel(self, label: Label): pass # Found up front by find_labels
+
+    def visitGotoStmt(self, stmt: GotoStmt):
+        if stmt.label.lexeme not in self.labels:
+            raise RuntimeError(stmt.label.pos_start, stmt.label.pos_end, f"Label '{stmt.label.lexeme}' is not defined")
+        return stmt
+
+    def visitWhileStmt(self, stmt: WhileStmt, path : list = None, depth : int = 0):
+        if path != None: # Jumped into the body
+            signal = yield self.enter(stmt.body, path, depth)
+            if signal != None and type(signal) != ContinueStmt:
+                return None if type(signal) == BreakStmt else signal
 
-    def visitWhileStmt(self, stmt: WhileStmt):
         while self.evaluate(stmt.condition):
-            if self.should_break: break
-            if self.should_continue:
-                self.should_continue = False
-                continue
-            self.execute(stmt.body)
-        self.should_break = False
-        self.should_continue = False
+            signal = yield stmt.body.accept(self)
+            if signal != None and type(signal) != ContinueStmt:
+                return None if type(signal) == BreakStmt else signal
 
-    def visitBreakStmt(self, stmt: BreakStmt):
-        self.should_break = True
+    def visitBreakStmt(self, stmt: BreakStmt): return stmt
 
     def visitIfStmt(self, stmt: IfStmt):
-        condition = self.evaluate(stmt.condition)
+        while True: # Chains of ifs, like else ifs, are followed in a loop
+            condition = self.evaluate(stmt.condition)
+
+            branch = stmt.if_branch if condition else stmt.else_branch
+            if branch == None: return
+            if type(branch) != IfStmt: return branch.accept(self) # Its work is handed back as is, so it doesn't nest either
+            stmt = branch
 
-        if condition:
-            self.execute(stmt.if_branch)
-            return
-        if stmt.else_branch != None:
-            self.execute(stmt.else_branch)
-        
     def visitVarDeclStmt(self, stmt: VarDeclStmt):
         value = None
         if (stmt.initializer != None):
@@ -135,18 +342,42 @@ class Interpreter(Visitor): # TODO: organize REPL runtime
 
     def visitAssignExpr(self, expr: AssignExpr):
         value = self.evaluate(expr.value)
-        self.environment.assign(expr.name, value)
+
+        name = expr.name.lexeme # Same inline cache as visitVariableExpr
+        environment = self.environment
+        values = environment.values
+        if name not in values and environment.enclosing is expr.cache_parent and Environment.DEFINITIONS.get(name) == expr.cache_definitions:
+            values = expr.cache_target.values
+        if name in values:
+            self.cache_hits += 1
+            values[name] = value
+            return value
+
+        self.resolve_variable(expr).values[name] = value
         return value
 
     def visitLambdaExpr(self, expr: LambdaExpr):
-        return TimidAnon(expr, self.environment.copy())
+        if expr.captures == None: analyze_lambda(expr)
+
+        # The closure is shared, not copied. It is the whole current scope and not a cell per captured name, a goto can skip a declaration
+        # so any scope out to the globals can still define a captured name after this (see README)
+        closure = self.environment if len(expr.captures) > 0 else self.globals
+        return TimidAnon(expr, closure)
 
     def visitInputExpr(self, expr: InputExpr):
         prompt = ""
         if expr.prompt != None:
             prompt = self.evaluate(expr.prompt)
 
-        return input(prompt)
+        if self.input != None: # Batch input has no one to show a prompt to
+            line = self.input.read_line()
+            return line if line != None else ""
+
+        self.output.flush() # The prompt, and everything before it, has to be seen before waiting
+        try:
+            return input(prompt)
+        except EOFError: # The end of the input reads as an empty line
+            return ""
 
     def visitAssertStmt(self, stmt: AssertStmt):
         condition = self.evaluate(stmt.condition)
@@ -170,8 +401,51 @@ class Interpreter(Visitor): # TODO: organize REPL runtime
             return expr.token.lexeme
 
     def visitBinaryExpr(self, expr: BinaryExpr):
-        left = self.evaluate(expr.left)
-        right = self.evaluate(expr.right)
+        if self.binary_depth >= MAX_BINARY_RECURSION: # Generated code can nest thousands of operators, walk those without recursing
+            return self.binary_chain(expr)
+
+        self.binary_depth += 1
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        self.binary_depth -= 1 # Not restored when an error escapes, interpret() starts from 0 again
+
+        return self.binary_op(expr, left, right)
+
+    def binary_chain(self, expr : BinaryExpr):
+        work : list[tuple[Expr, bool]] = [(expr, False)] # The flag is set once both operands have been evaluated
+        values = []
+
+        while len(work) > 0:
+            node, ready = work.pop()
+            if ready:
+                right = values.pop()
+                values.append(self.binary_op(node, values.pop(), right))
+            elif isinstance(node, BinaryExpr):
+                work.append((node, True))
+                work.append((node.right, False))
+                work.append((node.left, False)) # Popped first, operands are evaluated left to right
+            else:
+                values.append(self.evaluate(node))
+
+        return values[0]
+
+    def binary_op(self, expr : BinaryExpr, left : object, right : object):
+        operation = BINARY_DISPATCH.get((expr.operator.type, type(left), type(right)))
+        if operation == None: # Anything that needs coercing
+            return self.coerced_binary_op(expr, left, right)
+
+        try:
+            return operation(left, right)
+        except ZeroDivisionError: # Only '/' and '%' report it, 0 ^ -1 is left alone like before
+            if expr.operator.type == T_SLASH:
+                raise RuntimeError(expr.right.pos_start, expr.right.pos_end, "Division by zero")
+            if expr.operator.type == T_PERCENT:
+                raise RuntimeError(expr.right.pos_start, expr.right.pos_end, "Modulus by zero")
+            raise
+
+    def coerced_binary_op(self, expr : BinaryExpr, left : object, right : object):
+        if isinstance(left, array) or isinstance(right, array):
+            return self.array_op(expr, left, right)
 
         if IsNumeric(left):
             left = ToNumber(left)
@@ -217,15 +491,60 @@ class Interpreter(Visitor): # TODO: organize REPL runtime
         elif operator == T_OR:
             return left or right
 
+    def array_op(self, expr : BinaryExpr, left : object, right : object): # One pass of map over the packed elements, a scalar is repeated
+        operation = ARRAY_OPERATIONS.get(expr.operator.type)
+        if operation == None:
+            raise RuntimeError(expr.operator.pos_start, expr.operator.pos_end, "Arrays only support '+', '-', '*', '/' and '^'")
+
+        operands = []
+        integral = operation != truediv
+        for operand, operand_expr in ((left, expr.left), (right, expr.right)):
+            if isinstance(operand, array):
+                integral = integral and operand.typecode == 'q'
+            elif IsNumeric(operand):
+                operand = ToNumber(operand)
+                integral = integral and not isinstance(operand, float)
+            else:
+                raise RuntimeError(operand_expr.pos_start, operand_expr.pos_end, "Expected an array or a number")
+            operands.append(operand)
+
+        left, right = operands
+        if isinstance(left, array) and isinstance(right, array):
+            if len(left) != len(right):
+                raise RuntimeError(expr.pos_start, expr.pos_end, f"Arrays have different lengths ({len(left)} and {len(right)})")
+        elif isinstance(left, array):
+            right = repeat(right, len(left))
+        else:
+            left = repeat(left, len(right))
+
+        try:
+            if integral and operation == pow: # A negative exponent makes a float, so only keep integers if every result is one
+                results = list(map(pow, left, right))
+                return array('q', results) if all(type(result) == int for result in results) else array('d', results)
+            return array('q' if integral else 'd', map(operation, left, right))
+        except ZeroDivisionError:
+            raise RuntimeError(expr.right.pos_start, expr.right.pos_end, "Division by zero")
+        except OverflowError:
+            raise RuntimeError(expr.pos_start, expr.pos_end, "Array element is too large")
+
+    def visitArrayExpr(self, expr: ArrayExpr):
+        values = [self.evaluate(element) for element in expr.elements]
+        elements = MakeArray(values)
+        if elements == None:
+            element = expr.elements[next(i for i, value in enumerate(values) if not IsNumeric(value))]
+            raise RuntimeError(element.pos_start, element.pos_end, "Expected a number as an array element")
+        return elements
+
     def visitDictionaryExpr(self, expr: DictionaryExpr):
-        keys = [self.evaluate(key) for key in expr.keys]
-        values = [self.evaluate(value) for value in expr.values]
-        d = dict()
+        dictionary = {}
 
-        for key in keys:
-            d[key] = values[keys.index(key)]
+        for key_expr, value_expr in zip(expr.keys, expr.values): # Entries are evaluated in order, a repeated key keeps the last value
+            key = DictKey(self.evaluate(key_expr))
+            if key == None:
+                raise RuntimeError(key_expr.pos_start, key_expr.pos_end, "Expected a number or string as a dictionary key")
+            dictionary[key] = self.evaluate(value_expr)
 
-        return d
+        return dictionary
 
     def visitFactorialExpr(self, expr: FactorialExpr):
         left = self.evaluate(expr.expr)
@@ -273,6 +592,20 @@ class Interpreter(Visitor): # TODO: organize REPL runtime
     def visitSubscriptExpr(self, expr: SubscriptExpr):
         iterable = self.evaluate(expr.iterable)
 
+        if isinstance(iterable, dict):
+            key = DictKey(self.evaluate(expr.subscript))
+            if key not in iterable:
+                raise RuntimeError(expr.subscript.pos_start, expr.subscript.pos_end, "Key is not in the dictionary")
+            return iterable[key]
+
+        if isinstance(iterable, array):
+            index = self.evaluate(expr.subscript)
+            if not isinstance(index, int):
+                raise RuntimeError(expr.subscript.pos_start, expr.subscript.pos_end, "Expected an integral type as an index")
+            if index >= len(iterable) or index < -len(iterable):
+                raise RuntimeError(expr.subscript.pos_start, expr.subscript.pos_end, "Index is out of bounds")
+            return iterable[index]
+
         if not isinstance(iterable, str):
             raise RuntimeError(expr.iterable.pos_start, expr.iterable.pos_end, "Expected an iterable type to subscript")
 
@@ -287,7 +620,33 @@ class Interpreter(Visitor): # TODO: organize REPL runtime
         return iterable[index]
 
     def visitVariableExpr(self, expr: VariableExpr):
-        return self.environment.get(expr.name)
+        # A name in the current scope is found straight away. Otherwise the cache holds the scope the name was found in, from the scope
+        # enclosing the current one. That scope's chain never changes, and no scope on it can have gained the name while its count is the same
+        name = expr.name.lexeme
+        environment = self.environment
+        values = environment.values
+        if name not in values and environment.enclosing is expr.cache_parent and Environment.DEFINITIONS.get(name) == expr.cache_definitions:
+            values = expr.cache_target.values
+        if name in values:
+            self.cache_hits += 1
+            return values[name]
+
+        return self.resolve_variable(expr).values[name]
+
+    def resolve_variable(self, expr : VariableExpr | AssignExpr) -> Environment: # Full lookup, which refills the expression's inline cache
+        self.cache_misses += 1
+
+        name = expr.name.lexeme
+        hops = self.environment.resolve(name)
+        if hops < 0:
+            raise RuntimeError(expr.name.pos_start, expr.name.pos_end, f"Undefined variable '{name}'")
+
+        target = self.environment.ancestor(hops)
+        if hops > 0:
+            expr.cache_parent = self.environment.enclosing
+            expr.cache_target = target
+            expr.cache_definitions = Environment.DEFINITIONS.get(name)
+        return target
 
     def visitTernaryExpr(self, expr: TernaryExpr):
         condition = self.evaluate(expr.condition)
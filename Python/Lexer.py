@@ -1,13 +1,11 @@
-import string
-
 from Error import ErrorReporter
 from TokenType import *
-from Token import Token, Position
+from Token import Token, Position, SymbolTable
 
-DIGITS = string.digits
-LETTERS = string.ascii_letters + '_' # Allowed identifier characters
+DIGITS = "0123456789" # Spelled out, the string module pulls in re
+LETTERS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_" # Allowed identifier characters
 LETTERS_DIGITS = DIGITS + LETTERS
-WHITESPACE = string.whitespace
+WHITESPACE = " \t\n\r\x0b\x0c"
 
 ESCAPE_CHAR = '\\'
 ESCAPE_CHARS = {
@@ -43,10 +41,11 @@ KEYWORDS = {
 }
 
 class Lexer:
-    def __init__(self, source : str, file : str):
+    def __init__(self, source : str, file : str, symbols : SymbolTable = None):
         self.pos = Position(-1, 0, -1, source, file)
         self.source : str = source
         self.tokens : list[Token] = []
+        self.symbols = SymbolTable() if symbols == None else symbols
         self.is_empty = True
         self.advance()
 
@@ -72,19 +71,19 @@ class Lexer:
         while self.current_char in WHITESPACE:
             self.advance()
 
-    def add_token(self, type : int, lexeme : str = None, value : object = None, pos_start : Position = None, pos_end : Position = None):
-        self.tokens.append(self.make_token(type, lexeme, value, pos_start, pos_end))
+    def add_token(self, type : int, lexeme : str = None, value : object = None, pos_start : Position = None, pos_end : Position = None, symbol : int = -1):
+        self.tokens.append(self.make_token(type, lexeme, value, pos_start, pos_end, symbol))
 
     def single_char_token(self, type : int):
         self.add_token(type)
         self.advance()
 
-    def make_token(self, type : int, lexeme : str = None, value : object = None, pos_start : Position = None, pos_end : Position = None):
+    def make_token(self, type : int, lexeme : str = None, value : object = None, pos_start : Position = None, pos_end : Position = None, symbol : int = -1):
         if lexeme == None: lexeme = self.current_char
         if pos_start == None: pos_start = self.pos.copy()
         if pos_end == None: pos_end = pos_start.copy().advance(self.current_char)
         self.is_empty = False
-        return Token(type, lexeme, value, pos_start, pos_end)
+        return Token(type, lexeme, value, pos_start, pos_end, symbol)
 
     def two_char_token(self, type1 : int, type2 : int, match : str):
         pos_start = self.pos.copy()
@@ -147,19 +146,22 @@ class Lexer:
             ErrorReporter.missing_quote(self.pos.copy(), self.pos.advance().copy(), f"Missing '{opener}' string delimiter")
 
         self.advance() # Advance second quote
-        self.add_token(T_STRING, string, string, pos_start, self.pos)
+
+        symbol = self.symbols.intern(string) # Repeated literals share one string
+        string = self.symbols.names[symbol]
+        self.add_token(T_STRING, string, string, pos_start, self.pos, symbol)
 
     def make_identifier(self):
         pos_start = self.pos.copy()
-        id_str = ''
-        token_type = T_IDENTIFIER
 
         while self.current_char in LETTERS_DIGITS:
-            id_str += self.current_char
             self.advance()
 
+        symbol = self.symbols.intern(self.source[pos_start.index:self.pos.index])
+        id_str = self.symbols.names[symbol] # The same string object for every occurrence
+
         token_type = KEYWORDS.get(id_str, T_IDENTIFIER)
-        self.add_token(token_type, id_str, None, pos_start, self.pos)
+        self.add_token(token_type, id_str, None, pos_start, self.pos, symbol)
         
     def scan_token(self):
         self.skip_whitespace()
@@ -185,7 +187,7 @@ class Lexer:
 
             case '@': self.single_char_token(T_AT)
             case '?': self.single_char_token(T_QMARK)
-            case '.': self.single_char_token(T_DOT)
+            case '.': self.two_char_token(T_DOT, T_DOT_DOT, '.')
             case ',': self.single_char_token(T_COMMA)
             case ':': self.single_char_token(T_COLON)
             case ';': self.single_char_token(T_SEMIC)
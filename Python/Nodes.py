@@ -17,11 +17,21 @@ class SubscriptExpr(Expr):
     def accept(self, visitor):
         return visitor.visitSubscriptExpr(self)
 
+class ArrayExpr(Expr):
+    def __init__(self, lsqr : Token, elements : list[Expr], rsqr : Token):
+        self.elements = elements
+        super().__init__(lsqr.pos_start, rsqr.pos_end)
+    def accept(self, visitor): return visitor.visitArrayExpr(self)
+
 class AssignExpr(Expr):
     def __init__(self, name : Token, value : Expr, operand : Token):
         self.name = name
         self.value = value
         self.operand = operand
+        self.cache_parent = None # Inline cache used by the interpreter, see Interpreter.visitVariableExpr
+        self.cache_target = None
+        self.cache_definitions = -1
+        self.operand_type : int | None = None # T_INT or T_FLOAT if a compound assignment works on two of them, see Analysis.infer_types
         super().__init__(name.pos_start, value.pos_end)
     def accept(self, visitor):
         return visitor.visitAssignExpr(self)
@@ -33,6 +43,7 @@ class BinaryExpr(Expr):
         self.left = left
         self.operator = operator
         self.right = right
+        self.operand_type : int | None = None # T_INT or T_FLOAT if both operands are always one, see Analysis.infer_types
         super().__init__(self.left.pos_start, self.right.pos_end)
 
     def accept(self, visitor): return visitor.visitBinaryExpr(self)
@@ -76,6 +87,9 @@ class LambdaExpr(Expr):
         self.keyword = keyword
         self.identifier = identifier
         self.body = body
+        self.captures : list[str] = None # Names the body uses from outside, see Analysis.analyze_lambda
+        self.makes_lambdas = False
+        self.pure = False
         super().__init__(keyword.pos_start, body.pos_end)
 
     def accept(self, visitor): return visitor.visitLambdaExpr(self)
@@ -112,6 +126,9 @@ class UnaryExpr(Expr):
 class VariableExpr(Expr):
     def __init__(self, name : Token):
         self.name = name
+        self.cache_parent = None # Inline cache used by the interpreter, see Interpreter.visitVariableExpr
+        self.cache_target = None
+        self.cache_definitions = -1
         super().__init__(self.name.pos_start, self.name.pos_end)
 
     def accept(self, visitor): return visitor.visitVariableExpr(self)
@@ -136,8 +153,9 @@ class AssertStmt(Stmt):
     def accept(self, visitor): return visitor.visitAssertStmt(self)
 
 class Block(Stmt):
-    def __init__(self, lcurl : Token, statements : list[Stmt], rcurl : Token):
+    def __init__(self, lcurl : Token, statements : list[Stmt], rcurl : Token, needs_scope : bool = True):
         self.statements = statements
+        self.needs_scope = needs_scope # False if it can run in the enclosing scope, see Parser.block
         super().__init__(lcurl.pos_start, rcurl.pos_end)
 
     def accept(self, visitor): return visitor.visitBlock(self)
@@ -161,7 +179,7 @@ class ExprStmt(Stmt):
         self.expr = expr
         super().__init__(expr.pos_start, expr.pos_end)
 
-    def accept(self, visitor): visitor.visitExprStmt(self)
+    def accept(self, visitor): return visitor.visitExprStmt(self)
     def __repr__(self): return f"(expr {self.expr})"
 
 class ForStmt(Stmt):
@@ -172,19 +190,29 @@ class ForStmt(Stmt):
         self.step = step
 
         super().__init__(kw.pos_start, self.body.pos_end)
-    def accept(self, visitor): visitor.visitForStmt(self)
+    def accept(self, visitor): return visitor.visitForStmt(self)
+
+class ForRangeStmt(Stmt):
+    def __init__(self, kw : Token, name : Token, start : Expr, end : Expr, step : Expr, body : Stmt):
+        self.name = name
+        self.start = start
+        self.end = end # Not included, like i < end
+        self.step = step # None steps by 1
+        self.body = body
+        super().__init__(kw.pos_start, body.pos_end)
+    def accept(self, visitor): return visitor.visitForRangeStmt(self)
 
 class ForeverStmt(Stmt):
     def __init__(self, kw : Token, body : Stmt):
         self.body = body
         super().__init__(kw.pos_start, body.pos_end)
-    def accept(self, visitor): visitor.visitForeverStmt(self)
+    def accept(self, visitor): return visitor.visitForeverStmt(self)
 
 class GotoStmt(Stmt):
     def __init__(self, label : Token):
         self.label = label
         super().__init__(label.pos_start, label.pos_end)
-    def accept(self, visitor): visitor.visitGotoStmt(self)
+    def accept(self, visitor): return visitor.visitGotoStmt(self)
 
 class IfStmt(Stmt):
     def __init__(self, condition : Expr, if_branch : Stmt, else_branch : Stmt = None):
@@ -192,14 +220,14 @@ class IfStmt(Stmt):
         self.if_branch = if_branch
         self.else_branch = else_branch
         super().__init__(condition.pos_start, if_branch.pos_end if else_branch == None else else_branch.pos_end)
-    def accept(self, visitor): visitor.visitIfStmt(self)
+    def accept(self, visitor): return visitor.visitIfStmt(self)
     def __repr__(self): return f"(if {self.condition} do {self.if_branch} else {self.else_branch})"
 
 class Label(Stmt):
     def __init__(self, label : Token):
         self.label = label
         super().__init__(label.pos_start, label.pos_end)
-    def accept(self, visitor): visitor.visitLabel(self)
+    def accept(self, visitor): return visitor.visitLabel(self)
 
 class PrintStmt(Stmt):
     def __init__(self, kw : Token, value : Expr):
@@ -207,7 +235,7 @@ class PrintStmt(Stmt):
         self.value = value
         super().__init__(kw.pos_start, kw.pos_end if value == None else value.pos_end)
 
-    def accept(self, visitor): visitor.visitPrintStmt(self)
+    def accept(self, visitor): return visitor.visitPrintStmt(self)
     def __repr__(self): return f"(print {self.value})"
 
 class WhileStmt(Stmt):
@@ -216,7 +244,7 @@ class WhileStmt(Stmt):
         self.body = body
         super().__init__(self.condition.pos_start, self.body.pos_end)
 
-    def accept(self, visitor): visitor.visitWhileStmt(self)
+    def accept(self, visitor): return visitor.visitWhileStmt(self)
     def __repr__(self): return f"(while {self.condition} do {self.body})"
 
 class VarDeclStmt(Stmt):
@@ -225,11 +253,12 @@ class VarDeclStmt(Stmt):
         self.initializer = initializer
         super().__init__(name.pos_start, initializer.pos_end if initializer != None else name.pos_end)
 
-    def accept(self, visitor): visitor.visitVarDeclStmt(self)
+    def accept(self, visitor): return visitor.visitVarDeclStmt(self)
     def __repr__(self): return f"(var {self.name.lexeme} = {self.initializer})"
 
 ### Visitor ###
 class Visitor:
+    def visitArrayExpr(self, expr : ArrayExpr): pass
     def visitAssignExpr(self, expr : AssignExpr): pass
     def visitBinaryExpr(self, expr : BinaryExpr): pass
     def visitCallExpr(self, expr : CallExpr): pass
@@ -249,6 +278,7 @@ class Visitor:
     def visitContinueStmt(self, stmt : ContinueStmt): pass
     def visitExprStmt(self, stmt : ExprStmt): pass
     def visitForStmt(self, stmt : ForStmt): pass
+    def visitForRangeStmt(self, stmt : ForRangeStmt): pass
     def visitForeverStmt(self, stmt : ForeverStmt): pass
     def visitGotoStmt(self, stmt : GotoStmt): pass
     def visitIfStmt(self, stmt : IfStmt): pass
@@ -44,5 +44,85 @@ OP_SET_LOCAL = iota()
 OP_GET_INPUT = iota()
 
 OP_SUBSCRIPT = iota()
+OP_BUILD_DICT = iota()
+OP_BUILD_ARRAY = iota()
+OP_FOR_PREP = iota()
+OP_FOR_RANGE = iota()
 
-OP_RETURN = iota()
\ No newline at end of file
+# Arithmetic and comparisons on operands the compiler proved are both ints (II) or both floats (FF), no type checks at run time
+OP_ADD_II = iota()
+OP_SUB_II = iota()
+OP_MUL_II = iota()
+OP_MOD_II = iota()
+OP_EQ_II = iota()
+OP_LT_II = iota()
+OP_GT_II = iota()
+OP_ADD_FF = iota()
+OP_SUB_FF = iota()
+OP_MUL_FF = iota()
+OP_LT_FF = iota()
+OP_GT_FF = iota()
+
+# Globals by a slot the compiler numbers, instead of hashing their name at run time
+OP_DEFINE_GLOBAL_SLOT = iota()
+OP_GET_GLOBAL_SLOT = iota()
+OP_SET_GLOBAL_SLOT = iota()
+
+OP_SWITCH = iota() # Pops a value and jumps where the table that follows sends it, see Switch.py
+
+OP_RETURN = iota()
+
+### Register opcodes ###
+# Three address code for the register VM, see Registers.py. Every operand is two bytes, A is the register written,
+# RK operands are a register below 0x8000 or a constant index with that bit set
+R_MOVE = iota(True) # A RK
+R_TRUE = iota() # A
+R_FALSE = iota()
+R_NULL = iota()
+
+R_PRINT = iota() # RK
+R_NEGATE = iota() # A RK
+R_NOT = iota()
+R_FACT = iota()
+R_GET_INPUT = iota()
+
+R_ADD = iota() # A RK RK
+R_SUB = iota()
+R_MUL = iota()
+R_DIV = iota()
+R_MOD = iota()
+R_POW = iota()
+R_EQ = iota()
+R_LT = iota()
+R_GT = iota()
+R_AND = iota()
+R_OR = iota()
+R_SUBSCRIPT = iota()
+R_ADD_II = iota()
+R_SUB_II = iota()
+R_MUL_II = iota()
+R_MOD_II = iota()
+R_EQ_II = iota()
+R_LT_II = iota()
+R_GT_II = iota()
+R_ADD_FF = iota()
+R_SUB_FF = iota()
+R_MUL_FF = iota()
+R_LT_FF = iota()
+R_GT_FF = iota()
+
+R_JUMP_IF_FLS = iota() # RK distance
+R_JUMP = iota() # distance
+R_LOOP = iota()
+
+R_DEFINE_GLOBAL = iota() # slot RK
+R_GET_GLOBAL = iota() # A slot
+R_SET_GLOBAL = iota() # slot RK
+
+R_BUILD_DICT = iota() # A count, the keys and values are in the registers from A on
+R_BUILD_ARRAY = iota()
+R_FOR_PREP = iota() # A distance, the counter, end and step are in A, A + 1 and A + 2
+R_FOR_RANGE = iota()
+R_SWITCH = iota() # RK, then a table like OP_SWITCH's
+
+R_RETURN = iota()
@@ -3,7 +3,22 @@ from Nodes import *
 from Token import Token
 
 MAX_ARG_COUNT = 255
-MAX_NEST_DEPTH = 40
+
+BINARY_PRECEDENCE = { # Higher binds tighter
+    T_OR: 1,
+    T_AND: 2,
+    T_EE: 3, T_NE: 3,
+    T_LT: 4, T_LTE: 4, T_GT: 4, T_GTE: 4,
+    T_PLUS: 5, T_MINUS: 5,
+    T_STAR: 6, T_SLASH: 6, T_PERCENT: 6,
+    T_CARET: 8,
+}
+UNARY_PRECEDENCE = 7 # Prefix +, - and ! bind looser than '^', so -a ^ b is -(a ^ b)
+UNARY_OPERATORS = (T_PLUS, T_MINUS, T_NOT)
+RIGHT_ASSOCIATIVE = (T_CARET, )
+
+LITERALS = (T_INT, T_FLOAT, T_STRING, T_TRUE, T_FALSE, T_NULL)
+ASSIGNMENT_OPERATORS = (T_EQ, T_PLUS_ASSIGN, T_MINUS_ASSIGN, T_STAR_ASSIGN, T_SLASH_ASSIGN, T_PERCENT_ASSIGN, T_CARET_ASSIGN)
 
 class ParseError(Exception): pass
 
@@ -11,7 +26,7 @@ class Parser:
     def __init__(self, tokens : list[Token]):
         self.tokens = tokens
         self.index = 0
-        self.nest_depth = 0
+        self.lambda_count = 0 # Lambdas parsed so far, blocks use it to tell if they contain any
 
     @property
     def current_tok(self) -> Token: return self.tokens[self.index]
@@ -56,15 +71,7 @@ class Parser:
                 return True
         return False
 
-    def matcht(self, types : tuple[int]): # Match for a tuple
-        for type in types:
-            if self.check(type):
-                self.advance()
-                return True
-        return False
-
     def synchronize(self):
-        self.nest_depth = 0
         self.advance()
         while not self.is_at_end:
             if self.previous_tok.type in (T_SEMIC, ): return
@@ -76,11 +83,35 @@ class Parser:
 
             self.advance()
 
+    def nested(self, work): # Statements are generators that yield the statements nested in them, this runs them on an explicit stack instead of recursing
+        stack = [work]
+        value = None
+        error = None
+
+        while True:
+            try:
+                if error != None: # Let the statement that asked for it handle the error, declaration() synchronizes
+                    raised, error = error, None
+                    request = stack[-1].throw(raised)
+                else:
+                    request = stack[-1].send(value)
+            except StopIteration as result:
+                stack.pop()
+                if len(stack) <= 0: return result.value
+                value = result.value
+            except Exception as e:
+                stack.pop()
+                if len(stack) <= 0: raise
+                error = e
+            else:
+                stack.append(request)
+                value = None
+
     def parse(self):
         try:
             statements = []
             while not self.is_at_end:
-                stmt = self.declaration()
+                stmt = self.nested(self.declaration())
 
                 if stmt == None: # If there are trailing newlines then return the statements
                     break
@@ -100,7 +131,7 @@ class Parser:
                 return None
             if self.match(T_DOLLAR):
                 return self.var_decl(nullable)
-            return self.statement(nullable)
+            return (yield self.statement(nullable))
         except ParseError:
             self.synchronize()
 
@@ -118,16 +149,16 @@ class Parser:
         while self.match(T_SEMIC): pass # Ignore random semicolons or newlines
         if self.is_at_end or self.check(T_RCURL): # If end of file or end of block, ignore
             return None
-        if self.match(T_WHILE): return self.while_stmt(nullable)
+        if self.match(T_WHILE): return (yield from self.while_stmt(nullable))
         if self.match(T_FOREVER):
             kw = self.previous_tok
-            body = self.statement(True)
+            body = yield self.statement(True)
             self.check_nonterminal(body, "Expected a 'forever' loop body")
             return ForeverStmt(kw, body)
-        if self.match(T_FOR): return self.for_stmt(nullable)
-        if self.match(T_IF): return self.if_stmt(nullable)
+        if self.match(T_FOR): return (yield from self.for_stmt(nullable))
+        if self.match(T_IF): return (yield from self.if_stmt(nullable))
         if self.match(T_PRINT): return self.print_stmt(nullable)
-        if self.match(T_LCURL): return self.block(nullable)
+        if self.match(T_LCURL): return (yield from self.block(nullable))
         if self.match(T_ASSERT):
             kw = self.previous_tok
             condition = self.expr(nullable)
@@ -148,6 +179,8 @@ class Parser:
 
     def for_stmt(self, nullable = False):
         kw = self.previous_tok
+        if self.check(T_IDENTIFIER) and self.next_tok.type == T_IN:
+            return (yield from self.for_range_stmt(kw))
         if self.match(T_DOLLAR):
             initializer = self.var_decl(True)
         else:
@@ -156,64 +189,77 @@ class Parser:
         condition = self.expr(True)
         self.consume("Expected a ',' after initializer or ','", T_COMMA)
         step = self.expr(True)
-        body = self.statement(True)
+        body = yield self.statement(True)
         self.check_nonterminal(body, "Expected a 'for' loop body")
         return ForStmt(kw, body, initializer, condition, step)
 
+    def for_range_stmt(self, kw : Token): # for i in start..end step s
+        name = self.advance()
+        self.advance() # Consume 'in'
+
+        start = self.expr(True)
+        self.check_nonterminal(start, "Expected the start of a range")
+        self.consume(f"Expected a '..' between the start and end of a range (after '{self.previous_tok.lexeme}')", T_DOT_DOT)
+        end = self.expr(True)
+        self.check_nonterminal(end, "Expected the end of a range")
+
+        step = None
+        if self.check(T_IDENTIFIER) and self.current_tok.lexeme == "step": # Only a keyword here, 'step' is still a name anywhere else
+            self.advance()
+            step = self.expr(True)
+            self.check_nonterminal(step, "Expected a range step")
+
+        body = yield self.statement(True)
+        self.check_nonterminal(body, "Expected a 'for' loop body")
+        return ForRangeStmt(kw, name, start, end, step, body)
+
     def while_stmt(self, nullable = False):
-        self.nest_depth += 1
-        if self.nest_depth >= MAX_NEST_DEPTH:
-            raise self.error(self.current_tok, "Maximum block nesting depth reached")
         condition = self.expr(True)
 
         if condition == None:
             raise self.error(self.current_tok, f"Expected a 'while' loop condition (after '{self.previous_tok.lexeme}' token)")
 
-        body = self.statement(True)
+        body = yield self.statement(True)
 
         if body == None:
             raise self.error(self.current_tok, f"Expected a 'while' loop body (after '{self.previous_tok.lexeme}')")
-        self.nest_depth -= 1
         return WhileStmt(condition, body)
 
     def block(self, nullable = False):
         lcurl = self.previous_tok
-        self.nest_depth += 1
-        if self.nest_depth >= MAX_NEST_DEPTH:
-            raise self.error(lcurl, "Maximum block nesting depth reached")
+        lambda_count = self.lambda_count
 
         statements = []
         while not self.check(T_RCURL) and not self.is_at_end:
-            stmt = self.declaration(True)
+            stmt = yield self.declaration(True)
             if stmt == None:
                 break
             statements.append(stmt)
         rcurl = self.consume("Expected a closing '}' (after '{' or previous statement)", T_RCURL)
-        self.nest_depth -= 1
-        return Block(lcurl, statements, rcurl)
+
+        # A block only needs its own scope if it declares something, a three clause for loop's counter too, or makes a lambda that captures the scope
+        declares = lambda stmt: type(stmt) == VarDeclStmt or (type(stmt) == ForStmt and type(stmt.initializer) == VarDeclStmt)
+        needs_scope = self.lambda_count != lambda_count or any(declares(stmt) for stmt in statements)
+        return Block(lcurl, statements, rcurl, needs_scope)
 
     def if_stmt(self, nullable = False):
-        self.nest_depth += 1
-        if self.nest_depth >= MAX_NEST_DEPTH:
-            raise self.error(self.current_tok, "Maximum block nesting depth reached")
         condition = self.expr(True)
 
         if condition == None:
             raise self.error(self.current_tok, f"Expected an 'if' statement condition (after '{self.previous_tok.lexeme}')")
 
-        if_branch = self.statement(True)
+        if_branch = yield self.statement(True)
 
         self.check_nonterminal(if_branch, f"Expected an 'if' statement body")
 
         else_branch = None
 
         if self.match(T_ELSE):
-            else_branch = self.statement(True)
+            else_branch = yield self.statement(True)
 
             if else_branch == None:
                 raise self.error(self.current_tok, f"Expected an 'else' clause body (after '{self.previous_tok.lexeme}')")
 
-        self.nest_depth -= 1
         return IfStmt(condition, if_branch, else_branch)
 
     def print_stmt(self, nullable = False):
@@ -228,15 +274,120 @@ class Parser:
 
     # Expressions
 
-    def expr(self, nullable = False):
-        return self.assignment(nullable)
+    def expr(self, nullable = False): # Nested expressions are parsed on an explicit stack instead of by recursion
+        stack = [self.expression(nullable)]
+        value = None
+
+        while True:
+            try:
+                nullable = stack[-1].send(value)
+            except StopIteration as result:
+                stack.pop()
+                if len(stack) <= 0: return result.value
+                value = result.value # Resume the expression that asked for it
+            else: # The expression on top needs a nested one first
+                stack.append(self.expression(nullable))
+                value = None
+
+    def expression(self, nullable = False): # Yields the nullability of every nested expression it needs, expr() sends back the result
+        if self.match(T_LAMBDA):
+            keyword : Token = self.previous_tok
+            self.lambda_count += 1
+            identifier : Token = self.consume("Expected an identifier (after 'lam' keyword)", T_IDENTIFIER)
+            if self.is_at_end:
+                raise self.error(self.current_tok, f"Expected a lambda expression body (after identifier '{self.previous_tok.lexeme}')")
+            body = yield nullable
+            expr = LambdaExpr(keyword, identifier, body)
+        else:
+            operands : list[Expr] = []
+            operators : list[tuple[int, Token]] = [] # Binary and prefix operators waiting for their operands, with their precedence
+
+            while True:
+                while self.current_tok.type in UNARY_OPERATORS:
+                    operators.append((UNARY_PRECEDENCE, self.advance()))
+                    nullable = True # Only the leftmost operand can be left out
+
+                # Atom
+                token = self.current_tok
+                if token.type in LITERALS:
+                    self.advance()
+                    operand = LiteralExpr(token)
+                elif token.type == T_IDENTIFIER:
+                    self.advance()
+                    if self.match(T_COLON):
+                        raise self.error(self.previous_tok, "Goto label in expression")
+                    operand = VariableExpr(token)
+                elif token.type == T_IN:
+                    self.advance()
+                    prompt = yield True # There may not be a prompt
+                    operand = InputExpr(prompt, token)
+                elif token.type == T_LPAR:
+                    self.advance()
+                    operand = yield from self.group(token)
+                elif token.type == T_LSQR:
+                    self.advance()
+                    operand = yield from self.array(token)
+                elif not nullable:
+                    raise self.error(self.current_tok, "Expected an expression, a boolean, a string, a number, or 'nul'") # Default error message
+                else:
+                    operand = None
+
+                # Postfix operators, calls and subscripts first and then any number of !s
+                while True:
+                    if self.match(T_LPAR):
+                        operand = yield from self.finish_call(operand)
+                    elif self.match(T_LSQR):
+                        operand = yield from self.finish_subscript(operand)
+                    else:
+                        break
+                while self.match(T_NOT):
+                    operand = FactorialExpr(operand)
+
+                operands.append(operand)
+                nullable = True
+
+                # Reduce everything that binds tighter than the next operator
+                precedence = BINARY_PRECEDENCE.get(self.current_tok.type)
+                while len(operators) > 0:
+                    top, operator = operators[-1]
+                    if precedence != None and (top < precedence or (top == precedence and self.current_tok.type in RIGHT_ASSOCIATIVE)):
+                        break
+                    operators.pop()
+
+                    right = operands.pop()
+                    if top == UNARY_PRECEDENCE:
+                        if right == None:
+                            raise self.error(self.current_tok, f"Expected a unary operand (after unary operator '{self.previous_tok.lexeme}')")
+                        operands.append(UnaryExpr(operator, right))
+                    else:
+                        if right == None:
+                            raise self.error(self.current_tok, f"Expected a right binary operand (after '{operator.lexeme}')")
+                        operands[-1] = BinaryExpr(operands[-1], operator, right)
+
+                if precedence == None: break
+                operators.append((precedence, self.advance()))
+
+            expr = operands[0]
+
+        if self.match(T_QMARK):
+            if_branch = yield True
+
+            if if_branch == None:
+                raise self.error(self.current_tok, f"Expected a ternary operator False branch (after '{self.previous_tok.lexeme}')")
+
+            self.consume(f"Expected a ':' in ternary operator (after '{self.previous_tok.lexeme}')", T_COLON)
+
+            else_branch = yield True
+
+            if else_branch == None:
+                raise self.error(self.current_tok, f"Expected a ternary operator True branch (after '{self.previous_tok.lexeme}')")
+
+            expr = TernaryExpr(expr, if_branch, else_branch)
 
-    def assignment(self, nullable = False):
-        expr = self.ternary(nullable)
-        if self.match(T_EQ, T_PLUS_ASSIGN, T_MINUS_ASSIGN, T_STAR_ASSIGN, T_SLASH_ASSIGN, T_PERCENT_ASSIGN, T_CARET_ASSIGN):
-            operand = self.previous_tok
+        if self.current_tok.type in ASSIGNMENT_OPERATORS:
+            operand = self.advance()
             invalid = False
-            value = self.assignment(True)
+            value = yield True
 
             if (not isinstance(expr, VariableExpr)):
                 self.error(expr, "Invalid assignment target")
@@ -250,134 +401,51 @@ class Parser:
 
         return expr
 
-    def ternary(self, nullable = False):
-        condition = self.lambda_expr(nullable)
+    def group(self, lpar : Token):
+        expr : Expr = yield False # Can be an expression or a dictionary key
+        if self.match(T_COLON): # Dictionary literal
+            keys = [expr]
+            values = []
 
-        if self.match(T_QMARK):
-            if_branch = self.expr(True)
+            value = yield True
 
-            if if_branch == None:
-                raise self.error(self.current_tok, f"Expected a ternary operator False branch (after '{self.previous_tok.lexeme}')")
+            if value == None:
+                raise self.error(self.current_tok, f"Expected an initial dictionary value (after '{self.previous_tok.lexeme}')")
+            values.append(value) # There must be a value
 
-            self.consume(f"Expected a ':' in ternary operator (after '{self.previous_tok.lexeme}')", T_COLON)
+            while self.match(T_COMMA): # Every further entry follows a comma
+                if self.check(T_RPAR): break # Trailing commas are allowed
 
-            else_branch = self.expr(True)
+                key = yield False
+                keys.append(key)
 
-            if else_branch == None:
-                raise self.error(self.current_tok, f"Expected a ternary operator True branch (after '{self.previous_tok.lexeme}')")
-
-            return TernaryExpr(condition, if_branch, else_branch)
-        return condition
-
-    def lambda_expr(self, nullable = False):
-        if self.match(T_LAMBDA):
-            keyword : Token = self.previous_tok
-            identifier : Token = self.consume("Expected an identifier (after 'lam' keyword)", T_IDENTIFIER)
-            if self.is_at_end:
-                raise self.error(self.current_tok, f"Expected a lambda expression body (after identifier '{self.previous_tok.lexeme}')")
-            body = self.expr(nullable)
-            return LambdaExpr(keyword, identifier, body)
-        return self.or_expr(nullable)
-
-    def or_expr(self, nullable = False):     return self.bin_op(self.and_expr, (T_OR, ), nullable = nullable)
-    def and_expr(self, nullable = False):    return self.bin_op(self.equality, (T_AND, ), nullable = nullable)
-    def equality(self, nullable = False):    return self.bin_op(self.comparison, (T_EE, T_NE), nullable = nullable)
-    def comparison(self, nullable = False):  return self.bin_op(self.sum, (T_LT, T_LTE, T_GT, T_GTE), nullable = nullable)
-    def sum(self, nullable = False):         return self.bin_op(self.term, (T_PLUS, T_MINUS), nullable = nullable)
-    def term(self, nullable = False):        return self.bin_op(self.unary, (T_STAR, T_SLASH, T_PERCENT), nullable = nullable)
-
-    def unary(self, nullable = False):
-        if self.match(T_PLUS, T_MINUS, T_NOT):
-            operator : Token = self.previous_tok
-            right : UnaryExpr = self.unary(True)
-
-            if right == None:
-                raise self.error(self.current_tok, f"Expected a unary operand (after unary operator '{self.previous_tok.lexeme}')")
-            return UnaryExpr(operator, right)
-        return self.power(nullable)
-
-    def power(self, nullable = False): return self.bin_op(self.factorial, (T_CARET, ), self.unary, nullable)
-
-    def factorial(self, nullable = False):
-        expr = self.call(nullable)
-
-        while self.match(T_NOT): # There can be as many !s after the expression
-            expr = FactorialExpr(expr)
-        return expr
+                self.consume("Expected a ':' after dictionary key", T_COLON)
 
-    def call(self, nullable = False):
-        expr = self.atom(nullable)
+                value = yield True
 
-        while True:
-            if self.match(T_LPAR):
-                expr = self.finish_call(expr)
-            elif self.match(T_LSQR):
-                expr = self.finish_subscript(expr)
-            else:
-                break
+                if value == None:
+                    raise self.error(self.current_tok, f"Expected a dictionary value (after '{self.previous_tok.lexeme}')")
+                values.append(value)
+                
+            rpar = self.consume(f"Expected a closing ')' for dictionary (after '{self.previous_tok.lexeme}')", T_RPAR) # Grouping
+            return DictionaryExpr(lpar, rpar, keys, values)
 
+        self.consume(f"Expected a closing ')' for grouping (after '{self.previous_tok.lexeme}')", T_RPAR) # Grouping
         return expr
 
-    def atom(self, nullable = False):
-        if self.match(T_IN):
-            kw = self.previous_tok
-            prompt = self.expr(True) # There may not be a prompt
-            return InputExpr(prompt, kw)
-        if self.match(T_INT, T_FLOAT, T_STRING, T_TRUE, T_FALSE, T_NULL): return LiteralExpr(self.previous_tok)
-        if self.match(T_IDENTIFIER):
-            if self.match(T_COLON):
-                raise self.error(self.previous_tok, "Goto label in expression")
-            return VariableExpr(self.previous_tok)
-        if self.match(T_LPAR):
-            self.nest_depth += 1
-            if self.nest_depth >= MAX_NEST_DEPTH:
-                raise self.error(self.current_tok, "Maximum parentheses nesting depth reached")
-            lpar = self.previous_tok
-            expr : Expr = self.expr() # Can be an expression or a dictionary key
-            if self.match(T_COLON): # Dictionary literal
-                keys = [expr]
-                values = []
-
-                value = self.expr(True)
+    def array(self, lsqr : Token):
+        elements = []
 
-                if value == None:
-                    raise self.error(self.current_tok, f"Expected an initial dictionary value (after '{self.previous_tok.lexeme}')")
-                values.append(value) # There must be a value
-
-                if self.match(T_COMMA): # If there is comma we might have more entries
-                    while True:
-                        key = self.expr(True)
-                        if key == None:
-                            break
-                        keys.append(key)
-
-                        self.consume("Expected a ':' after dictionary key", T_COLON)
-
-                        value = self.expr(True)
-
-                        if value == None:
-                            raise self.error(self.current_tok, f"Expected a dictionary value (after '{self.previous_tok.lexeme}')")
-                        values.append(value)
-
-                        if self.check(T_COMMA) and self.next_tok.type == T_RPAR: # Traling commas are allowed
-                            self.advance() # Consume the trailing comma, and let the ')' be consumed by the consume function
-                            break
-                    
-                rpar = self.consume(f"Expected a closing ')' for dictionary (after '{self.previous_tok.lexeme}')", T_RPAR) # Grouping
-                self.nest_depth -= 1
-                return DictionaryExpr(lpar, rpar, keys, values)
-            else:
-                self.consume(f"Expected a closing ')' for grouping (after '{self.previous_tok.lexeme}')", T_RPAR) # Grouping
-                self.nest_depth -= 1
-            return expr
+        while not self.check(T_RSQR):
+            elements.append((yield False))
+            if not self.match(T_COMMA): # Trailing commas are allowed
+                break
 
-        if not nullable:
-            raise self.error(self.current_tok, "Expected an expression, a boolean, a string, a number, or 'nul'") # Default error message
-        
-        return None
+        rsqr = self.consume(f"Expected a closing ']' for array (after '{self.previous_tok.lexeme}')", T_RSQR)
+        return ArrayExpr(lsqr, elements, rsqr)
 
     def finish_subscript(self, atom : Expr):
-        subscript = self.expr()
+        subscript = yield False
 
         self.consume("Expected a closing ']' after subscriptio", T_RSQR)
         return SubscriptExpr(atom, subscript)
@@ -390,7 +458,7 @@ class Parser:
                 if len(arguments) > MAX_ARG_COUNT:
                     self.error(self.current_tok, f"Maximum argument count ({MAX_ARG_COUNT}) reached")
                 
-                arguments.append(self.expr())
+                arguments.append((yield False))
 
                 if self.check(T_COMMA) and self.next_tok.type == T_RPAR:
                     self.advance()
@@ -401,18 +469,3 @@ class Parser:
 
         r_par = self.consume("Expected a closing ')' after function call", T_RPAR)
         return CallExpr(callee, r_par, arguments)
-
-    def bin_op(self, left_rule : type, operators : tuple[int], right_rule : type = None, nullable = False) -> BinaryExpr | Expr:
-        if right_rule == None: right_rule = left_rule
-        left : Expr = left_rule(nullable)
-
-        while self.matcht(operators):
-            operator : Token = self.previous_tok
-            right : Expr = right_rule(True)
-
-            if right == None:
-                raise self.error(self.current_tok, f"Expected a right binary operand (after '{operator.lexeme}')")
-
-            left = BinaryExpr(left, operator, right)
-
-        return left
\ No newline at end of file
@@ -0,0 +1,242 @@
+from Flow import StackError, decode, stack_depths
+from Opcodes import *
+from Switch import write_distances
+
+### Register bytecode ###
+# Lowers the finished stack code of a Chunk into three address code for the register VM.
+# No calls means the stack depth before every instruction is known, so each stack position becomes a register and
+# locals keep their slots. Constants and locals that are pushed are not copied: the stack is followed at compile time
+# and instructions read them where they already are. Values only move into their own register where something needs
+# them there, before a jump, a label or an assignment to the local they came from
+
+HEADER0 = 0xFA
+HEADER1 = 0xCD # The stack code header ends in 0xCC
+
+CONSTANT_BIT = 0x8000 # Marks an RK operand as a constant index
+MAX_OPERAND = 2**16 - 1
+
+TRUE, FALSE, NULL = -1, -2, -3 # Pushed values with no constant, loaded into a register when something reads them
+LOADS = {TRUE: R_TRUE, FALSE: R_FALSE, NULL: R_NULL}
+PUSHED_VALUES = {OP_TRUE: TRUE, OP_FALSE: FALSE, OP_NULL: NULL}
+SMALL_INTS = {OP_NEG1: -1, OP_0: 0, OP_1: 1, OP_2: 2}
+
+UNARY = {OP_NEGATE: R_NEGATE, OP_NOT: R_NOT, OP_FACT: R_FACT, OP_GET_INPUT: R_GET_INPUT}
+BINARY = {
+    OP_ADD: R_ADD, OP_SUB: R_SUB, OP_MUL: R_MUL, OP_DIV: R_DIV, OP_MOD: R_MOD, OP_POW: R_POW,
+    OP_EQ: R_EQ, OP_LT: R_LT, OP_GT: R_GT, OP_AND: R_AND, OP_OR: R_OR, OP_SUBSCRIPT: R_SUBSCRIPT,
+    OP_ADD_II: R_ADD_II, OP_SUB_II: R_SUB_II, OP_MUL_II: R_MUL_II, OP_MOD_II: R_MOD_II, OP_EQ_II: R_EQ_II, OP_LT_II: R_LT_II, OP_GT_II: R_GT_II,
+    OP_ADD_FF: R_ADD_FF, OP_SUB_FF: R_SUB_FF, OP_MUL_FF: R_MUL_FF, OP_LT_FF: R_LT_FF, OP_GT_FF: R_GT_FF,
+}
+
+R_JUMPS_FORWARD = (R_JUMP, R_JUMP_IF_FLS, R_FOR_PREP)
+R_JUMPS_BACK = (R_LOOP, R_FOR_RANGE)
+
+class Unsupported(Exception): pass # Stack code the register VM cannot run, the chunk keeps it as it is
+
+class RegisterInstruction:
+    def __init__(self, op : int, operands : list[int], target = None, table : list[int] = [], cases : list = []):
+        self.op = op
+        self.operands = operands # Two bytes each, without the jump distance
+        self.target = target # The stack instruction a jump lands on
+        self.table = table # An R_SWITCH's table, see Switch.py
+        self.cases = cases # The stack instructions its distances land on
+        self.offset = 0
+
+    @property
+    def size(self): return 1 + 2 * len(self.operands) + (2 if self.target != None else 0) + len(self.table)
+
+class RegisterReport:
+    def __init__(self):
+        self.stack_instructions = 0
+        self.register_instructions = 0
+        self.registers = 0
+        self.kept : str | None = None # Why the stack code was kept
+
+    def lines(self) -> list[str]:
+        if self.kept != None: return [f"kept the stack code, {self.kept}"]
+        return [f"{self.stack_instructions} stack instructions -> {self.register_instructions} register instructions on {self.registers} registers"]
+
+class Lowering:
+    def __init__(self, int_constant):
+        self.int_constant = int_constant # Returns the constant index of an int, adding it to the pool if needed
+        self.code : list[RegisterInstruction] = []
+        self.entries : list[int] | None = [] # What each stack position holds: its own register, another register, an RK constant or TRUE, FALSE or NULL
+        self.last : RegisterInstruction | None = None # Wrote the top register just now, its destination can still change
+        self.labels : dict[int, int] = {} # Id of a stack instruction to the index of the first register instruction after it
+
+    def emit(self, op : int, *operands : int, target = None, table : list[int] = [], cases : list = []) -> RegisterInstruction:
+        if any(not 0 <= operand <= MAX_OPERAND for operand in operands): raise Unsupported("an operand does not fit in two bytes")
+        instruction = RegisterInstruction(op, list(operands), target, table, cases)
+        self.code.append(instruction)
+        self.last = None
+        return instruction
+
+    def materialize(self, depth : int): # Moves the value at a stack position into its own register
+        entry = self.entries[depth]
+        if entry == depth: return
+        if entry < 0: self.emit(LOADS[entry], depth)
+        else: self.emit(R_MOVE, depth, entry)
+        self.entries[depth] = depth
+
+    def flush(self, count : int):
+        for depth in range(count): self.materialize(depth)
+
+    def operand(self, depth : int) -> int: # The value at a stack position as an RK operand
+        if self.entries[depth] < 0: self.materialize(depth)
+        return self.entries[depth]
+
+    def release(self, register : int): # Before a local changes, the values pushed from it get their own copy
+        for depth, entry in enumerate(self.entries):
+            if entry == register and depth != register: self.materialize(depth)
+
+    def result(self, op : int, *operands : int): # Writes a new value to the register of the next stack position
+        depth = len(self.entries)
+        instruction = self.emit(op, depth, *operands)
+        self.entries.append(depth)
+        self.last = instruction
+
+    def push_constant(self, index : int):
+        if index >= CONSTANT_BIT: raise Unsupported("a constant index does not fit in an operand")
+        self.entries.append(CONSTANT_BIT | index)
+
+    def set_local(self, slot : int):
+        top = len(self.entries) - 1
+        self.release(slot)
+        if self.last != None and self.last.operands[0] == top and self.entries[top] == top: # Write the result straight into the local instead of moving it there
+            self.last.operands[0] = slot
+        else:
+            self.emit(R_MOVE, slot, self.operand(top))
+        self.entries[slot] = slot
+        self.entries[top] = slot
+        self.last = None
+
+    def label(self, instruction, depth : int, needed : int):
+        if self.entries != None: self.flush(needed) # Falling through, jumps flush the same way before they leave
+        self.entries = list(range(depth))
+        self.labels[id(instruction)] = len(self.code)
+        self.last = None
+
+    def lower(self, instruction, needed):
+        op = instruction.op
+        top = len(self.entries) - 1
+
+        if op == OP_CONSTANT: self.push_constant(instruction.operands[0])
+        elif op == OP_CONSTANT_LONG: self.push_constant(instruction.operands[0] | (instruction.operands[1] << 8) | (instruction.operands[2] << 16))
+        elif op in SMALL_INTS: self.push_constant(self.int_constant(SMALL_INTS[op]))
+        elif op in PUSHED_VALUES: self.entries.append(PUSHED_VALUES[op])
+        elif op == OP_GET_LOCAL: self.entries.append(self.entries[instruction.index])
+        elif op == OP_SET_LOCAL: self.set_local(instruction.index)
+        elif op == OP_GET_GLOBAL_SLOT: self.result(R_GET_GLOBAL, instruction.index)
+        elif op == OP_SET_GLOBAL_SLOT: self.emit(R_SET_GLOBAL, instruction.index, self.operand(top))
+        elif op == OP_DEFINE_GLOBAL_SLOT:
+            self.emit(R_DEFINE_GLOBAL, instruction.index, self.operand(top))
+            self.entries.pop()
+        elif op == OP_POP: self.entries.pop()
+        elif op == OP_PRINT:
+            self.emit(R_PRINT, self.operand(top))
+            self.entries.pop()
+        elif op in UNARY:
+            value = self.operand(top)
+            self.entries.pop()
+            self.result(UNARY[op], value)
+        elif op in BINARY:
+            right = self.operand(top)
+            left = self.operand(top - 1)
+            del self.entries[top - 1:]
+            self.result(BINARY[op], left, right)
+        elif op in (OP_BUILD_DICT, OP_BUILD_ARRAY):
+            count = instruction.operands[0] | (instruction.operands[1] << 8)
+            base = len(self.entries) - (2 * count if op == OP_BUILD_DICT else count)
+            for depth in range(base, len(self.entries)): self.materialize(depth)
+            self.emit(R_BUILD_DICT if op == OP_BUILD_DICT else R_BUILD_ARRAY, base, count)
+            del self.entries[base:]
+            self.entries.append(base)
+        elif op == OP_JUMP_IF_FLS:
+            self.flush(needed)
+            self.emit(R_JUMP_IF_FLS, self.operand(top), target = instruction.target)
+        elif op in (OP_JUMP, OP_LOOP):
+            self.flush(needed)
+            self.emit(R_JUMP if op == OP_JUMP else R_LOOP, target = instruction.target)
+            self.entries = None # Only a label is reached next
+        elif op in (OP_FOR_PREP, OP_FOR_RANGE):
+            self.flush(len(self.entries))
+            slot = instruction.operands[0] | (instruction.operands[1] << 8)
+            self.emit(R_FOR_PREP if op == OP_FOR_PREP else R_FOR_RANGE, slot, target = instruction.target)
+        elif op == OP_SWITCH:
+            self.flush(needed)
+            self.emit(R_SWITCH, self.operand(top), table = list(instruction.operands), cases = instruction.cases)
+            self.entries = None
+        elif op == OP_RETURN:
+            self.emit(R_RETURN)
+            self.entries = None
+        elif op != OP_NOP:
+            raise Unsupported(f"it uses instruction {op}")
+
+    def drop_jumps_to_next(self): # Pops cost nothing in register code, so an else branch can end up jumping to the next instruction
+        kept = []
+        moved = [] # Old index to new index
+        for index, instruction in enumerate(self.code):
+            moved.append(len(kept))
+            if instruction.op == R_JUMP and self.labels[id(instruction.target)] == index + 1: continue
+            kept.append(instruction)
+        moved.append(len(kept))
+        self.code = kept
+        self.labels = {key: moved[index] for key, index in self.labels.items()}
+
+    def encode(self, start : int) -> list[int]:
+        self.drop_jumps_to_next()
+        offset = start
+        for instruction in self.code:
+            instruction.offset = offset
+            offset += instruction.size
+        end = offset
+
+        def landing(target) -> int:
+            index = self.labels[id(target)]
+            return self.code[index].offset if index < len(self.code) else end
+
+        encoded = []
+        for instruction in self.code:
+            encoded.append(instruction.op)
+            for operand in instruction.operands: encoded.extend((operand & 0xff, operand >> 8))
+            after = instruction.offset + instruction.size
+            if len(instruction.table) > 0:
+                distances = [landing(case) - after for case in instruction.cases]
+                if any(not 0 <= distance <= MAX_OPERAND for distance in distances): raise Unsupported("a jump is too long")
+                write_distances(instruction.table, distances)
+                encoded.extend(instruction.table)
+            if instruction.target == None: continue
+
+            distance = landing(instruction.target) - after if instruction.op in R_JUMPS_FORWARD else after - landing(instruction.target)
+            if not 0 <= distance <= MAX_OPERAND: raise Unsupported("a jump is too long")
+            encoded.extend((distance & 0xff, distance >> 8))
+        return encoded
+
+def lower(code : list[int], start : int, int_constant) -> tuple[list[int], RegisterReport]:
+    # start is where the instructions begin, after the stack header. Returns the register code with its own header, or the code as it was
+    report = RegisterReport()
+    try:
+        instructions = decode(code, start)
+        for position, instruction in enumerate(instructions): instruction.position = position
+        depths, deepest = stack_depths(instructions)
+        if deepest >= CONSTANT_BIT: raise Unsupported("it needs too many registers")
+
+        targets = {id(target) for instruction in instructions for target in instruction.targets}
+        needed = lambda target: depths[target.position] - (1 if target.op == OP_POP else 0) # A value that is popped where the jump lands can stay where it is
+
+        lowering = Lowering(int_constant)
+        for instruction, depth in zip(instructions, depths):
+            if depth == None: continue # Never runs
+            if id(instruction) in targets: lowering.label(instruction, depth, needed(instruction))
+            lowering.lower(instruction, max((needed(target) for target in instruction.targets), default = 0))
+            report.stack_instructions += 1
+
+        header = [HEADER0, HEADER1, deepest & 0xff, deepest >> 8] # The VM sizes the registers before it runs anything
+        registers = header + lowering.encode(len(header))
+    except (Unsupported, StackError, KeyError, IndexError) as e: # A jump that does not land on an instruction ends up here too
+        report.kept = str(e) if type(e) in (Unsupported, StackError) else "its jumps could not be followed"
+        return code, report
+
+    report.register_instructions = len(lowering.code)
+    report.registers = deepest
+    return registers, report
@@ -1,3 +1,5 @@
+from array import array
+
 from Token import Position, Token
 from Value import TimidCallable
 
@@ -26,6 +28,22 @@ def IsEqual(a : object, b : object):
         return True
     return False
 
+def DictKey(value : object): # Values that IsEqual calls equal make the same key, None if the value cannot be a key
+    if IsNumeric(value):
+        number = ToNumber(value)
+        if isinstance(number, float) and number.is_integer(): return int(number)
+        return int(number) if isinstance(number, bool) else number
+    if isinstance(value, str): return value
+    return None
+
+def MakeArray(values : list[object]) -> array | None: # Integers are packed as 'q' and anything with a float as 'd', None if a value is not a number
+    integral = True
+    for i, value in enumerate(values):
+        if not IsNumeric(value): return None
+        if isinstance(value, float): integral = False
+        elif value == None: values[i] = 0 # tru and fls are stored as integers already, nul is zero
+    return array('q' if integral else 'd', values)
+
 def ToNumber(value : object):
     if isinstance(value, (int, float)): return value
     elif isinstance(value, bool): return int(value)
@@ -42,41 +60,62 @@ def ToString(value : object):
         return "nul"
     if isinstance(value, TimidCallable):
         return value.ToString
+    if isinstance(value, dict):
+        return "(" + ", ".join(f"{ToString(key)}: {ToString(item)}" for key, item in value.items()) + ")"
+    if isinstance(value, array):
+        return "[" + ", ".join(map(str, value)) + "]"
     return str(value)
 
 def Truth(value : object):
     if isinstance(value, (int, float, bool)):
         return value != 0
-    if isinstance(value, str):
+    if isinstance(value, (str, dict, array)):
         return len(value) > 0
     if isinstance(value, type(None)):
         return False
 
 class Environment:
+    DEFINITIONS : dict[str, int] = {} # How many times each name was added to some scope, a cached lookup of it is good while this stays the same
+
     def __init__(self , enclosing = None):
         self.enclosing : Environment = enclosing
         self.values : dict[str, object] = {}
 
     def define(self, name : str, value : object):
-        self.values[name] = value
+        values = self.values
+        if name not in values:
+            definitions = Environment.DEFINITIONS
+            definitions[name] = definitions.get(name, 0) + 1
+        values[name] = value
+
+    def resolve(self, name : str) -> int: # How many environments out the name is defined, -1 if it isn't
+        hops = 0
+        environment = self
+        while environment != None:
+            if name in environment.values:
+                return hops
+            environment = environment.enclosing
+            hops += 1
+        return -1
+
+    def ancestor(self, hops : int):
+        environment = self
+        while hops > 0 and environment != None:
+            environment = environment.enclosing
+            hops -= 1
+        return environment
 
     def get(self, name : Token):
-        if name.lexeme in self.values.keys():
-            return self.values[name.lexeme]
-
-        if self.enclosing != None:
-            return self.enclosing.get(name)
-
-        raise RuntimeError(name.pos_start, name.pos_end, f"Undefined variable '{name.lexeme}'")
+        hops = self.resolve(name.lexeme)
+        if hops < 0:
+            raise RuntimeError(name.pos_start, name.pos_end, f"Undefined variable '{name.lexeme}'")
+        return self.ancestor(hops).values[name.lexeme]
 
     def assign(self, name : Token, value : object):
-        if name.lexeme in self.values.keys():
-            self.values[name.lexeme] = value
-            return
-        if self.enclosing != None:
-            self.enclosing.assign(name, value)
-            return
-        raise RuntimeError(name.pos_start, name.pos_end, f"Undefined variable '{name.lexeme}'")
+        hops = self.resolve(name.lexeme)
+        if hops < 0:
+            raise RuntimeError(name.pos_start, name.pos_end, f"Undefined variable '{name.lexeme}'")
+        self.ancestor(hops).values[name.lexeme] = value
 
     def copy(self):
         copy = Environment(self.enclosing)
@@ -0,0 +1,186 @@
+import io, os, signal, socket, socketserver, struct, sys, tempfile, threading
+
+### Protocol ###
+# Request:  kind (1 byte) | optimization level (1 byte) | backend (1 byte) | name length (4 bytes) | name | payload length (4 bytes) | payload
+# Response: status (1 byte) | payload length (4 bytes) | payload
+# All lengths are big endian. A connection can carry any number of requests.
+
+REQUEST_PATH = 0 # The name is a path the server reads itself, the payload is empty
+REQUEST_SOURCE = 1 # The name is only used for diagnostics, the payload is the source
+
+BACKEND_STACK = 0 # Code for the stack VM
+BACKEND_REGISTERS = 1 # Code for the register VM, like --registers
+
+RESPONSE_OK = 0 # Payload is the .timb bytecode
+RESPONSE_ERROR = 1 # Payload is the diagnostics text
+
+LENGTH = struct.Struct("!I")
+
+CACHE_SIZE = 64 # Compiled results the server keeps, the least recently used goes first
+
+def default_socket_path() -> str:
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(tempfile.gettempdir(), f"timid-{uid}.sock")
+
+def compile_source(source : str, name : str, opt_level : int = 1, registers : bool = False) -> tuple[bytes | None, str]: # Returns the bytecode (None on failure) and the diagnostics
+    from Compiler import Compiler # Only the server needs the compiler, clients stay thin
+    from Error import ErrorReporter, TooManyErrors
+    from Lexer import Lexer
+    from Parser import Parser
+
+    diagnostics = io.StringIO()
+    ErrorReporter.begin(diagnostics) # Error state is per thread, so this only resets the current request
+
+    try:
+        lexer = Lexer(source, name)
+        tokens = lexer.lex()
+        if ErrorReporter.HAD_ERROR: return None, diagnostics.getvalue()
+
+        statements = Parser(tokens).parse()
+        if ErrorReporter.HAD_ERROR: return None, diagnostics.getvalue()
+
+        bytecode = Compiler(statements, lexer.symbols, opt_level = opt_level, registers = registers).assemble()
+        return bytecode, diagnostics.getvalue()
+    except TooManyErrors:
+        return None, diagnostics.getvalue()
+    finally:
+        ErrorReporter.begin()
+
+def read_exactly(stream, size : int) -> bytes | None:
+    data = stream.read(size)
+    if len(data) < size: return None # The other side hung up
+    return data
+
+def read_sized(stream) -> bytes | None:
+    header = read_exactly(stream, LENGTH.size)
+    if header == None: return None
+    return read_exactly(stream, LENGTH.unpack(header)[0])
+
+def write_sized(stream, data : bytes):
+    stream.write(LENGTH.pack(len(data)))
+    stream.write(data)
+
+class CompileHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            header = read_exactly(self.rfile, 3)
+            if header == None: return
+            kind, opt_level, backend = header
+
+            name = read_sized(self.rfile)
+            payload = read_sized(self.rfile)
+            if name == None or payload == None: return
+
+            status, response = self.compile_request(kind, opt_level, backend, name.decode(), payload)
+
+            self.wfile.write(bytes([status]))
+            write_sized(self.wfile, response)
+            self.wfile.flush()
+
+    def compile_request(self, kind : int, opt_level : int, backend : int, name : str, payload : bytes) -> tuple[int, bytes]:
+        from Compiler import MAX_OPT_LEVEL
+
+        if opt_level > MAX_OPT_LEVEL:
+            return RESPONSE_ERROR, f"Unknown optimization level {opt_level}\n".encode()
+        if backend not in (BACKEND_STACK, BACKEND_REGISTERS):
+            return RESPONSE_ERROR, f"Unknown backend {backend}\n".encode()
+        options = (opt_level, backend) # The same source compiles differently for each
+
+        if kind == REQUEST_PATH:
+            try:
+                stat = os.stat(name) # Taken before reading, so a file that changes while it is read is compiled again next time
+                with open(name, 'r') as f:
+                    source = f.read()
+            except OSError:
+                return RESPONSE_ERROR, f"File not found error: \n\tFile {os.path.abspath(name)} could not be found\n".encode()
+            key = (kind, *options, os.path.abspath(name), stat.st_mtime_ns, stat.st_size)
+        elif kind == REQUEST_SOURCE:
+            source = payload.decode()
+            key = (kind, *options, name, payload) # The name shows up in the diagnostics
+        else:
+            return RESPONSE_ERROR, f"Unknown request kind {kind}\n".encode()
+
+        result = self.server.cache.get(key)
+        if result != None: return result
+
+        try:
+            bytecode, diagnostics = compile_source(source, name, opt_level, backend == BACKEND_REGISTERS)
+        except Exception as e: # A crash in one request must not take the server down, and is not kept
+            return RESPONSE_ERROR, f"Internal compiler error: {e!r}\n".encode()
+
+        result = (RESPONSE_ERROR, diagnostics.encode()) if bytecode == None else (RESPONSE_OK, bytecode)
+        self.server.cache.put(key, result)
+        return result
+
+class CompileCache: # Responses by the file and its modification time, or by the source, shared by every connection
+    def __init__(self, size : int = CACHE_SIZE):
+        self.size = size
+        self.results : dict[tuple, tuple[int, bytes]] = {} # Oldest use first
+        self.lock = threading.Lock() # Requests are handled on their own threads
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key : tuple) -> tuple[int, bytes] | None:
+        with self.lock:
+            result = self.results.pop(key, None)
+            if result == None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.results[key] = result # Moved to the back, it is the most recently used now
+            return result
+
+    def put(self, key : tuple, result : tuple[int, bytes]):
+        with self.lock:
+            self.results[key] = result
+            if len(self.results) > self.size:
+                del self.results[next(iter(self.results))]
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    cache : CompileCache = None # Set by serve
+
+def serve(path : str): # Requests say what level and backend they want
+    if os.path.exists(path): # Left over from a server that did not shut down cleanly
+        os.unlink(path)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0)) # Clean up the socket when killed too
+
+    with CompileServer(path, CompileHandler) as server:
+        server.cache = CompileCache()
+        sys.stderr.write(f"Timid compile server listening on {path}\n")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(path)
+            cache = server.cache
+            sys.stderr.write(f"Timid compile server stopped, {cache.hits} requests answered from the cache, {cache.misses} compiled\n")
+
+class CompileClient:
+    def __init__(self, path : str, opt_level : int = 1, registers : bool = False): # Every request asks for this level and backend
+        self.opt_level = opt_level
+        self.backend = BACKEND_REGISTERS if registers else BACKEND_STACK
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.stream = self.socket.makefile("rwb")
+
+    def request(self, kind : int, name : str, payload : bytes = b"") -> tuple[int, bytes]:
+        self.stream.write(bytes([kind, self.opt_level, self.backend]))
+        write_sized(self.stream, name.encode())
+        write_sized(self.stream, payload)
+        self.stream.flush()
+
+        status = read_exactly(self.stream, 1)
+        response = read_sized(self.stream)
+        if status == None or response == None:
+            raise ConnectionError("Compile server closed the connection")
+        return status[0], response
+
+    def compile_source(self, source : str, name : str): return self.request(REQUEST_SOURCE, name, source.encode())
+    def compile_path(self, path : str): return self.request(REQUEST_PATH, path)
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
@@ -0,0 +1,77 @@
+import sys
+
+### Output ###
+# Policies, picked with --output-buffer:
+#   None    writes straight to stdout and leaves buffering to it, like print does
+#   "none"  flushes after every write
+#   "line"  flushes after every write that ends a line
+#   a size  keeps writes until that many characters are waiting, then writes them all at once
+
+def parse_output_policy(text : str) -> str | int | None: # None if the text is not a policy
+    if text in ("none", "line"): return text
+    try:
+        size = int(text)
+    except ValueError:
+        return None
+    return size if size > 0 else None
+
+class OutputBuffer:
+    def __init__(self, policy : str | int | None = None):
+        self.policy = policy
+        self.parts : list[str] = []
+        self.waiting = 0 # Characters in parts
+
+    def write(self, text : str):
+        policy = self.policy
+        if type(policy) == int:
+            self.parts.append(text)
+            self.waiting += len(text)
+            if self.waiting >= policy: self.flush()
+            return
+
+        stream = sys.stdout # Looked up on every write, callers can swap stdout out
+        stream.write(text)
+        if policy == "none" or (policy == "line" and text.endswith("\n")):
+            stream.flush()
+
+    def flush(self): # Called before reading input, and when the program ends or fails
+        stream = sys.stdout
+        if len(self.parts) > 0:
+            stream.write("".join(self.parts))
+            self.parts.clear()
+            self.waiting = 0
+        stream.flush()
+
+### Input ###
+# Batch input, picked with --input=<path> or --batch for stdin: in shows no prompt and lines come out of large reads
+# Lines are the same as input() gives, without their '\n', and the end of the input reads as an empty string
+
+INPUT_CHUNK = 1 << 16 # Characters per read
+
+class InputBuffer:
+    def __init__(self, stream = None): # None reads stdin
+        self.stream = stream
+        self.text = "" # What has been read and not handed out yet starts at position
+        self.position = 0
+
+    def read_line(self) -> str | None: # None once the input has run out
+        text = self.text
+        position = self.position
+        end = text.find("\n", position)
+        while end < 0:
+            chunk = (self.stream or sys.stdin).read(INPUT_CHUNK)
+            if chunk == "": break
+            scanned = len(text) - position # The unfinished line has no '\n' so far
+            text = text[position:] + chunk
+            position = 0
+            end = text.find("\n", scanned)
+
+        if end < 0: # The last line may not have a '\n'
+            end = len(text)
+            if position == end:
+                self.text, self.position = text, position
+                return None
+
+        self.text = text
+        self.position = end + 1
+        return text[position:end]
@@ -0,0 +1,77 @@
+### Switch tables ###
+# OP_SWITCH and R_SWITCH are followed by a table that sends the value they take to one arm of an else if chain on constants.
+# A key matches when OP_EQ would say the value equals it: int keys match ints and bools with that value but never floats,
+# string keys match strings with the same characters. Every jump distance is two bytes and counts from the end of the table.
+# The compiler lays a table out here, Flow.py and Registers.py find its distances here, the VM reads it in vm.c switchDistance
+
+SWITCH_INTS = 0 # The lowest key in four bytes, the key count in two, the default distance, then a distance per key from the lowest up
+SWITCH_STRINGS = 1 # A power of two capacity in two bytes, the default distance, then per slot a three byte string constant and a distance
+INTS_HEADER = 9
+STRINGS_HEADER = 5
+SLOT = 5
+EMPTY = 0xffffff # The constant of a slot with no key, lookups stop there
+
+MIN_ARMS = 3 # Fewer compare faster than they look up
+MAX_SPREAD = 4 # An int table has at most this many entries per key
+MAX_INT_KEY = 2**31 - 1
+MAX_CAPACITY = 2**15 # Two bytes
+
+def string_hash(string : str) -> int: # Like hashString in object.c
+    hash = 2166136261
+    for char in string:
+        hash = ((hash ^ ord(char)) * 16777619) & 0xffffffff
+    return hash
+
+def vm_string(string : str) -> str: # The VM's copy of a string constant ends at the first null
+    return string.split('\0')[0]
+
+def int_table(keys : list[int]) -> tuple[list[int], list[int | None]] | None:
+    # keys has the constant of each arm. Returns the table with its distances left at 0 and the arm each distance goes to, None for the default.
+    # None if the keys are too far apart for a dense table
+    low, high = min(keys), max(keys)
+    count = high - low + 1
+    if low < -MAX_INT_KEY - 1 or high > MAX_INT_KEY or count > MAX_SPREAD * len(set(keys)) or count > 2**16 - 1: return None
+
+    arm_of = {}
+    for arm, key in enumerate(keys): arm_of.setdefault(key, arm) # The chain tests in order, so the first arm with a key wins
+    table = [SWITCH_INTS, *(low & 0xffffffff).to_bytes(4, 'little'), count & 0xff, count >> 8, 0, 0] + [0, 0] * count
+    return table, [None] + [arm_of.get(key) for key in range(low, high + 1)]
+
+def string_table(keys : list[tuple[str, int]]) -> tuple[list[int], list[int | None]] | None: # keys has the string and its constant index of each arm
+    first = {} # What the VM compares to the arm and constant that tests it first
+    for arm, (string, constant) in enumerate(keys): first.setdefault(vm_string(string), (arm, constant))
+
+    capacity = 1
+    while capacity < 2 * len(first): capacity *= 2 # At most half full, lookups of missing strings stop early
+    if capacity > MAX_CAPACITY: return None
+
+    slots : list[tuple[int, int] | None] = [None] * capacity
+    for string, (arm, constant) in first.items(): # Linear probing, like the VM looks them up
+        i = string_hash(string) & (capacity - 1)
+        while slots[i] != None: i = (i + 1) & (capacity - 1)
+        slots[i] = (constant, arm)
+
+    table = [SWITCH_STRINGS, capacity & 0xff, capacity >> 8, 0, 0]
+    arms = [None]
+    for slot in slots:
+        constant = EMPTY if slot == None else slot[0]
+        table.extend((constant & 0xff, (constant >> 8) & 0xff, constant >> 16, 0, 0))
+        if slot != None: arms.append(slot[1])
+    return table, arms
+
+def table_size(code : list[int], at : int) -> int: # Of the table that starts at code[at]
+    if code[at] == SWITCH_INTS: return INTS_HEADER + 2 * (code[at + 5] | (code[at + 6] << 8))
+    return STRINGS_HEADER + SLOT * (code[at + 1] | (code[at + 2] << 8))
+
+def distance_positions(table : list[int]) -> list[int]: # Where each distance is in the table, the default first and then in the order of int_table and string_table's arms
+    if table[0] == SWITCH_INTS: return [7] + [INTS_HEADER + 2 * i for i in range(table[5] | (table[6] << 8))]
+    positions = [3]
+    for slot in range(STRINGS_HEADER, len(table), SLOT):
+        if table[slot] | (table[slot + 1] << 8) | (table[slot + 2] << 16) != EMPTY: positions.append(slot + 3)
+    return positions
+
+def read_distances(table : list[int]) -> list[int]:
+    return [table[at] | (table[at + 1] << 8) for at in distance_positions(table)]
+
+def write_distances(table : list[int], distances : list[int]):
+    for at, distance in zip(distance_positions(table), distances): table[at:at + 2] = [distance & 0xff, distance >> 8]
@@ -1,21 +1,36 @@
-import os, sys
-import subprocess, getopt, pathlib
-
-from Compiler import *
-from Error import ErrorReporter
-from Lexer import Lexer
-from Parser import *
-from Interpreter import Interpreter
+import os, sys # Everything else is imported by the mode that needs it, so printing the version doesn't load the compiler
+
 import Globals
 
 class Timid:
-    INTERPRETER = Interpreter()
+    INTERPRETER = None # Created on first use, importing the interpreter pulls in the whole runtime
 
     COMPILE_ONLY = False
+    INTERPRET = False
+    MEMO_SIZE = 0 # Results cached per pure lambda when interpreting, 0 for none
+    DEFAULT_MEMO_SIZE = 128
+    OUTPUT_BUFFER = None # How printed output is buffered, see Streams.py, None leaves it to stdout
+    INPUT_PATH = None # Where batch input is read from, "-" for stdin, None asks for every line
     COMPILER_DEBUG = False
+    OPT_LEVEL = 1 # See Compiler.py, the compiler is not imported just to read its default
+    OPT_REPORT = False
+    REGISTERS = False # Compile for the register VM instead of the stack VM
+    WATCH = False
+    SERVER = False
+    CLIENT = False
+
+    SOCKET_PATH = None # Defaults to Server.default_socket_path()
+
+    WATCH_INTERVAL = 0.25 # Seconds between polls of the watched files
+    WATCH_CACHE_SIZE = 64 # Compiled sources --watch keeps, the least recently used goes first
 
     BINARY_PATH = None
 
+    SHORT_OPTIONS = {'c': "compile", 'd': "dev", 'h': "help", 'i': "interpret", 'v': "version", 'w': "watch"}
+    LONG_OPTIONS = ("compile", "dev", "help", "interpret", "version", "watch", "server", "client", "batch", "opt-report", "registers")
+    VALUE_OPTIONS = ("socket", "max-errors", "output-buffer", "input", "optimize") # Long options that take a value
+    OPTIONAL_VALUE_OPTIONS = ("memoize",) # Long options that may take a value, only with '='
+
     @staticmethod
     def init():
         args = sys.argv[1:]
@@ -23,90 +38,343 @@ class Timid:
             Timid.show_usage()
             sys.exit(64)
         else:
-            Timid.run_files(Timid.get_args(args))
+            files = Timid.get_args(args)
+            if Timid.SERVER:
+                Timid.run_server()
+            elif Timid.CLIENT:
+                Timid.run_client(files)
+            elif Timid.WATCH:
+                Timid.watch_files(files)
+            elif Timid.INTERPRET:
+                for path in files:
+                    Timid.run_file(path)
+            else:
+                Timid.run_files(files)
 
     @staticmethod
     def show_usage():
-        print("Usage: Timid [-c | --compile] [-d | --dev] [--dest = <path>] [-h | --help] [-v | --version] <.timid files>")
+        print("Usage: Timid [-c | --compile] [-d | --dev] [--dest = <path>] [-h | --help] [-i | --interpret] [--memoize[=<size>]] [-v | --version] [-w | --watch] [--server | --client] [--socket=<path>] [--max-errors=<count>] [--output-buffer=<size> | line | none] [--batch | --input=<path>] [-O<level> | --optimize=<level>] [--opt-report] [--registers] <.timid files>")
         print("")
         print("Options:")
         print("-c, --compile:\tcompiles program without running it")
         #print("--dest:\t\tsets destination for binary files")
         print("-d, --dev:\tenables debug messages")
         print("-h, --help:\tprints this help message")
+        print("-i, --interpret:\truns files with the tree walking interpreter instead of compiling them")
+        print("--memoize:\tinterprets, caching the results of pure lambdas (default size 128 per lambda)")
         print("-v, --version:\tprints Timid's version")
+        print("-w, --watch:\trecompiles and reruns files whenever they change, with -i interprets them again instead")
+        print("--server:\tkeeps a compiler running in the background, listening on a unix socket")
+        print("--client:\tcompiles files using a running compile server, at the client's -O level and backend")
+        print("--socket:\tsets the socket the compile server listens on")
+        print("--max-errors:\tstops compiling a file after this many errors (default 100, 0 for no limit)")
+        print("--output-buffer:\twrites output in chunks of this many characters, after every line or after every print")
+        print("--batch:\treads input from stdin in large chunks and shows no prompts")
+        print("--input:\tlike --batch, reading input from a file instead")
+        print("-O, --optimize:\tsets how much the compiler optimizes, 0 for nothing, 1 by default, 2 also moves loop invariant expressions out of loops and drops unused globals")
+        print("--opt-report:\tlists what the optimizations removed or moved in every compiled file")
+        print("--registers:\tcompiles to register code, the runtime runs it on its register VM")
 
     @staticmethod
     def show_version():
         print(f"Timid version {Globals.VERSION}")
 
+    @staticmethod
+    def parse_options(args : list[str]) -> tuple[list[tuple[str, str]], list[str]]: # A small getopt replacement, importing getopt also imports gettext and locale
+        options = []
+        index = 0
+
+        while index < len(args):
+            arg = args[index]
+
+            if arg == "--": # Everything after '--' is a file
+                index += 1
+                break
+            elif arg.startswith("--"):
+                name, has_value, value = arg[2:].partition('=')
+
+                if name in Timid.VALUE_OPTIONS:
+                    if not has_value: # The value may also be the next argument
+                        index += 1
+                        if index >= len(args): raise ValueError(f"option --{name} requires an argument")
+                        value = args[index]
+                elif name in Timid.OPTIONAL_VALUE_OPTIONS:
+                    pass
+                elif name not in Timid.LONG_OPTIONS or has_value:
+                    raise ValueError(f"option {arg} not recognized")
+
+                options.append((name, value))
+            elif arg.startswith("-O"): # -O2, the level is part of the option
+                options.append(("optimize", arg[2:]))
+            elif arg.startswith('-') and len(arg) > 1:
+                for char in arg[1:]: # Short options can be grouped, like -cd
+                    if char not in Timid.SHORT_OPTIONS: raise ValueError(f"option -{char} not recognized")
+                    options.append((Timid.SHORT_OPTIONS[char], ""))
+            else: # The first file ends the options
+                break
+
+            index += 1
+
+        return options, args[index:]
+
     @staticmethod
     def get_args(args):
         try:
-            options, files = getopt.getopt(args, 'cdhv', ["compile", "dev", "help", "version"])
-        except getopt.GetoptError as e:
+            options, files = Timid.parse_options(args)
+        except ValueError as e:
             Timid.show_usage()
             sys.exit(64)
 
         for option, arg in options:
             match option:
-                case '-c' | '--compile':
+                case "compile":
                     Timid.COMPILE_ONLY = True
-                case '-d' | '--dev':
+                case "interpret":
+                    Timid.INTERPRET = True
+                case "memoize":
+                    Timid.INTERPRET = True # Only the interpreter memoizes
+                    try:
+                        Timid.MEMO_SIZE = int(arg) if arg != "" else Timid.DEFAULT_MEMO_SIZE
+                    except ValueError:
+                        Timid.show_usage()
+                        sys.exit(64)
+                    if Timid.MEMO_SIZE < 0:
+                        Timid.show_usage()
+                        sys.exit(64)
+                case "dev":
                     Timid.COMPILER_DEBUG = True
-                case '-h' | '--help':
+                case "help":
                     Timid.show_usage()
                     sys.exit(64)
-                case '-v' | '--version':
+                case "version":
                     Timid.show_version()
                     sys.exit(64)
+                case "watch":
+                    Timid.WATCH = True
+                case "server":
+                    Timid.SERVER = True
+                case "client":
+                    Timid.CLIENT = True
+                case "socket":
+                    Timid.SOCKET_PATH = arg
+                case "output-buffer":
+                    from Streams import parse_output_policy
+                    Timid.OUTPUT_BUFFER = parse_output_policy(arg)
+                    if Timid.OUTPUT_BUFFER == None:
+                        Timid.show_usage()
+                        sys.exit(64)
+                case "batch":
+                    Timid.INPUT_PATH = "-"
+                case "input":
+                    if not os.path.isfile(arg):
+                        sys.stderr.write(f"Could not find the input file {arg}\n")
+                        sys.exit(66)
+                    Timid.INPUT_PATH = arg
+                case "opt-report":
+                    Timid.OPT_REPORT = True
+                case "registers":
+                    Timid.REGISTERS = True
+                case "optimize":
+                    try:
+                        Timid.OPT_LEVEL = int(arg)
+                    except ValueError:
+                        Timid.show_usage()
+                        sys.exit(64)
+                    if not 0 <= Timid.OPT_LEVEL <= 2:
+                        Timid.show_usage()
+                        sys.exit(64)
+                case "max-errors":
+                    from Error import ErrorReporter
+                    try:
+                        ErrorReporter.MAX_ERRORS = int(arg)
+                    except ValueError:
+                        Timid.show_usage()
+                        sys.exit(64)
 
         return files
 
     @staticmethod
     def run_files(files : list[str]):
-        for file in files:
-            path = pathlib.Path(file)
-
+        for path in files:
             binary_path = Timid.compile_file(path)
 
-            if Timid.COMPILE_ONLY: continue
+            if Timid.COMPILE_ONLY or not binary_path: continue
 
-            # Run the binary
-            args = [".%sTimidRuntime" % '\\' if os.name == 'nt' else '/']
-            args.append(binary_path)
+            Timid.run_binary(binary_path)
+
+    @staticmethod
+    def run_binary(binary_path : str):
+        import subprocess
 
-            subprocess.run(args)
+        args = [".%sTimidRuntime" % ('\\' if os.name == 'nt' else '/')]
+        args.append(binary_path)
+        if Timid.OUTPUT_BUFFER != None:
+            args.append(f"--output-buffer={Timid.OUTPUT_BUFFER}")
+        if Timid.INPUT_PATH != None:
+            args.append(f"--input={Timid.INPUT_PATH}")
+
+        subprocess.run(args)
+
+    @staticmethod
+    def run_server():
+        import Server
+
+        Server.serve(Timid.SOCKET_PATH or Server.default_socket_path())
 
     @staticmethod
-    def read_file(path : pathlib.Path): # Get the source
-        if path.exists():
-            with path.open('r') as f:
+    def run_client(files : list[str]):
+        import Server
+
+        path = Timid.SOCKET_PATH or Server.default_socket_path()
+        try:
+            client = Server.CompileClient(path, Timid.OPT_LEVEL, Timid.REGISTERS)
+        except OSError:
+            sys.stderr.write(f"Could not connect to a compile server at {path} (start one with --server)\n")
+            sys.exit(69)
+
+        try:
+            for path in files:
+                status, response = client.compile_source(Timid.read_file(path), os.path.abspath(path))
+
+                if status != Server.RESPONSE_OK:
+                    sys.stderr.write(response.decode())
+                    continue
+
+                binary_path = Timid.binary_path(path)
+                with open(binary_path, "wb") as f:
+                    f.write(response)
+
+                if not Timid.COMPILE_ONLY:
+                    Timid.run_binary(binary_path)
+        finally:
+            client.close()
+
+    @staticmethod
+    def watch_files(files : list[str]):
+        import time
+        from Token import SymbolTable
+
+        mtimes : dict[str, int] = {} # Last seen modification time of every watched file
+        symbols = SymbolTable() # Shared by every compile, names that are already interned are not added again
+        compiled : dict[tuple[str, str], bytes] = {} # .timb contents by path and source, oldest use first
+
+        sys.stderr.write(f"Watching {len(files)} file(s), press Ctrl+C to stop\n")
+
+        try:
+            while True:
+                for path in files:
+                    try:
+                        mtime = os.stat(path).st_mtime_ns
+                    except OSError: # The file may be missing for a moment while an editor saves it
+                        continue
+
+                    if mtimes.get(path) == mtime: continue # Unchanged since the last iteration
+                    mtimes[path] = mtime
+
+                    Timid.watch_iteration(path, symbols, compiled)
+
+                time.sleep(Timid.WATCH_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+
+    @staticmethod
+    def watch_iteration(path : str, symbols : "SymbolTable", compiled : dict[tuple[str, str], bytes]):
+        import time
+        from Error import ErrorReporter
+
+        ErrorReporter.HAD_ERROR = False # Errors from a previous iteration should not leak into this one
+
+        start = time.perf_counter()
+        source = Timid.read_file(path)
+
+        if Timid.INTERPRET:
+            Timid.INTERPRETER = None # Every run starts from fresh globals
+            Timid.run(source, path, symbols)
+            ErrorReporter.HAD_ERROR = False
+            sys.stderr.write(f"[watch] {path}: interpreted in {(time.perf_counter() - start) * 1000:.1f} ms\n")
+            return
+
+        key = (os.path.abspath(path), source)
+        bytecode = compiled.pop(key, None)
+        if bytecode != None: # Saved without changes, or changed back to a version compiled before
+            binary_path = Timid.binary_path(path)
+            with open(binary_path, "wb") as f:
+                f.write(bytecode)
+            verb = "reused earlier code"
+        else:
+            binary_path = Timid.compile_file(path, source, symbols)
+            if binary_path:
+                with open(binary_path, "rb") as f:
+                    bytecode = f.read()
+            verb = "compiled"
+        if bytecode != None:
+            compiled[key] = bytecode # Moved to the back, it is the most recently used now
+            if len(compiled) > Timid.WATCH_CACHE_SIZE: del compiled[next(iter(compiled))]
+        ready = time.perf_counter()
+
+        if not binary_path:
+            sys.stderr.write(f"[watch] {path}: compile failed after {(ready - start) * 1000:.1f} ms\n")
+            return
+
+        if Timid.COMPILE_ONLY:
+            sys.stderr.write(f"[watch] {path}: {verb} in {(ready - start) * 1000:.1f} ms\n")
+            return
+
+        Timid.run_binary(binary_path)
+        finished = time.perf_counter()
+
+        sys.stderr.write(f"[watch] {path}: {verb} in {(ready - start) * 1000:.1f} ms, ran in {(finished - ready) * 1000:.1f} ms\n")
+
+    @staticmethod
+    def read_file(path : str): # Get the source
+        if os.path.exists(path):
+            with open(path, 'r') as f:
                 source = f.read()
         else:
+            from Error import ErrorReporter
             ErrorReporter.file_not_found(path)
             sys.exit(65)
         return source
 
     @staticmethod
-    def lex(path : pathlib.Path):
-        source = Timid.read_file(path)
+    def lex(path : str, source : str = None, symbols : "SymbolTable" = None): # Reads the file unless the source is given
+        from Lexer import Lexer
 
-        lexer = Lexer(source, path.absolute())
+        if source == None: source = Timid.read_file(path)
+
+        lexer = Lexer(source, os.path.abspath(path), symbols)
         tokens = lexer.lex()
 
-        return tokens
+        return tokens, lexer.symbols
 
     @staticmethod
-    def parse(tokens : list[Token]):
+    def parse(tokens : list["Token"]):
+        from Parser import Parser
+
         parser = Parser(tokens)
         statements = parser.parse()
 
         return statements
 
     @staticmethod
-    def compile_file(path : pathlib.Path):
-        tokens = Timid.lex(path)
+    def binary_path(path : str) -> str: # The .timb file is stored next to the .timid file
+        return os.path.splitext(os.path.abspath(path))[0] + ".timb"
+
+    @staticmethod
+    def compile_file(path : str, source : str = None, symbols : "SymbolTable" = None):
+        from Error import TooManyErrors
+
+        try:
+            return Timid.compile_source_file(path, source, symbols)
+        except TooManyErrors: # The summary has already been reported
+            return False
+
+    @staticmethod
+    def compile_source_file(path : str, source : str = None, symbols : "SymbolTable" = None):
+        from Compiler import Compiler
+        from Error import ErrorReporter
+
+        tokens, symbols = Timid.lex(path, source, symbols)
 
         if ErrorReporter.HAD_ERROR: return False
 
@@ -114,25 +382,44 @@ class Timid:
 
         if ErrorReporter.HAD_ERROR: return False
 
-        compiler = Compiler(statements, Timid.COMPILER_DEBUG)
+        compiler = Compiler(statements, symbols, Timid.COMPILER_DEBUG, Timid.OPT_LEVEL, Timid.REGISTERS)
 
-        # Get the output file name
-        binary_name = path.stem + ".timb"
-        binary_path = path.absolute().parent / binary_name
+        binary_path = Timid.binary_path(path)
 
         compiler.compile(binary_path)
 
-        ErrorReporter.HAD_ERROR = False # Reset flag
+        if Timid.OPT_REPORT and not ErrorReporter.HAD_ERROR:
+            print(f"Optimized {path} at -O{Timid.OPT_LEVEL}:")
+            for line in compiler.opt_report(): print(f"    {line}")
+
+        if ErrorReporter.HAD_ERROR: # Don't hand back a stale binary
+            ErrorReporter.HAD_ERROR = False
+            return False
 
         return binary_path
 
     @staticmethod
-    def run(source : str, path : str):
-        lexer = Lexer(source, path)
-        tokens = lexer.lex()
+    def run(source : str, path : str, symbols : "SymbolTable" = None):
+        from Error import ErrorReporter, TooManyErrors
+        from Interpreter import Interpreter
+        from Lexer import Lexer
+        from Parser import Parser
+
+        if Timid.INTERPRETER == None:
+            input_buffer = None
+            if Timid.INPUT_PATH != None:
+                from Streams import InputBuffer
+                input_buffer = InputBuffer(None if Timid.INPUT_PATH == "-" else open(Timid.INPUT_PATH))
+            Timid.INTERPRETER = Interpreter(Timid.COMPILER_DEBUG, Timid.MEMO_SIZE, Timid.OUTPUT_BUFFER, input_buffer)
 
-        parser = Parser(tokens)
-        statements = parser.parse()
+        try:
+            lexer = Lexer(source, path, symbols)
+            tokens = lexer.lex()
+
+            parser = Parser(tokens)
+            statements = parser.parse()
+        except TooManyErrors:
+            return
 
         if ErrorReporter.HAD_ERROR:
             return
@@ -151,6 +438,8 @@ class Timid:
 
     @staticmethod
     def run_repl():
+        from Error import ErrorReporter
+
         while True:
             ErrorReporter.HAD_ERROR = False
 
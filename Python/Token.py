@@ -27,13 +27,31 @@ class Position: # To help with error reporting
         return f"Position({self.index}, {self.line}, {self.column}, {self.source}, {self.fn})"
     def __str__(self): return f"({self.line + 1}, {self.column + 1})"
 
+### Symbols ###
+
+class SymbolTable: # One per compilation, gives every distinct identifier, keyword and string literal a small id
+    def __init__(self):
+        self.ids : dict[str, int] = {}
+        self.names : list[str] = [] # Canonical text of every symbol, all tokens with the same text share it
+
+    def intern(self, text : str) -> int:
+        symbol = self.ids.get(text)
+        if symbol == None:
+            symbol = len(self.names)
+            self.ids[text] = symbol
+            self.names.append(text)
+        return symbol
+
+    def __len__(self): return len(self.names)
+
 ### Token ###
 
 class Token:
-    def __init__(self, type : int, lexeme : str, value : object, pos_start : Position, pos_end : Position = None):
+    def __init__(self, type : int, lexeme : str, value : object, pos_start : Position, pos_end : Position = None, symbol : int = -1):
         self.type : int = type
         self.lexeme : str = lexeme
         self.value : object = value
+        self.symbol : int = symbol # Id in the lexer's SymbolTable, -1 for tokens that aren't interned
         self.pos_start : Position = pos_start.copy()
         if pos_end == None:
             self.pos_end = self.pos_start.copy()
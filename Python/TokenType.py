@@ -62,6 +62,7 @@ T_RSQR = iota()
 T_AT = iota()
 T_QMARK = iota()
 T_DOT = iota()
+T_DOT_DOT = iota() # ..
 T_COMMA = iota()
 T_COLON = iota()
 T_SEMIC = iota()
@@ -4,6 +4,8 @@ from Nodes import *
 import Runtime
 from Token import Position
 
+FRAME_POOL = 8 # Call frames made up front for each arity
+
 class Object:
     def __init__(self, pos_start : Position, pos_end : Position):
         self.pos_start = pos_start
@@ -85,13 +87,77 @@ class TimidAnon(TimidCallable):
     def __init__(self, declaration : LambdaExpr, closure):
         self.declaration = declaration
         self.closure = closure
+        self.memo : dict[tuple, object] = {} # Results by argument and captured values, oldest use first
 
     def call(self, interpreter, args: list[object]):
-        environment = Runtime.Environment(self.closure)
-
-        environment.define(self.declaration.identifier.lexeme, args[0])
-
-        return interpreter.evaluate(self.declaration.body, environment)
+        if interpreter.memo_size > 0 and self.declaration.pure:
+            return self.call_memoized(interpreter, args)
+
+        interpreter.impure_calls += 1 # Nothing calling this can be cached
+        return self.evaluate(interpreter, args)
+
+    def call_memoized(self, interpreter, args : list[object]):
+        caller = interpreter.memo_caller
+        if len(self.declaration.captures) > 0 and (caller == None or caller.declaration != self.declaration or caller.closure != self.closure):
+            interpreter.impure_calls += 1 # What this captured isn't part of the caller's key, unless the caller is itself
+
+        key = self.memo_key(args)
+        if key == None: return self.evaluate(interpreter, args)
+
+        if key in self.memo:
+            interpreter.memo_hits += 1
+            result = self.memo.pop(key) # Moved to the back, it is the most recently used now
+            self.memo[key] = result
+            return result
+
+        interpreter.memo_misses += 1
+        impure_calls = interpreter.impure_calls
+        interpreter.memo_caller = self
+        try:
+            result = self.evaluate(interpreter, args)
+        finally:
+            interpreter.memo_caller = caller
+
+        if interpreter.impure_calls == impure_calls: # Only kept if nothing impure was called on the way
+            self.memo[key] = result
+            if len(self.memo) > interpreter.memo_size:
+                del self.memo[next(iter(self.memo))]
+        return result
+
+    def memo_key(self, args : list[object]) -> tuple | None: # None if the key can't be hashed, or a captured name is undefined
+        key = [(type(arg), arg) for arg in args] # Typed, so 1, 1.0 and tru don't share results
+        for name in self.declaration.captures:
+            hops = self.closure.resolve(name)
+            if hops < 0: return None
+            value = self.closure.ancestor(hops).values[name]
+            key.append((type(value), value))
+
+        key = tuple(key)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def evaluate(self, interpreter, args : list[object]):
+        if self.declaration.makes_lambdas: # They could keep the frame, so it can't be reused
+            environment = Runtime.Environment(self.closure)
+            environment.values[self.declaration.identifier.lexeme] = args[0]
+            return interpreter.evaluate(self.declaration.body, environment)
+
+        frames = interpreter.frames.get(len(args))
+        if frames == None:
+            frames = interpreter.frames[len(args)] = [Runtime.Environment() for _ in range(FRAME_POOL)]
+
+        environment = frames.pop() if len(frames) > 0 else Runtime.Environment() # Recursive calls can use up the pool
+        environment.enclosing = self.closure
+        environment.values[self.declaration.identifier.lexeme] = args[0] # Not define, parameters only shadow names inside the body
+        try:
+            return interpreter.evaluate(self.declaration.body, environment)
+        finally:
+            environment.values.clear()
+            environment.enclosing = None
+            frames.append(environment)
 
     @property
     def arity(self):
@@ -106,6 +172,7 @@ class TimidAnon(TimidCallable):
 
 class Clock(TimidCallable):
     def call(self, interpreter, args : list[object]):
+        interpreter.impure_calls += 1
         return time.time()
 
     @property
@@ -0,0 +1,61 @@
+# Times tight interpreter loops that break and continue
+# Usage: python Tools/BenchControlFlow.py [baseline Python directory] [runs]
+# A baseline is another checkout's Python directory, e.g. from git archive <rev> Python | tar -x -C /tmp/baseline
+# Every engine runs in its own process, the best time of all the runs is reported
+
+import os, subprocess, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROGRAMS = { # The baseline only noticed a break or continue at the top of the next iteration, so its output can differ
+    "break": "$i = 0\n$n = 0\nwhile n < 2000 {\n  n = n + 1\n  i = 0\n  forever {\n    i = i + 1\n    if i == 20 break\n  }\n}\nprint n\n",
+    "continue": "$i = 0\n$s = 0\nwhile i < 40000 {\n  i = i + 1\n  if i % 2 == 0 continue\n  s = s + i\n}\nprint s\n",
+    "for continue": "$s = 0\nfor $i = 0, i < 40000, i = i + 1 {\n  if i % 3 == 0 { continue }\n  s = s + 1\n}\nprint s\n",
+    "nested break": "$i = 0\n$s = 0\nwhile i < 200 {\n  i = i + 1\n  $j = 0\n  while j < 200 {\n    j = j + 1\n    if j > i break\n    s = s + 1\n  }\n}\nprint s\n",
+}
+
+WORKER = """
+import io, sys, time
+sys.path.insert(0, sys.argv[1])
+sys.setrecursionlimit(10000)
+from Interpreter import Interpreter
+from Lexer import Lexer
+from Parser import Parser
+
+statements = Parser(Lexer(sys.stdin.read(), "bench").lex()).parse()
+stdout = sys.stdout
+sys.stdout = io.StringIO()
+start = time.process_time()
+Interpreter().interpret(statements)
+elapsed = time.process_time() - start
+output = sys.stdout.getvalue().split()
+sys.stdout = stdout
+print(elapsed, output[-1] if len(output) > 0 else "")
+"""
+
+def measure(engine : str, source : str, runs : int) -> tuple[float, str]:
+    best = float("inf")
+    output = ""
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", WORKER, engine], input=source, capture_output=True, text=True)
+        fields = result.stdout.split()
+        if len(fields) == 0:
+            return float("nan"), result.stderr.strip().splitlines()[-1]
+        best = min(best, float(fields[0]))
+        output = fields[1] if len(fields) > 1 else ""
+    return best, output
+
+def main():
+    engines = [("current", os.path.join(ROOT, "Python"))]
+    if len(sys.argv) > 1:
+        engines.append(("baseline", os.path.abspath(sys.argv[1])))
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    print(f"{'program':<16}{'engine':<10}{'time (ms)':>12}{'output':>12}")
+    for name, source in PROGRAMS.items():
+        for engine_name, engine in engines:
+            elapsed, output = measure(engine, source, runs)
+            print(f"{name:<16}{engine_name:<10}{elapsed * 1000:>12.1f}{output:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Compiles a generated program full of dead code at every -O level and compares the results
+# Usage: python Tools/BenchDeadCode.py [iterations] [sections]
+# Reports the size of the code, how many instructions the runtime dispatched (from a T_STACK_DBG build) and the best wall time of three runs
+# Needs gcc to build the runtimes, without it only the sizes are reported
+
+import os, re, shutil, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY = os.path.join(ROOT, "Python", "Timid.py")
+SOURCES = os.path.join(ROOT, "C")
+LEVELS = (0, 1, 2)
+DISPATCH = re.compile(rb"^\d{4,} OP_", re.MULTILINE) # A disassembled instruction, printed before it runs
+
+SECTION = """  if fls {{
+    print "debugging {0}"
+  }}
+  trace{0} = i * {0}
+  forever {{
+    s = s + {0}
+    break
+    print "unreachable {0}"
+  }}
+"""
+
+def program(iterations : int, sections : int) -> str:
+    lines = [f"$trace{k} = 0\n" for k in range(sections)]
+    lines.append("$s = 0\n")
+    lines.append(f"for i in 0..{iterations} {{\n")
+    lines.extend(SECTION.format(k) for k in range(sections))
+    lines.append("}\nprint s\n")
+    return "".join(lines)
+
+def build(directory : str, name : str, *flags : str) -> str | None:
+    compiler = shutil.which("gcc")
+    if compiler == None: return None
+    binary = os.path.join(directory, name)
+    sources = [os.path.join(SOURCES, file) for file in os.listdir(SOURCES) if file.endswith(".c")]
+    subprocess.run([compiler, *flags, *sources, "-o", binary, "-lm"], check=True, capture_output=True)
+    return binary
+
+def code_size(report : str) -> str: # From the first line of --opt-report, '<before> -> <after> bytes of code'
+    match = re.search(r"-> (\d+) bytes of code", report)
+    return match.group(1) if match != None else "?"
+
+def best_time(args : list[str], runs : int = 3) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    sections = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    with tempfile.TemporaryDirectory() as directory:
+        runtime = build(directory, "TimidRuntime", "-O2")
+        tracer = build(directory, "TimidTracer", "-DT_STACK_DBG")
+
+        source = os.path.join(directory, "dead.timid")
+        with open(source, "w") as file:
+            file.write(program(iterations, sections))
+        binary = source.replace(".timid", ".timb")
+
+        traced = os.path.join(directory, "traced.timid") # Few iterations, every dispatch prints a line
+        with open(traced, "w") as file:
+            file.write(program(100, sections))
+        traced_binary = traced.replace(".timid", ".timb")
+
+        print(f"{'level':<8}{'code bytes':>12}{'dispatches/100':>16}{'time (ms)':>12}")
+        for level in LEVELS:
+            result = subprocess.run([sys.executable, ENTRY, "-c", f"-O{level}", "--opt-report", source], cwd=directory, capture_output=True, text=True, check=True)
+            size = code_size(result.stdout) if level > 0 else "-"
+
+            dispatches = "-"
+            if tracer != None:
+                subprocess.run([sys.executable, ENTRY, "-c", f"-O{level}", traced], cwd=directory, capture_output=True, check=True)
+                trace = subprocess.run([tracer, traced_binary], capture_output=True).stdout
+                dispatches = str(len(DISPATCH.findall(trace)))
+
+            elapsed = best_time([runtime, binary]) * 1000 if runtime != None else float("nan")
+            print(f"-O{level:<6}{size:>12}{dispatches:>16}{elapsed:>12.1f}")
+
+if __name__ == "__main__":
+    main()
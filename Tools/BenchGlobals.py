@@ -0,0 +1,105 @@
+# Measures global slots: a top level loop over globals, against the same code reading and writing its globals by name
+# Usage: python Tools/BenchGlobals.py [iterations]
+# Reports how many global accesses ran (from a T_STACK_DBG build, on a tenth of the iterations scaled up) and the best wall time of three runs
+# Needs gcc to build the runtimes
+
+import os, re, shutil, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PYTHON = os.path.join(ROOT, "Python")
+SOURCES = os.path.join(ROOT, "C")
+DISPATCH = re.compile(rb"^\d{4,} (OP_\w+)", re.MULTILINE) # A disassembled instruction, printed before it runs
+
+sys.path.insert(0, PYTHON)
+from Compiler import CODE_START, Compiler
+from Flow import decode, encode
+from Lexer import Lexer
+from Opcodes import *
+from Parser import Parser
+
+BY_NAME = {OP_DEFINE_GLOBAL_SLOT: OP_DEFINE_GLOBAL, OP_GET_GLOBAL_SLOT: OP_GET_GLOBAL, OP_SET_GLOBAL_SLOT: OP_SET_GLOBAL}
+
+def program(iterations : int) -> str:
+    return f"""$total = 0
+$odd = 0
+$last = 0
+$limit = {iterations}
+$i = 0
+while i < limit {{
+  total = total + i
+  if i % 2 == 1 {{
+    odd = odd + 1
+  }}
+  last = i
+  i = i + 1
+}}
+print total
+print odd
+print last
+"""
+
+def build(directory : str, name : str, *flags : str) -> str:
+    binary = os.path.join(directory, name)
+    sources = [os.path.join(SOURCES, file) for file in os.listdir(SOURCES) if file.endswith(".c")]
+    subprocess.run(["gcc", *flags, *sources, "-o", binary, "-lm"], check=True, capture_output=True)
+    return binary
+
+def compile_both(directory : str, name : str, iterations : int) -> tuple[str, str]: # The .timb using slots, and one using names
+    lexer = Lexer(program(iterations), name)
+    compiler = Compiler(Parser(lexer.lex()).parse(), lexer.symbols)
+    slots = os.path.join(directory, name + ".timb")
+    with open(slots, "wb") as file:
+        file.write(compiler.assemble())
+
+    chunk = compiler.chunk
+    instructions = decode(chunk.code, CODE_START)
+    for instruction in instructions:
+        if instruction.op not in BY_NAME: continue
+        index = chunk.globals[instruction.index] # The name's constant
+        instruction.op = BY_NAME[instruction.op]
+        instruction.operands = [OP_CONSTANT, index] if index < 256 else [OP_CONSTANT_LONG, index & 0xff, (index >> 8) & 0xff, (index >> 16) & 0xff]
+    chunk.code = encode(chunk.code, CODE_START, instructions)
+
+    names = os.path.join(directory, name + "_names.timb")
+    with open(names, "wb") as file:
+        file.write(bytes(chunk.as_bytes))
+    return slots, names
+
+def best_time(args : list[str], runs : int = 3) -> tuple[float, bytes]:
+    best = float("inf")
+    output = b""
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(args, capture_output=True).stdout
+        best = min(best, time.perf_counter() - start)
+    return best, output
+
+def global_accesses(tracer : str, binary : str) -> int:
+    trace = subprocess.run([tracer, binary], capture_output=True).stdout
+    return sum(1 for op in DISPATCH.findall(trace) if b"GLOBAL" in op)
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    if shutil.which("gcc") == None:
+        print("gcc is needed to build the runtimes")
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        runtime = build(directory, "TimidRuntime", "-O2")
+        tracer = build(directory, "TimidTracer", "-DT_STACK_DBG")
+
+        slots, names = compile_both(directory, "bench", iterations)
+        traced_slots, traced_names = compile_both(directory, "traced", max(iterations // 10, 1))
+
+        print(f"{'globals':<10}{'accesses':>14}{'time (ms)':>12}")
+        outputs = []
+        for label, binary, traced in (("by name", names, traced_names), ("by slot", slots, traced_slots)):
+            accesses = global_accesses(tracer, traced)
+            elapsed, output = best_time([runtime, binary])
+            outputs.append(output)
+            print(f"{label:<10}{accesses * 10:>14,}{elapsed * 1000:>12.1f}")
+
+        if outputs[0] != outputs[1]: print("The outputs differ")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Measures reading lines with in, one prompt at a time against batch input
+# Usage: python Tools/BenchInput.py [TimidRuntime path] [lines]
+# The interpreter reads a tenth of the lines, a runtime given here reads all of them (1 million by default)
+# The best wall time of three runs is reported
+
+import os, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY = os.path.join(ROOT, "Python", "Timid.py")
+PROGRAM = '$n = 0\n$line = in "line? "\nwhile line != "" {\n  n = n + 1\n  line = in "line? "\n}\nprint n\n'
+
+def measure(args : list[str], input_path : str, cwd : str, runs : int = 3) -> tuple[float, str]:
+    best = float("inf")
+    output = ""
+    for _ in range(runs):
+        with open(input_path, "rb") as stdin:
+            start = time.perf_counter()
+            result = subprocess.run(args, cwd=cwd, stdin=stdin, capture_output=True, text=True)
+            best = min(best, time.perf_counter() - start)
+        fields = result.stdout.split()
+        output = fields[-1] if len(fields) > 0 else ""
+    return best, output
+
+def report(engine : str, mode : str, elapsed : float, output : str):
+    print(f"{engine:<14}{mode:<14}{output:>12}{elapsed * 1000:>12.1f}")
+
+def main():
+    runtime = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else None
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "bench.timid")
+        with open(source, "w") as file:
+            file.write(PROGRAM)
+
+        print(f"{'engine':<14}{'mode':<14}{'lines':>12}{'time (ms)':>12}")
+        for engine, count in (("interpreter", lines // 10), ("vm", lines)):
+            if engine == "vm" and runtime == None: break
+
+            input_path = os.path.join(directory, f"{engine}.txt")
+            with open(input_path, "w") as file:
+                file.writelines(f"line {i}\n" for i in range(count))
+
+            if engine == "interpreter":
+                modes = (("interactive", [sys.executable, ENTRY, "-i", source]), ("batch", [sys.executable, ENTRY, "-i", "--batch", source]))
+            else:
+                subprocess.run([sys.executable, ENTRY, "-c", source], cwd=directory, check=True)
+                binary = source.replace(".timid", ".timb")
+                modes = (("interactive", [runtime, binary]), ("batch", [runtime, binary, "--input=-"]))
+
+            for mode, args in modes:
+                elapsed, output = measure(args, input_path, directory)
+                report(engine, mode, elapsed, output)
+
+if __name__ == "__main__":
+    main()
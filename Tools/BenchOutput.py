@@ -0,0 +1,67 @@
+# Measures printing throughput into a pipe under every --output-buffer policy
+# Usage: python Tools/BenchOutput.py [TimidRuntime path] [lines]
+# The interpreter prints a tenth of the lines, a runtime given here prints all of them (5 million by default)
+# Lines are counted on the reading end, the best wall time of three runs is reported
+
+import os, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY = os.path.join(ROOT, "Python", "Timid.py")
+POLICIES = [None, "none", "line", "65536"]
+CHUNK = 1 << 16
+
+def program(lines : int) -> str:
+    return f"for i in 0..{lines} {{\n  print i\n}}\n"
+
+def drain(args : list[str], cwd : str) -> tuple[float, int]: # Wall time until the pipe closes, and how many lines came through it
+    start = time.perf_counter()
+    process = subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    count = 0
+    while True:
+        chunk = process.stdout.read1(CHUNK)
+        if len(chunk) == 0: break
+        count += chunk.count(b"\n")
+    process.wait()
+    return time.perf_counter() - start, count
+
+def measure(args : list[str], cwd : str, runs : int = 3) -> tuple[float, int]:
+    best = float("inf")
+    count = 0
+    for _ in range(runs):
+        elapsed, count = drain(args, cwd)
+        best = min(best, elapsed)
+    return best, count
+
+def report(engine : str, policy : str | None, elapsed : float, count : int):
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    print(f"{engine:<14}{policy or 'default':<10}{count:>12}{elapsed * 1000:>12.1f}{rate:>16,.0f}")
+
+def main():
+    runtime = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else None
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000_000
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'engine':<14}{'policy':<10}{'lines':>12}{'time (ms)':>12}{'lines/s':>16}")
+
+        source = os.path.join(directory, "interpreted.timid")
+        with open(source, "w") as file:
+            file.write(program(lines // 10))
+        for policy in POLICIES:
+            options = [] if policy == None else [f"--output-buffer={policy}"]
+            elapsed, count = measure([sys.executable, ENTRY, "-i", *options, source], directory)
+            report("interpreter", policy, elapsed, count)
+
+        if runtime == None: return
+
+        source = os.path.join(directory, "compiled.timid")
+        with open(source, "w") as file:
+            file.write(program(lines))
+        subprocess.run([sys.executable, ENTRY, "-c", source], cwd=directory, check=True)
+        binary = source.replace(".timid", ".timb")
+        for policy in POLICIES:
+            options = [] if policy == None else [f"--output-buffer={policy}"]
+            elapsed, count = measure([runtime, binary, *options], directory)
+            report("vm", policy, elapsed, count)
+
+if __name__ == "__main__":
+    main()
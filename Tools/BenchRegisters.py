@@ -0,0 +1,115 @@
+# Compares the stack VM with the register VM, side by side on the same programs
+# Usage: python Tools/BenchRegisters.py [iterations] [.timid files]
+# Every program in Tests/ (or the files given) is compiled both ways, plus a generated loop over locals that runs long enough to time.
+# Reports how many instructions each dispatched (from a T_STACK_DBG build) and the best wall time of three runs.
+# Programs that ask for input get one line, programs that are still running after a few seconds are left out. Needs gcc to build the runtimes
+
+import glob, os, re, shutil, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY = os.path.join(ROOT, "Python", "Timid.py")
+SOURCES = os.path.join(ROOT, "C")
+DISPATCH = re.compile(rb"^\d{4,} (?:OP|R)_", re.MULTILINE) # A disassembled instruction, printed before it runs
+TIMEOUT = 5 # Seconds
+
+def program(iterations : int) -> str:
+    return f"""{{
+  $total = 0
+  $odd = 0
+  $i = 0
+  while i < {iterations} {{
+    $square = i * i
+    total = total + square % 7
+    if i % 2 == 1 {{
+      odd = odd + 1
+    }}
+    i = i + 1
+  }}
+  print total
+  print odd
+}}
+"""
+
+def build(directory : str, name : str, *flags : str) -> str:
+    binary = os.path.join(directory, name)
+    sources = [os.path.join(SOURCES, file) for file in os.listdir(SOURCES) if file.endswith(".c")]
+    subprocess.run(["gcc", *flags, *sources, "-o", binary, "-lm"], check=True, capture_output=True)
+    return binary
+
+def compile_both(directory : str, source : str) -> tuple[str, str] | None: # The stack and the register .timb, None if it does not compile
+    binaries = []
+    for backend in ("stack", "registers"):
+        copy = os.path.join(directory, f"{os.path.splitext(os.path.basename(source))[0]}_{backend}.timid")
+        shutil.copyfile(source, copy)
+        options = ["--registers"] if backend == "registers" else []
+        subprocess.run([sys.executable, ENTRY, "-c", *options, copy], cwd=directory, capture_output=True)
+        binary = copy.replace(".timid", ".timb")
+        if not os.path.exists(binary): return None
+        binaries.append(binary)
+    return binaries[0], binaries[1]
+
+def run(args : list[str]) -> bytes | None: # None if it did not finish in time
+    try:
+        return subprocess.run(args, capture_output=True, timeout=TIMEOUT).stdout
+    except subprocess.TimeoutExpired:
+        return None
+
+def best_time(args : list[str], runs : int = 3) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, stdout=subprocess.DEVNULL, timeout=TIMEOUT)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    sources = sys.argv[2:] if len(sys.argv) > 2 else sorted(glob.glob(os.path.join(ROOT, "Tests", "*.timid")))
+    if shutil.which("gcc") == None:
+        print("gcc is needed to build the runtimes")
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        runtime = build(directory, "TimidRuntime", "-O2")
+        tracer = build(directory, "TimidTracer", "-DT_STACK_DBG")
+        input_path = os.path.join(directory, "input.txt")
+        with open(input_path, "w") as file:
+            file.write("1234\n")
+
+        generated = os.path.join(directory, "locals.timid")
+        with open(generated, "w") as file:
+            file.write(program(iterations))
+        traced = os.path.join(directory, "locals_traced.timid") # The same loop, short enough to trace
+        with open(traced, "w") as file:
+            file.write(program(iterations // 100))
+
+        print(f"{'program':<18}{'stack instructions':>20}{'register':>12}{'fewer':>8}{'stack (ms)':>12}{'register (ms)':>15}")
+        totals = [0, 0]
+        for source in sources:
+            counts = compare(runtime, tracer, input_path, source, compile_both(directory, source))
+            totals = [total + count for total, count in zip(totals, counts)]
+        if totals[0] > 0: print(f"{'in total':<18}{totals[0]:>20,}{totals[1]:>12,}{1 - totals[1] / totals[0]:>8.0%}")
+
+        compare(runtime, tracer, input_path, generated, compile_both(directory, generated), compile_both(directory, traced), 100)
+
+def compare(runtime : str, tracer : str, input_path : str, source : str, binaries, counted = None, scale : int = 1) -> list[int]: # Prints a row, returns the instruction counts
+    name = os.path.splitext(os.path.basename(source))[0]
+    if binaries == None:
+        print(f"{name:<18}does not compile")
+        return [0, 0]
+
+    outputs = [run([runtime, binary, f"--input={input_path}"]) for binary in binaries]
+    traces = [run([tracer, binary, f"--input={input_path}"]) for binary in counted or binaries]
+    if None in outputs or None in traces:
+        print(f"{name:<18}still running after {TIMEOUT} s")
+        return [0, 0]
+    if outputs[0] != outputs[1]: print(f"{name:<18}the outputs differ")
+
+    counts = [len(DISPATCH.findall(trace)) * scale for trace in traces]
+    times = [best_time([runtime, binary, f"--input={input_path}"]) * 1000 for binary in binaries]
+    fewer = 1 - counts[1] / counts[0] if counts[0] > 0 else 0
+    print(f"{name:<18}{counts[0]:>20,}{counts[1]:>12,}{fewer:>8.0%}{times[0]:>12.1f}{times[1]:>15.1f}")
+    return counts
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Measures how many scopes the interpreter allocates per loop iteration
+# Usage: python Tools/BenchScopes.py [iterations] [.timid files]
+# Without files it runs a few loops whose bodies declare nothing, the files are run once each as they are
+
+import io, os, sys, time, tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Python"))
+
+import Runtime
+from Interpreter import Interpreter
+from Lexer import Lexer
+from Parser import Parser
+
+LOOPS = { # Name and source, {n} is the iteration count
+    "while": "$i = 0\n$s = 0\nwhile i < {n} {{\n  s = s + i\n  i = i + 1\n}}\nprint s\n",
+    "nested blocks": "$i = 0\nwhile i < {n} {{\n  {{\n    {{ i = i + 1 }}\n  }}\n}}\nprint i\n",
+    "for": "$s = 0\nfor $i = 0, i < {n}, i = i + 1 {{\n  if i % 2 == 0 {{ s = s + i }}\n}}\nprint s\n",
+    "declares": "$i = 0\nwhile i < {n} {{\n  $t = i * 2\n  i = i + 1\n}}\nprint i\n",
+}
+
+class Counter:
+    environments = 0
+
+def count_environments(): # Counts every Environment made from here on
+    init = Runtime.Environment.__init__
+    def counted(self, enclosing = None):
+        Counter.environments += 1
+        init(self, enclosing)
+    Runtime.Environment.__init__ = counted
+
+def run(statements : list, traced : bool) -> float:
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    if traced: tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        Interpreter().interpret(statements)
+        return time.perf_counter() - start
+    finally:
+        sys.stdout = stdout
+
+def measure(source : str, name : str) -> tuple[int, float, int]: # Environments made, seconds taken and peak traced bytes
+    statements = Parser(Lexer(source, name).lex()).parse()
+
+    elapsed = min(run(statements, False) for _ in range(3)) # Timed on its own, tracing slows every allocation down
+
+    Counter.environments = 0
+    run(statements, True)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return Counter.environments, elapsed, peak
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    files = sys.argv[2:]
+
+    count_environments()
+
+    programs = [(name, source.format(n = iterations), iterations) for name, source in LOOPS.items()]
+    for path in files:
+        with open(path) as f:
+            programs.append((os.path.basename(path), f.read(), 1))
+
+    print(f"{'program':<16}{'environments':>14}{'per iteration':>15}{'us/iteration':>14}{'peak (KiB)':>12}")
+    for name, source, count in programs:
+        environments, elapsed, peak = measure(source, name)
+        print(f"{name:<16}{environments:>14}{environments / count:>15.2f}{elapsed * 1e6 / count:>14.2f}{peak / 1024:>12.1f}")
+
+if __name__ == "__main__":
+    main()
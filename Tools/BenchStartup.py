@@ -0,0 +1,60 @@
+# Measures how long the CLI takes to get going
+# Usage: python Tools/BenchStartup.py [runs]
+# Reports the best wall time of every mode and the total import time python -X importtime saw
+
+import os, subprocess, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY = os.path.join(ROOT, "Python", "Timid.py")
+ZIPAPP = os.path.join(ROOT, "timid.pyz")
+PROGRAM = os.path.join(ROOT, "Examples", "hw.timid")
+
+def import_total(stderr : str) -> int: # Microseconds spent importing top level modules
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"): continue
+        fields = line.split("|")
+        if fields[2].startswith("   "): continue # Nested import, already counted by its parent
+        try:
+            total += int(fields[1])
+        except ValueError:
+            pass # The header line
+    return total
+
+def measure(args : list[str], runs : int) -> tuple[float, int]:
+    best_wall = float("inf")
+    best_imports = 0
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT, capture_output=True, text=True)
+        wall = time.perf_counter() - start
+
+        if wall < best_wall:
+            best_wall = wall
+            best_imports = import_total(result.stderr)
+
+    return best_wall, best_imports
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    modes = [("version", ["-v"]), ("compile", ["-c", PROGRAM])]
+    if os.path.exists(os.path.join(ROOT, "TimidRuntime")):
+        modes.append(("run", [PROGRAM]))
+
+    entries = [("Timid.py", ENTRY)]
+    if os.path.exists(ZIPAPP):
+        entries.append(("timid.pyz", ZIPAPP))
+
+    print(f"{'entry':<12}{'mode':<10}{'wall (ms)':>12}{'imports (ms)':>14}")
+    for entry_name, entry in entries:
+        for mode, args in modes:
+            wall, imports = measure([entry, *args], runs)
+            print(f"{entry_name:<12}{mode:<10}{wall * 1000:>12.1f}{imports / 1000:>14.1f}")
+
+    binary = os.path.splitext(PROGRAM)[0] + ".timb"
+    if os.path.exists(binary): os.remove(binary)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Measures OP_SWITCH: a loop that runs a ten arm else if chain on strings and an eight arm one on ints, compiled at -O1,
+# against the same program compiled with every chain left as comparisons and conditional jumps
+# Usage: python Tools/BenchSwitch.py [iterations]
+# Reports how many instructions ran (from a T_STACK_DBG build, on a tenth of the iterations scaled up) and the best wall time of three runs.
+# Needs gcc to build the runtimes
+
+import os, re, shutil, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PYTHON = os.path.join(ROOT, "Python")
+SOURCES = os.path.join(ROOT, "C")
+DISPATCH = re.compile(rb"^\d{4,} OP_", re.MULTILINE) # A disassembled instruction, printed before it runs
+
+sys.path.insert(0, PYTHON)
+from Compiler import Compiler
+from Lexer import Lexer
+from Parser import Parser
+
+class ChainCompiler(Compiler): # Compiles every else if chain as written
+    def switch_chain(self, stmt): return None
+
+def program(iterations : int) -> str:
+    digits = "\n  ".join(f"{'' if digit == 0 else 'else '}if c == '{digit}' total = total + {digit}" for digit in range(10))
+    days = "\n  ".join(f"{'' if day == 0 else 'else '}if d == {day} week = week + {day * 3}" for day in range(8))
+    return f"""$number = "8302749165"
+$total = 0
+$week = 0
+for i in 0..{iterations} {{
+  $c = number[i % 10]
+  {digits}
+  else print "not a digit"
+  $d = i % 9
+  {days}
+  else week = week - 1
+}}
+print total
+print week
+"""
+
+def build(directory : str, name : str, *flags : str) -> str:
+    binary = os.path.join(directory, name)
+    sources = [os.path.join(SOURCES, file) for file in os.listdir(SOURCES) if file.endswith(".c")]
+    subprocess.run(["gcc", *flags, *sources, "-o", binary, "-lm"], check=True, capture_output=True)
+    return binary
+
+def compile_both(directory : str, name : str, iterations : int) -> tuple[str, str]: # The .timb with switches, and one with the chains
+    binaries = []
+    for compiler_type, suffix in ((Compiler, ""), (ChainCompiler, "_chains")):
+        lexer = Lexer(program(iterations), name)
+        compiler = compiler_type(Parser(lexer.lex()).parse(), lexer.symbols)
+        binary = os.path.join(directory, name + suffix + ".timb")
+        with open(binary, "wb") as file:
+            file.write(compiler.assemble())
+        binaries.append(binary)
+    return binaries[0], binaries[1]
+
+def best_time(args : list[str], runs : int = 3) -> tuple[float, bytes]:
+    best = float("inf")
+    output = b""
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(args, capture_output=True).stdout
+        best = min(best, time.perf_counter() - start)
+    return best, output
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    if shutil.which("gcc") == None:
+        print("gcc is needed to build the runtimes")
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        runtime = build(directory, "TimidRuntime", "-O2")
+        tracer = build(directory, "TimidTracer", "-DT_STACK_DBG")
+
+        switches, chains = compile_both(directory, "bench", iterations)
+        traced_switches, traced_chains = compile_both(directory, "traced", max(iterations // 10, 1))
+
+        print(f"{'chains':<10}{'instructions':>16}{'time (ms)':>12}")
+        outputs = []
+        for label, binary, traced in (("compared", chains, traced_chains), ("switched", switches, traced_switches)):
+            instructions = len(DISPATCH.findall(subprocess.run([tracer, traced], capture_output=True).stdout))
+            elapsed, output = best_time([runtime, binary])
+            outputs.append(output)
+            print(f"{label:<10}{instructions * 10:>16,}{elapsed * 1000:>12.1f}")
+
+        if outputs[0] != outputs[1]: print("The outputs differ")
+
+if __name__ == "__main__":
+    main()
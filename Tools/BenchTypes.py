@@ -0,0 +1,102 @@
+# Measures typed arithmetic: a numeric loop compiled at -O1, against the same code with every typed instruction put back to its generic form
+# Usage: python Tools/BenchTypes.py [iterations]
+# Reports how many typed instructions ran (from a T_STACK_DBG build, on a tenth of the iterations scaled up), each skipping the type checks
+# of both operands, and the best wall time of three runs. Needs gcc to build the runtimes
+
+import os, re, shutil, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PYTHON = os.path.join(ROOT, "Python")
+ENTRY = os.path.join(PYTHON, "Timid.py")
+SOURCES = os.path.join(ROOT, "C")
+DISPATCH = re.compile(rb"^\d{4,} (OP_\w+)", re.MULTILINE) # A disassembled instruction, printed before it runs
+
+sys.path.insert(0, PYTHON)
+from Compiler import CODE_START, HEADER0, HEADER1, TYPED_OPS
+from Flow import decode
+
+GENERIC = {typed: op for (op, _), typed in TYPED_OPS.items()}
+
+def program(iterations : int) -> str:
+    return f"""$total = 0
+$odd = 0
+$x = 0.5
+$y = 1.5
+for i in 0..{iterations} {{
+  total = total + i * 3 % 7
+  if i % 2 == 1 {{
+    odd = odd + 1
+  }}
+  x = x * 0.5 + y
+  if x > y {{
+    y = y - 0.25
+  }}
+}}
+print total
+print odd
+print x
+"""
+
+def build(directory : str, name : str, *flags : str) -> str:
+    binary = os.path.join(directory, name)
+    sources = [os.path.join(SOURCES, file) for file in os.listdir(SOURCES) if file.endswith(".c")]
+    subprocess.run(["gcc", *flags, *sources, "-o", binary, "-lm"], check=True, capture_output=True)
+    return binary
+
+def compile_typed(directory : str, name : str, iterations : int) -> tuple[str, str]: # The typed .timb and a generic copy of it
+    source = os.path.join(directory, name + ".timid")
+    with open(source, "w") as file:
+        file.write(program(iterations))
+    subprocess.run([sys.executable, ENTRY, "-c", "-O1", source], cwd=directory, check=True, capture_output=True)
+    typed = source.replace(".timid", ".timb")
+
+    with open(typed, "rb") as file:
+        code = list(file.read())
+    start = next(i for i in range(len(code) - 1) if code[i] == HEADER0 and code[i + 1] == HEADER1) + CODE_START # Constants come first
+    for instruction in decode(code, start): # Typed instructions are one byte like the generic ones, nothing moves
+        if instruction.op in GENERIC: code[instruction.offset] = GENERIC[instruction.op]
+
+    generic = typed.replace(".timb", "_generic.timb")
+    with open(generic, "wb") as file:
+        file.write(bytes(code))
+    return typed, generic
+
+def best_time(args : list[str], runs : int = 3) -> tuple[float, bytes]:
+    best = float("inf")
+    output = b""
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(args, capture_output=True).stdout
+        best = min(best, time.perf_counter() - start)
+    return best, output
+
+def dispatches(tracer : str, binary : str) -> tuple[int, int]: # Instructions that ran, and how many of them were typed
+    trace = subprocess.run([tracer, binary], capture_output=True).stdout
+    ops = DISPATCH.findall(trace)
+    return len(ops), sum(1 for op in ops if op.endswith((b"_II", b"_FF")))
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    if shutil.which("gcc") == None:
+        print("gcc is needed to build the runtimes")
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        runtime = build(directory, "TimidRuntime", "-O2")
+        tracer = build(directory, "TimidTracer", "-DT_STACK_DBG")
+
+        typed, generic = compile_typed(directory, "bench", iterations)
+        traced_typed, traced_generic = compile_typed(directory, "traced", max(iterations // 10, 1))
+
+        print(f"{'code':<10}{'instructions':>16}{'typed':>14}{'time (ms)':>12}")
+        outputs = []
+        for label, binary, traced in (("generic", generic, traced_generic), ("typed", typed, traced_typed)):
+            total, typed_count = dispatches(tracer, traced)
+            elapsed, output = best_time([runtime, binary])
+            outputs.append(output)
+            print(f"{label:<10}{total * 10:>16,}{typed_count * 10:>14,}{elapsed * 1000:>12.1f}")
+
+        if outputs[0] != outputs[1]: print("The outputs differ")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Checks that every optimization level prints the same thing as -O0
+# Usage: python Tools/CheckLevels.py [.timid files]
+# Every program in Tests/ (or the files given) is compiled at each level and run, and its output and errors are compared with -O0.
+# Programs that ask for input get one line, programs that are still running after a few seconds are left out. Needs gcc to build the runtime
+
+import glob, os, shutil, subprocess, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY = os.path.join(ROOT, "Python", "Timid.py")
+SOURCES = os.path.join(ROOT, "C")
+LEVELS = (["-O0"], ["-O1"], ["-O2"], ["-O2", "--registers"]) # The first one is what the others are compared with
+TIMEOUT = 5 # Seconds
+
+def build(directory : str) -> str:
+    binary = os.path.join(directory, "TimidRuntime")
+    sources = [os.path.join(SOURCES, file) for file in os.listdir(SOURCES) if file.endswith(".c")]
+    subprocess.run(["gcc", *sources, "-o", binary, "-lm"], check=True, capture_output=True)
+    return binary
+
+def output(runtime : str, directory : str, input_path : str, source : str, options : list[str]) -> bytes | None: # None if it did not finish in time
+    copy = os.path.join(directory, os.path.basename(source))
+    shutil.copyfile(source, copy)
+    compiled = subprocess.run([sys.executable, ENTRY, "-c", *options, copy], cwd=directory, capture_output=True)
+    binary = copy.replace(".timid", ".timb")
+    if not os.path.exists(binary): return compiled.stdout + compiled.stderr # Compile errors have to match too
+
+    try:
+        result = subprocess.run([runtime, binary, f"--input={input_path}"], capture_output=True, timeout=TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return None
+    finally:
+        os.remove(binary)
+    return result.stdout + result.stderr
+
+def main():
+    sources = sys.argv[1:] or sorted(glob.glob(os.path.join(ROOT, "Tests", "*.timid")))
+    if shutil.which("gcc") == None:
+        print("gcc is needed to build the runtime")
+        return
+
+    failed = []
+    with tempfile.TemporaryDirectory() as directory:
+        runtime = build(directory)
+        input_path = os.path.join(directory, "input.txt")
+        with open(input_path, "w") as file:
+            file.write("1\n")
+
+        for source in sources:
+            name = os.path.splitext(os.path.basename(source))[0]
+            outputs = [output(runtime, directory, input_path, source, options) for options in LEVELS]
+            if None in outputs:
+                print(f"{name:<18}still running after {TIMEOUT} s")
+                continue
+            differ = [" ".join(options) for options, result in zip(LEVELS[1:], outputs[1:]) if result != outputs[0]]
+            print(f"{name:<18}{'differs at ' + ', '.join(differ) if len(differ) > 0 else 'same at every level'}")
+            if len(differ) > 0: failed.append(name)
+    sys.exit(1 if len(failed) > 0 else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Checks that the runtime's verifier turns away broken .timb files instead of running them
+# Usage: python Tools/FuzzVerifier.py [.timid files]
+# A loop whose backward jump is pushed before the start of the code has to print "Invalid bytecode". Then every byte of the code of each
+# program (Tests/rangeLoop.timid and Tests/loopExit.timid by default), compiled to stack and to register code, is overwritten with a few
+# values in turn. The runtime may reject the file, run it or run out of time, but it must never crash. Needs gcc to build the runtime
+
+import os, shutil, subprocess, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Python"))
+
+from Flow import decode
+from Opcodes import OP_LOOP
+
+ENTRY = os.path.join(ROOT, "Python", "Timid.py")
+SOURCES = os.path.join(ROOT, "C")
+HEADERS = (b"\xfa\xcc", b"\xfa\xcd") # Stack code, register code
+CODE_START = 4 # After the header and the two bytes of stack size
+VALUES = (0x00, 0x40, 0xff) # Written over each byte
+TIMEOUT = 2 # Seconds
+
+LOOP = """$i = 0
+while i < 3 { i = i + 1; print i }
+"""
+
+def build(directory : str) -> str:
+    binary = os.path.join(directory, "TimidRuntime")
+    sources = [os.path.join(SOURCES, file) for file in os.listdir(SOURCES) if file.endswith(".c")]
+    subprocess.run(["gcc", *sources, "-o", binary, "-lm"], check=True, capture_output=True)
+    return binary
+
+def compile_program(directory : str, program : str, *options : str) -> bytes | None: # The .timb contents, None if it does not compile
+    source = os.path.join(directory, "program.timid")
+    with open(source, "w") as file: file.write(program)
+    subprocess.run([sys.executable, ENTRY, "-c", *options, source], cwd=directory, capture_output=True)
+    binary = source.replace(".timid", ".timb")
+    if not os.path.exists(binary): return None
+    with open(binary, "rb") as file: contents = file.read()
+    os.remove(binary)
+    return contents
+
+def code_start(contents : bytes) -> int: # Where the header is, the constants and global names come before it
+    return max(contents.rfind(header) for header in HEADERS)
+
+def run(runtime : str, path : str, contents : bytes) -> subprocess.CompletedProcess | None: # None if it did not finish in time
+    with open(path, "wb") as file: file.write(contents)
+    try:
+        return subprocess.run([runtime, path], capture_output=True, timeout=TIMEOUT, stdin=subprocess.DEVNULL)
+    except subprocess.TimeoutExpired:
+        return None
+
+def check_backward_loop(runtime : str, directory : str) -> bool:
+    contents = compile_program(directory, LOOP, "-O0")
+    start = code_start(contents)
+    code = list(contents[start:])
+    loop = next(instruction for instruction in decode(code, CODE_START) if instruction.op == OP_LOOP)
+
+    broken = bytearray(contents)
+    broken[start + loop.offset + 2] = 0x40 # The high byte of the distance, the jump now lands before the code
+    result = run(runtime, os.path.join(directory, "mutant.timb"), bytes(broken))
+    if result == None or b"Invalid bytecode" not in result.stderr:
+        print("a loop that jumps before the start of the code was not rejected")
+        return False
+    print("a loop that jumps before the start of the code is rejected")
+    return True
+
+def fuzz(runtime : str, directory : str, source : str, *options : str) -> bool:
+    name = f"{os.path.splitext(os.path.basename(source))[0]} {' '.join(options) or 'stack'}"
+    with open(source) as file: contents = compile_program(directory, file.read(), *options)
+    if contents == None:
+        print(f"{name:<24}does not compile")
+        return False
+
+    path = os.path.join(directory, "mutant.timb")
+    crashes, rejected, mutants = [], 0, 0
+    for offset in range(code_start(contents) + CODE_START, len(contents)):
+        for value in VALUES:
+            if contents[offset] == value: continue
+            mutant = bytearray(contents)
+            mutant[offset] = value
+            mutants += 1
+            result = run(runtime, path, bytes(mutant))
+            if result == None: continue
+            if result.returncode < 0: crashes.append(f"{offset}={value:#04x}") # Killed by a signal
+            if b"Invalid bytecode" in result.stderr: rejected += 1
+
+    print(f"{name:<24}{mutants:>6} mutants, {rejected:>6} rejected, {len(crashes):>3} crashed {' '.join(crashes)}")
+    return len(crashes) == 0
+
+def main():
+    sources = sys.argv[1:] or [os.path.join(ROOT, "Tests", "rangeLoop.timid"), os.path.join(ROOT, "Tests", "loopExit.timid")]
+    if shutil.which("gcc") == None:
+        print("gcc is needed to build the runtime")
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        runtime = build(directory)
+        passed = check_backward_loop(runtime, directory)
+        for source in sources:
+            for options in ((), ("--registers",)):
+                passed = fuzz(runtime, directory, source, *options) and passed
+    sys.exit(0 if passed else 1)
+
+if __name__ == "__main__":
+    main()
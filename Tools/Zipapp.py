@@ -0,0 +1,37 @@
+# Packs the Python front end into a single timid.pyz
+# Every module is shipped precompiled with unchecked hash based .pycs, so startup never
+# compiles or stats sources, even where __pycache__ can't be written
+
+import os, sys, py_compile, tempfile, zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIR = os.path.join(ROOT, "Python")
+
+MAIN = """import Timid
+Timid.Timid.init()
+"""
+
+def build(output : str):
+    modules = sorted(name for name in os.listdir(SOURCE_DIR) if name.endswith(".py"))
+
+    with tempfile.TemporaryDirectory() as temp, zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("__main__.py", MAIN)
+
+        for name in modules:
+            source = os.path.join(SOURCE_DIR, name)
+            compiled = os.path.join(temp, name + "c")
+            py_compile.compile(source, cfile=compiled, dfile=name, doraise=True, invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+
+            archive.write(source, name) # Kept for tracebacks
+            archive.write(compiled, name + "c") # zipimport prefers this one
+
+    with open(output, "rb") as f: # Prepend the shebang so the archive runs directly
+        data = f.read()
+    with open(output, "wb") as f:
+        f.write(b"#!/usr/bin/env python3\n" + data)
+    os.chmod(output, 0o755)
+
+    sys.stdout.write(f"Wrote {output} ({len(modules)} modules)\n")
+
+if __name__ == "__main__":
+    build(sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, "timid.pyz"))